@@ -1,5 +1,7 @@
 # config.py
 import os
+import json
+import socket
 from pathlib import Path # 引入pathlib库
 from dotenv import load_dotenv
 
@@ -14,9 +16,17 @@ load_dotenv()
 ROOT_DIR = str(Path(__file__).parent)
 # [修改] 创建并使用audio子目录
 AUDIO_DIR = os.path.join(ROOT_DIR, "audio")
+STATIC_IMAGES_DIR = os.path.join(ROOT_DIR, "static", "images")
+STATIC_BUILD_DIR = os.path.join(ROOT_DIR, "static", "build")   # 构建出的带哈希名的图片变体
 if not os.path.exists(AUDIO_DIR):
     os.makedirs(AUDIO_DIR)
 
+# --- 对话历史配置 ---
+CONVERSATION_DIR = os.getenv('CONVERSATION_DIR', os.path.join(ROOT_DIR, "data", "conversations"))
+CONVERSATION_WINDOW_MESSAGES = 20           # 内存中保留、并随请求发给LLM的最近消息条数
+CONVERSATION_SEGMENT_BYTES = 1024 * 1024    # 对话日志单个分段的大小上限，超过后压缩
+CONVERSATION_ARCHIVE_SEGMENTS = 5           # 保留的归档分段数量
+
 # --- 核心配置 ---
 WAKE_WORD = os.getenv('WAKE_WORD', "你好")
 MUSIC_STOP_WORDS = ["停止播放", "不想听了", "关掉音乐", "暂停"] 
@@ -24,48 +34,285 @@ MUSIC_STOP_WORDS = ["停止播放", "不想听了", "关掉音乐", "暂停"]
 # 使用os.path.join来构建一个跨平台兼容的绝对路径
 VOSK_MODEL_PATH = os.path.join(ROOT_DIR, "libs", "vosk-model-small-cn-0.22")
 
-# --- [新增] TTS调试配置 ---
+# --- 音频飞行记录仪 (麦克风/TTS音频和轮次标记写入固定大小的环形文件) ---
+# 麦克风轨道会持续录下房间里的声音，必须显式设置 FLIGHT_RECORDER_ENABLED 才会录制；
+# 旧的 SAVE_TTS_AUDIO 开关只启用TTS轨道（和标记），不会录制麦克风
+FLIGHT_RECORDER_ENABLED = os.getenv('FLIGHT_RECORDER_ENABLED', 'false').lower() == 'true'
 SAVE_TTS_AUDIO = os.getenv('SAVE_TTS_AUDIO', 'false').lower() == 'true'
+FLIGHT_RECORDER_TRACKS = ("mic", "tts") if FLIGHT_RECORDER_ENABLED else ("tts",) if SAVE_TTS_AUDIO else ()
+FLIGHT_RECORDER_MINUTES = 5         # 保留最近多少分钟的音频（每条轨道约 1.9MB/分钟）
+FLIGHT_RECORDER_DIR = os.getenv('FLIGHT_RECORDER_DIR', AUDIO_DIR)   # 可以指向tmpfs以进一步减少SD卡写入
+
+# --- 日志配置 (日志先进入内存队列，由后台线程写出，不阻塞采集和推理线程) ---
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# 分模块日志级别，如 "smart_speaker.audio_handler=WARNING,smart_speaker.services.llm_gateway=DEBUG"
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+LOG_RATE_LIMIT_BURST = 5            # 同一行日志在一个窗口内最多输出的条数，多余的被合并计数
+LOG_RATE_LIMIT_WINDOW_S = 10.0
+LOG_RECENT_CAPACITY = 500           # 面板 /logs 接口可查询的最近日志条数
+
+# --- 现场剖析接口配置 (/debug/* 以及 /flight 等暴露录音和转写内容的接口，未设置令牌时接口关闭) ---
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+PROFILE_SAMPLE_INTERVAL_S = 0.01    # 采样剖析的采样间隔
+PROFILE_MAX_SECONDS = 60            # 单次采样剖析的最长时长
+PROFILE_TRACEMALLOC_FRAMES = 10     # 内存分配跟踪保留的调用栈深度
+
+# --- 面板静态图片配置 (需要可选依赖Pillow才会生成缩放和WebP版本) ---
+ASSET_IMAGE_WIDTHS = [480, 960, 1440, 1920]   # 生成的WebP变体宽度（不超过原图宽度）
+ASSET_WEBP_QUALITY = 80
+ASSET_CACHE_MAX_AGE_S = 365 * 24 * 3600      # 带哈希名的图片的缓存时长
 
 # --- UI提示语模板 ---
 PROMPT_SLEEPING = f"人家在打盹哦，叫“{WAKE_WORD}”就能叫醒我啦~"
 PROMPT_AWAKENED = "终于等到你了啦，我们聊聊天吧！"
 PROMPT_AWAKE_IDLE = "想聊点什么呀？"
 PROMPT_GO_TO_SLEEP = f"好的啦，那我先去休息哦。需要我的时候，再叫“{WAKE_WORD}”哦！"
+# 启动时在后台预先合成并缓存的固定提示语，播放时无需再等待云端合成
+TTS_PREWARM_PROMPTS = [PROMPT_AWAKENED, PROMPT_GO_TO_SLEEP]
 
 # --- VAD & 录音配置 ---
 VAD_THRESHOLD = 500             # VAD能量阈值，需要根据麦克风和环境微调
 PRE_BUFFER_DURATION_S = 1.0       # 预录制时长（秒），即保留说话前多久的音频
 SILENCE_DURATION_S = 2.0        # 检测到超过2秒的静音则认为说话结束
 MAX_RECORDING_S = 15            # 安全措施：一次录音最长不超过15秒
+TRIM_SILENCE_ENABLED = True     # 上传前裁掉录音首尾的静音
+TRIM_GUARD_S = 0.3              # 裁剪后在语音两侧保留的保护带时长（秒）
+# 上传给云端ASR的录音格式: wav(不压缩) / ogg(Opus) / mp3，压缩需要ffmpeg支持对应编码器
+ASR_UPLOAD_FORMAT = os.getenv('ASR_UPLOAD_FORMAT', 'wav').lower()
+
+# --- 本地技能配置 (时间/日期/音量/当前歌曲等问题在本地回答，不调用LLM) ---
+SKILLS_ENABLED = True
+MIXER_CONTROL = os.getenv('MIXER_CONTROL', 'Master')    # amixer 调节音量使用的控件名
+VOLUME_STEP = 10                    # "大声一点"/"小声一点"每次调整的百分比
+
+# --- 投机式LLM生成配置 (录音期间本地流式识别，部分转写稳定后提前请求LLM；仅进程内VAD模式) ---
+SPECULATION_ENABLED = os.getenv('SPECULATION_ENABLED', 'false').lower() == 'true'
+SPECULATION_TTS = os.getenv('SPECULATION_TTS', 'false').lower() == 'true'   # 同时提前合成回复的第一句
+SPECULATION_STABLE_MS = int(os.getenv('SPECULATION_STABLE_MS', 400))        # 部分转写保持不变多久（音频时长）后发起投机
+SPECULATION_MIN_CHARS = 4               # 部分转写至少这么多字才投机
+SPECULATION_MAX_EXTENSION_CHARS = 2     # 最终转写只多/少这么多个语气词时仍采用投机结果
+SPECULATION_MAX_LAUNCHES = 2            # 每段录音最多发起的投机次数（部分转写变化后可重新投机）
+
+# --- 本地快速意图识别配置 ---
+LOCAL_INTENT_ENABLED = True         # 是否在上传云端前先用本地Vosk语法识别元指令
+LOCAL_INTENT_MIN_CONFIDENCE = 0.85  # 本地识别结果的最低平均置信度，低于该值则交给云端
+LOCAL_INTENT_MAX_S = float(os.getenv('LOCAL_INTENT_MAX_S', 3.0))  # 去掉静音后超过该时长的录音不做本地识别（元指令都很短，长句直接上云，不为它串行解码一遍）
+
+# --- 对冲式ASR配置 (本地Vosk与云端并行识别短录音) ---
+HEDGED_ASR_ENABLED = True           # 是否对短录音同时启动本地转写和云端识别
+HEDGED_ASR_MAX_UTTERANCE_S = 4.0    # 超过该时长的录音只走云端
+HEDGED_ASR_DEADLINE_S = 1.2         # 本地结果满足阈值后，只有按历史延迟预计云端能在该时间点（从开始识别算起）前返回时才等待云端
+HEDGED_ASR_CLOUD_EWMA_ALPHA = 0.3   # 云端识别延迟EWMA的平滑系数
+HEDGED_ASR_MIN_CONFIDENCE = 0.8     # 结果被采用所需的最低置信度
+ASR_CLOUD_CONFIDENCE = 0.95         # 云端接口不返回置信度，使用该固定值参与比较
+
+# --- 音频前端进程配置 ---
+# 设为true时，唤醒词/停止词检测和VAD在独立的工作进程中运行，音频通过共享内存环形缓冲区传递
+AUDIO_FRONTEND_PROCESS = os.getenv('AUDIO_FRONTEND_PROCESS', 'false').lower() == 'true'
+AUDIO_RING_SECONDS = 40         # 共享内存环形缓冲区时长，必须大于最长录音时长加预录制时长
 
 # --- 音频管道配置 ---
 ARECORD_DEVICE = "plughw:1,0"   # 通过 `arecord -l` 确认
 TARGET_RATE = 16000             # Vosk 和其他服务需要的目标采样率
 CHUNK_SIZE = 3200               # 16kHz, 16bit, 100ms * 2 bytes = 3200
 
+# --- 音频采集源配置 ---
+# arecord: arecord|ffmpeg 子进程管道; pyaudio: PyAudio回调采集(无子进程);
+# wav: 回放WAV文件; tcp/udp: 接收远程麦克风发送的原始PCM (s16le 单声道)
+CAPTURE_SOURCE = os.getenv('CAPTURE_SOURCE', 'arecord').lower()
+CAPTURE_BUFFER_S = 2.0                  # pyaudio/tcp/udp 采集缓冲区的上限，写满时丢弃最旧的音频
+CAPTURE_ARECORD_BUFFER_S = 0.1          # arecord 的ALSA缓冲时长
+CAPTURE_WAV_PATH = os.getenv('CAPTURE_WAV_PATH', '')
+CAPTURE_WAV_SPEED = float(os.getenv('CAPTURE_WAV_SPEED', '1.0'))   # 1.0为实时速度，<=0为不限速
+CAPTURE_WAV_LOOP = os.getenv('CAPTURE_WAV_LOOP', 'false').lower() == 'true'
+CAPTURE_NET_HOST = os.getenv('CAPTURE_NET_HOST', '0.0.0.0')
+CAPTURE_NET_PORT = int(os.getenv('CAPTURE_NET_PORT', '5005'))
+CAPTURE_NET_RATE = int(os.getenv('CAPTURE_NET_RATE', '16000'))    # 远程麦克风发送的采样率
+CAPTURE_STATS_INTERVAL_S = 5.0          # 采集延迟和CPU占用率的上报间隔
+# 采集监管：超过 CAPTURE_STALL_MS 没有数据即视为卡顿，按指数退避重启（从几十毫秒开始）
+CAPTURE_STALL_MS = 500
+CAPTURE_BACKOFF_MIN_S = 0.02
+CAPTURE_BACKOFF_MAX_S = 2.0
+CAPTURE_BACKOFF_RESET_S = 10.0          # 采集源稳定工作这么久之后才把退避时间恢复到最小值
+CAPTURE_REPROBE_AFTER_FAILURES = 3      # 沿用缓存的设备连续失败这么多次后重新探测设备
+# 热备：同时打开第二个采集源，故障时直接切换（仅 arecord）。
+# hw/plughw 设备不能被打开两次，热备必须使用单独的 CAPTURE_STANDBY_DEVICE：可共享的dsnoop设备或第二个麦克风；
+# 没有配置热备设备时即使打开开关也不启用热备
+CAPTURE_WARM_STANDBY = os.getenv('CAPTURE_WARM_STANDBY', 'false').lower() == 'true'
+CAPTURE_STANDBY_DEVICE = os.getenv('CAPTURE_STANDBY_DEVICE', '')
+
 # --- 全局音频配置 ---
 INPUT_DEVICE_KEYWORDS = ["USB", "Audio", "Mic"] 
 # [修改] 将录音文件路径指向audio目录
 RECORD_FILENAME = os.path.join(AUDIO_DIR, "user_audio_16k.wav")
 
+# --- 多房间配置 (一个进程服务多个采集设备，共享模型和连接池) ---
+# ROOMS 为JSON数组，每个房间一个会话，例如：
+# [{"id": "living", "arecord_device": "plughw:1,0", "input_device_keywords": ["USB"], "playback_device": "plughw:1,0"},
+#  {"id": "bedroom", "arecord_device": "plughw:2,0", "input_device_keywords": ["Mic"], "playback_device": "plughw:2,0"}]
+# capture_source / capture_port 可选，覆盖该房间的采集源类型和远程麦克风监听端口；standby_device 可选，该房间的热备采集设备
+# playback_device 可选，指定该房间TTS和音乐的ALSA输出设备；未配置 ROOMS 时只有一个使用上面设备的默认会话
+def _load_rooms():
+    raw = os.getenv('ROOMS')
+    if not raw:
+        return [{"id": "default", "arecord_device": ARECORD_DEVICE, "input_device_keywords": INPUT_DEVICE_KEYWORDS,
+                 "standby_device": CAPTURE_STANDBY_DEVICE}]
+    rooms = json.loads(raw)
+    for room in rooms:
+        room.setdefault("arecord_device", ARECORD_DEVICE)
+        room.setdefault("input_device_keywords", INPUT_DEVICE_KEYWORDS)
+    return rooms
+
+ROOMS = _load_rooms()
+
+# --- Web服务配置 ---
+# werkzeug: 开发服务器（每个WebSocket客户端一个线程）；async: 基于asyncio的服务（客户端为协程，gzip压缩，连接上限，心跳）
+WEB_SERVER = os.getenv('WEB_SERVER', 'werkzeug').lower()
+WEB_HOST = os.getenv('WEB_HOST', '0.0.0.0')
+WEB_PORT = int(os.getenv('WEB_PORT', 5000))
+WEB_MAX_CONNECTIONS = int(os.getenv('WEB_MAX_CONNECTIONS', 64))   # 面板WebSocket连接上限，超出时返回503
+WEB_PING_INTERVAL_S = 20            # WebSocket心跳间隔，对方在超时时间内没有响应即断开
+WEB_PING_TIMEOUT_S = 20
+WEB_HTTP_WORKERS = 4                # 执行Flask请求和连接回调的线程数
+WEB_SEND_QUEUE_SIZE = 256           # 每个客户端积压的待发送消息上限，超过即断开该客户端
+WEB_MAX_MESSAGE_BYTES = 64 * 1024   # 客户端消息大小上限
+WEB_GZIP_MIN_BYTES = 1024           # 小于此大小的响应不压缩
+WEB_GZIP_LEVEL = 5
+
+# --- 面板文字对话配置 (通过WebSocket直接发送文字，跳过ASR) ---
+TEXT_TURN_WORKERS = 4               # 执行文字轮次的线程数，与房间的语音轮次互不排队
+TEXT_TURN_RATE_PER_MIN = 10         # 每个客户端每分钟允许的文字轮次数（令牌桶补充速度）
+TEXT_TURN_BURST = 3                 # 每个客户端允许的突发轮次数（令牌桶容量）
+TEXT_TURN_MAX_CHARS = 500           # 单条文字消息的最大长度
+TEXT_TURN_HISTORY_MESSAGES = 20     # 每个客户端保留的最近对话消息数
+
+# --- 共享HTTP客户端配置 (ASR、音乐搜索、播放地址解析共用) ---
+HTTP_POOL_HOSTS = 8             # 缓存连接池的主机数
+HTTP_POOL_MAXSIZE = 4           # 每个主机保持的最大长连接数
+HTTP_MAX_RETRIES = 2            # 幂等请求的最大重试次数
+HTTP_RETRY_BACKOFF_S = 0.2      # 重试退避基数（秒），每次翻倍并加入随机抖动
+HTTP_DNS_CACHE_TTL_S = 300      # 进程内DNS缓存时长（秒），设为0关闭
+# 各类端点的 (连接超时, 读取超时)，单位秒
+HTTP_TIMEOUTS = {
+    "default": (3.05, 10),
+    "asr_submit": (3.05, 10),
+    "asr_poll": (3.05, 5),
+    "music": (3.05, 8),
+    "resolve": (3.05, 10),
+}
+
+# --- 车队网关 (可选，多台音箱共享云端连接池和缓存，见 gateway.py) ---
+# 设置后LLM、ASR、TTS和音乐接口的默认地址都指向网关；也可以用下面各自的环境变量单独覆盖
+FLEET_GATEWAY_URL = os.getenv('FLEET_GATEWAY_URL', '').rstrip('/')
+DEVICE_ID = os.getenv('DEVICE_ID', socket.gethostname())
+# 车队共享令牌：设备请求LLM时不带自己的密钥，只有带上该令牌，网关才会代为使用它自己的 ARK_API_KEY；
+# 网关未配置令牌时只转发设备自己的凭据
+GATEWAY_TOKEN = os.getenv('GATEWAY_TOKEN', '')
+# 只有走网关时才附带设备标识（用于网关日志）和共享令牌
+DEVICE_HEADERS = {"X-Device-Id": DEVICE_ID, **({"X-Gateway-Token": GATEWAY_TOKEN} if GATEWAY_TOKEN else {})} if FLEET_GATEWAY_URL else {}
+
+def _gateway_url(path, default, ws=False):
+    if not FLEET_GATEWAY_URL: return default
+    base = FLEET_GATEWAY_URL.replace("http", "ws", 1) if ws else FLEET_GATEWAY_URL
+    return base + path
+
 # --- LLM 服务配置 (OpenAI SDK 兼容模式) ---
 ARK_API_KEY = os.getenv('ARK_API_KEY')
 LLM_MODEL_ID = "doubao-pro-32k-241215"
-LLM_BASE_URL = "https://ark.cn-beijing.volces.com/api/v3"
+LLM_BASE_URL = os.getenv('LLM_BASE_URL', _gateway_url("/llm/v1", "https://ark.cn-beijing.volces.com/api/v3"))
+
+# --- LLM 网关配置 (多端点对冲与故障切换) ---
+# LLM_ENDPOINTS 为JSON数组，按优先级排列，例如：
+# [{"name": "ark", "base_url": "...", "model": "...", "api_key_env": "ARK_API_KEY"},
+#  {"name": "backup", "base_url": "...", "model": "...", "api_key_env": "BACKUP_LLM_API_KEY"}]
+# 未配置时只使用上面的火山方舟端点
+# 配置有误时打印错误并退回默认端点：导入config失败会让唤醒词等所有功能一起停掉
+def _load_llm_endpoints():
+    default = [{"name": "ark", "base_url": LLM_BASE_URL, "model": LLM_MODEL_ID, "api_key": ARK_API_KEY}]
+    raw = os.getenv('LLM_ENDPOINTS')
+    if not raw:
+        return default
+    try:
+        endpoints = json.loads(raw)
+    except ValueError as e:
+        print(f"❌ LLM_ENDPOINTS 不是合法的JSON ({e})，改用默认的火山方舟端点。")
+        return default
+    if not isinstance(endpoints, list) or not endpoints:
+        print("❌ LLM_ENDPOINTS 必须是非空的JSON数组，改用默认的火山方舟端点。")
+        return default
+    for index, endpoint in enumerate(endpoints):
+        if not isinstance(endpoint, dict) or not endpoint.get('base_url') or not endpoint.get('model'):
+            print(f"❌ LLM_ENDPOINTS 第{index + 1}项缺少 base_url 或 model，改用默认的火山方舟端点。")
+            return default
+        endpoint.setdefault('name', f"endpoint{index + 1}")
+        if 'api_key_env' in endpoint:
+            endpoint['api_key'] = os.getenv(str(endpoint['api_key_env']))
+    return endpoints
+
+LLM_ENDPOINTS = _load_llm_endpoints()
+LLM_FIRST_TOKEN_DEADLINE_S = 2.5    # 首字截止时间，超过后对冲请求下一个端点
+LLM_TOTAL_TIMEOUT_S = 60            # 从发起请求到出现首字的总超时（首字之后不再限制总时长，回复边播边读可能远超该时间）
+LLM_CHUNK_TIMEOUT_S = 20            # 首字之后两个片段之间的最长等待，也是底层连接的读取超时
+LLM_CONNECT_TIMEOUT_S = 3.05        # 建立连接的超时
+LLM_EWMA_ALPHA = 0.3                # 端点首字延迟EWMA的平滑系数
+LLM_ERROR_PENALTY_S = 10.0          # 端点报错时计入EWMA的惩罚延迟
+# LLM流式客户端: sdk(openai SDK) / lite(标准库实现的极简SSE客户端，导入快、每个token的CPU开销低)
+# 也可以在 LLM_ENDPOINTS 的单个端点中用 "client" 字段覆盖
+LLM_CLIENT = os.getenv('LLM_CLIENT', 'sdk').lower()
 
 # --- ASR 服务配置 (录音文件极速版) ---
 ASR_APPID = os.getenv('ASR_APPID')
 ASR_TOKEN = os.getenv('ASR_TOKEN')
 ASR_CLUSTER = os.getenv('ASR_CLUSTER')
-ASR_SERVICE_URL = 'https://openspeech.bytedance.com/api/v1/auc'
+ASR_FIRST_POLL_S = 0.3              # 提交任务后第一次查询结果的等待时间（极速版短录音通常很快完成）
+ASR_POLL_INTERVAL_S = 1.5           # 之后的查询间隔
+ASR_SERVICE_URL = os.getenv('ASR_SERVICE_URL', _gateway_url("/asr", 'https://openspeech.bytedance.com/api/v1/auc'))
 
 # --- TTS 服务配置 (大模型WebSocket) ---
 TTS_APPID = os.getenv('TTS_APPID')
 TTS_TOKEN = os.getenv('TTS_TOKEN')
 TTS_CLUSTER = os.getenv('TTS_CLUSTER', 'volcano_tts')
 TTS_VOICE_TYPE = "zh_female_wanwanxiaohe_moon_bigtts"
-TTS_WS_URL = "wss://openspeech.bytedance.com/api/v1/tts/ws_binary"
+TTS_WS_URL = os.getenv('TTS_WS_URL', _gateway_url("/tts/ws_binary", "wss://openspeech.bytedance.com/api/v1/tts/ws_binary", ws=True))
+TTS_SAMPLE_RATE = 16000
+# 云端TTS的输出编码: auto / pcm / ogg_opus / mp3。auto 时按本机测量的解码开销和可用带宽协商，
+# PCM不经解码直接由aplay写入声卡；测量数据由 test/bench_tts_encoding.py --save 生成
+TTS_ENCODING = os.getenv('TTS_ENCODING', 'auto').lower()
+TTS_BANDWIDTH_KBPS = float(os.getenv('TTS_BANDWIDTH_KBPS', '0'))    # 可用带宽上限，0表示不限制
+TTS_ENCODING_BENCH_FILE = os.path.join(ROOT_DIR, "data", "tts_encoding_bench.json")
+
+# --- 本地TTS后端与路由配置 (需要安装 espeak-ng) ---
+LOCAL_TTS_ENABLED = os.getenv('LOCAL_TTS_ENABLED', 'true').lower() == 'true'
+LOCAL_TTS_COMMAND = os.getenv('LOCAL_TTS_COMMAND', 'espeak-ng')
+LOCAL_TTS_VOICE = os.getenv('LOCAL_TTS_VOICE', 'cmn')   # espeak-ng 的普通话语音
+LOCAL_TTS_SPEED = 170                   # 语速（每分钟词数）
+TTS_LOCAL_MAX_CHARS = 12                # 不超过这个字数的句子直接用本地引擎合成
+TTS_CLOUD_FIRST_BYTE_DEADLINE_S = 1.2   # 云端在此时间内没有返回音频时改用本地引擎
+
+# --- 音乐服务配置 (网易云音乐) ---
+MUSIC_SEARCH_URL = os.getenv('MUSIC_SEARCH_URL', _gateway_url("/music/search", "https://music.163.com/api/search/get/web"))
+MUSIC_SONG_URL_TEMPLATE = os.getenv('MUSIC_SONG_URL_TEMPLATE', _gateway_url("/music/song/{}.mp3", "https://music.163.com/song/media/outer/url?id={}.mp3"))
+
+# --- 车队网关服务端配置 (运行 gateway.py 的那台机器使用) ---
+GATEWAY_HOST = os.getenv('GATEWAY_HOST', '0.0.0.0')
+GATEWAY_PORT = int(os.getenv('GATEWAY_PORT', 8600))
+# 上游地址，默认即各云端服务；测试时可指向本地替身 (test/fleet_standin_upstream.py)
+GATEWAY_LLM_UPSTREAM = os.getenv('GATEWAY_LLM_UPSTREAM', "https://ark.cn-beijing.volces.com/api/v3")
+GATEWAY_ASR_UPSTREAM = os.getenv('GATEWAY_ASR_UPSTREAM', 'https://openspeech.bytedance.com/api/v1/auc')
+GATEWAY_TTS_UPSTREAM = os.getenv('GATEWAY_TTS_UPSTREAM', "wss://openspeech.bytedance.com/api/v1/tts/ws_binary")
+GATEWAY_MUSIC_SEARCH_UPSTREAM = os.getenv('GATEWAY_MUSIC_SEARCH_UPSTREAM', "https://music.163.com/api/search/get/web")
+GATEWAY_MUSIC_SONG_UPSTREAM = os.getenv('GATEWAY_MUSIC_SONG_UPSTREAM', "https://music.163.com/song/media/outer/url?id={}.mp3")
+GATEWAY_POOL_MAXSIZE = int(os.getenv('GATEWAY_POOL_MAXSIZE', 32))   # 每个上游主机保持的最大长连接数
+GATEWAY_WARM_CONNECTIONS = 4        # 启动时为每个上游主机预先建立的连接数
+GATEWAY_TIMEOUT = (3.05, 60)        # 上游请求的 (连接超时, 读取超时)
+GATEWAY_TTS_CACHE_MB = int(os.getenv('GATEWAY_TTS_CACHE_MB', 64))   # 共享TTS音频缓存上限
+GATEWAY_TTS_CACHE_MAX_CHARS = 60    # 只缓存不超过这个字数的句子（长句很少重复）
+GATEWAY_MUSIC_SEARCH_TTL_S = 3600   # 歌曲搜索结果缓存时长
+GATEWAY_MUSIC_URL_TTL_S = 300       # 播放地址（重定向目标，带时效签名）缓存时长
+GATEWAY_MUSIC_CACHE_ENTRIES = 2048
+# 按来源地址限流（不信任客户端自报的 X-Device-Id，换一个请求头就能绕过）
+GATEWAY_DEVICE_RATE_PER_S = float(os.getenv('GATEWAY_DEVICE_RATE_PER_S', 5))   # 每个来源地址每秒允许的请求数（令牌桶补充速度）
+GATEWAY_DEVICE_BURST = int(os.getenv('GATEWAY_DEVICE_BURST', 20))              # 每个来源地址允许的突发请求数
 
 # --- 火山引擎对象存储 (TOS) 配置 ---
 TOS_ACCESS_KEY = os.getenv('TOS_ACCESS_KEY')
@@ -0,0 +1,10 @@
+# gateway.py
+# 车队网关入口：在局域网内一台常开的机器上运行，多台音箱设置 FLEET_GATEWAY_URL 指向它。
+# 运行方式（在项目根目录）: python gateway.py
+from smart_speaker.fleet_gateway import FleetGateway
+
+if __name__ == '__main__':
+    try:
+        FleetGateway().serve()
+    except KeyboardInterrupt:
+        print("\n车队网关已退出。")
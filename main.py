@@ -1,64 +1,267 @@
 # main.py
+import functools
+import hmac
+import math
 import threading
 import json
-from flask import Flask, render_template
+import time
+from flask import Flask, render_template, jsonify, send_from_directory, request, Response, abort
 from flask_sock import Sock
 
 import config
-from smart_speaker.smartspeaker import SmartSpeaker, SpeakerState
-from smart_speaker.audio_handler import AudioHandler
-from smart_speaker.flask_utils import clients, broadcast
+from smart_speaker.startup import StartupOrchestrator
+
+# 启动编排器尽早创建，用于统计包括模块导入在内的启动耗时
+startup = StartupOrchestrator()
+
+from smart_speaker.session_manager import SessionManager
+from smart_speaker.flask_utils import clients
+from smart_speaker.metrics import metrics
+from smart_speaker.services.llm_service import llm_gateway
+from smart_speaker.services.asr_service import get_tos_client
+from smart_speaker.static_assets import static_assets
+from smart_speaker.flight_recorder import flight_recorder
+from smart_speaker.text_turns import TextChannel
+from smart_speaker.log import get_logger, recent_logs
+from smart_speaker.profiling import sampling_profiler, memory_profiler, thread_cpu_usage, ProfilerBusy
+from smart_speaker.async_server import AsyncWebServer
+
+startup.record("imports", 0.0, time.monotonic() - startup.started_at)
+
+# 每个房间一个会话；未配置 ROOMS 时只有一个 "default" 会话
+session_manager = SessionManager()
+log = get_logger("main")
 
 # --- Web服务器和WebSocket设置 ---
 app = Flask(__name__)
 sock = Sock(app)
 
+def _bad_request(message):
+    abort(Response(json.dumps({"error": message}), 400, mimetype="application/json"))
+
+def _number_arg(name, default, type=float, positive=False, minimum=None):
+    """解析数值型查询参数；格式不对或超出范围（positive 要求大于0，minimum 为下限）时直接返回400，而不是让 int()/float() 的异常变成500"""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    try:
+        number = type(value)
+    except ValueError:
+        number = None
+    if (number is None or not math.isfinite(number) or (positive and number <= 0)
+            or (minimum is not None and number < minimum)):
+        _bad_request(f"invalid {name}: {value!r}")
+    return number
+
+def _group_by_arg():
+    group_by = request.args.get('group_by', 'lineno')
+    if group_by not in ('lineno', 'filename', 'traceback'):
+        _bad_request(f"invalid group_by: {group_by!r}")
+    return group_by
+
 # --- Flask路由 ---
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', assets=static_assets, default_session=session_manager.default_id)
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    # 构建产物的文件名中带有内容哈希，内容不会变化，可以让浏览器永久缓存；ETag用于条件请求
+    response = send_from_directory(config.STATIC_BUILD_DIR, filename, max_age=config.ASSET_CACHE_MAX_AGE_S)
+    response.headers["Cache-Control"] = f"public, max-age={config.ASSET_CACHE_MAX_AGE_S}, immutable"
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    snapshot = metrics.snapshot()
+    snapshot["gauges"]["process.threads"] = threading.active_count()
+    return jsonify(snapshot)
+
+@app.route('/ready')
+def ready_endpoint():
+    # 唤醒词检测开始工作后返回200，之前返回503；同时附带各初始化任务的耗时明细
+    status = startup.status()
+    return jsonify(status), (200 if status["ready"] else 503)
+
+def _require_debug_token(view):
+    """剖析接口和会暴露房间录音/转写内容的接口需要 PROFILING_TOKEN 鉴权（Authorization: Bearer <令牌>）；未配置令牌时接口视为不存在"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if not config.PROFILING_TOKEN:
+            return jsonify({"error": "debug endpoints disabled"}), 404
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(supplied.encode(), config.PROFILING_TOKEN.encode()):
+            return jsonify({"error": "unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+@app.route('/logs')
+@_require_debug_token
+def logs_endpoint():
+    # 面板查看最近的日志：level为最低级别，since为上次拿到的最大序号（增量轮询），limit为最多返回条数
+    records = recent_logs.snapshot(request.args.get('level'), _number_arg('since', 0, int, minimum=0), _number_arg('limit', 200, int, positive=True))
+    return jsonify(records)
+
+@app.route('/debug/profile')
+@_require_debug_token
+def debug_profile():
+    # 对所有线程采样 seconds 秒，返回折叠栈文本（flamegraph.pl / speedscope 可直接使用）
+    seconds = _number_arg('seconds', 10, positive=True)
+    interval_ms = _number_arg('interval_ms', None, positive=True)
+    try:
+        collapsed, samples = sampling_profiler.profile(seconds, interval_ms / 1000 if interval_ms else None)
+    except ProfilerBusy:
+        return jsonify({"error": "another profile is running"}), 409
+    return Response(collapsed, mimetype="text/plain", headers={"X-Profile-Samples": str(samples)})
+
+@app.route('/debug/threads')
+@_require_debug_token
+def debug_threads():
+    # 各线程（含原生线程）的累计CPU时间，以及 interval 秒内的CPU占用率
+    return jsonify(thread_cpu_usage(_number_arg('interval', 1.0, positive=True)))
+
+@app.route('/debug/memory')
+@_require_debug_token
+def debug_memory_status():
+    return jsonify(memory_profiler.status())
+
+@app.route('/debug/memory/start', methods=['POST'])
+@_require_debug_token
+def debug_memory_start():
+    return jsonify(memory_profiler.start(_number_arg('frames', None, int, positive=True)))
+
+@app.route('/debug/memory/stop', methods=['POST'])
+@_require_debug_token
+def debug_memory_stop():
+    return jsonify(memory_profiler.stop())
+
+@app.route('/debug/memory/snapshot')
+@_require_debug_token
+def debug_memory_snapshot():
+    stats = memory_profiler.snapshot(_number_arg('limit', 20, int, positive=True), _group_by_arg())
+    if stats is None:
+        return jsonify({"error": "tracemalloc not started"}), 409
+    return jsonify(stats)
+
+@app.route('/debug/memory/diff')
+@_require_debug_token
+def debug_memory_diff():
+    # 与基准快照比较；reset=1 时把当前快照设为新的基准
+    stats = memory_profiler.diff(_number_arg('limit', 20, int, positive=True), _group_by_arg(), request.args.get('reset') == '1')
+    if stats is None:
+        return jsonify({"error": "tracemalloc not started"}), 409
+    return jsonify(stats)
+
+def _flight_window():
+    """解析 /flight 系列接口的时间窗口：start/end 为Unix时间戳，或用 seconds 表示最近若干秒"""
+    now = time.time()
+    end = _number_arg('end', now)
+    start = _number_arg('start', end - _number_arg('seconds', 60))
+    return start, end
+
+@app.route('/flight')
+@_require_debug_token
+def flight_export():
+    # 导出飞行记录仪中某条轨道(mic/tts)在指定时间窗口内的音频，格式为WAV
+    if not flight_recorder.enabled:
+        return jsonify({"error": "flight recorder disabled"}), 404
+    track = request.args.get('track', 'mic')
+    start, end = _flight_window()
+    session_id = request.args.get('session', session_manager.default_id)
+    wav = flight_recorder.export_wav(track, start, end, session_id)
+    if wav is None:
+        return jsonify({"error": "no audio in window"}), 404
+    filename = f"flight_{session_id}_{track}_{int(start)}_{int(end)}.wav"
+    return Response(wav, mimetype="audio/wav", headers={"Content-Disposition": f"attachment; filename={filename}"})
+
+@app.route('/flight/markers')
+@_require_debug_token
+def flight_markers():
+    start, end = _flight_window()
+    return jsonify(flight_recorder.marker_list(start, end, request.args.get('session')))
+
+def _attach_client(ws_client, query, remote_addr=None):
+    """新的面板连接：加入广播列表并发送初始状态，返回用于文字轮次的通道（两种服务模式共用）"""
+    clients.append(ws_client)
+    log.info(f"新客户端连接，当前共 {len(clients)} 个连接。")
+    # 面板通过 ?session= 选择要显示的房间，默认为第一个房间
+    session = session_manager.get(query.get('session'))
+    if not session: return None
+    # 发送初始状态
+    speaker = session.speaker
+    # 历史的JSON编码由对话存储缓存，连接时不必重新复制和编码整段历史
+    ws_client.send(f'{{"type": "conversation_history", "session": {json.dumps(session.id)}, "history": {speaker.conversation.history_json()}}}')
+    current_message = config.PROMPT_SLEEPING
+    ws_client.send(json.dumps({"type": "status_update", "state": "idle", "message": current_message, "session": session.id}))
+    # 客户端可以通过这条连接发送文字轮次
+    return TextChannel(ws_client, speaker, remote_addr)
+
+def _on_client_message(channel, message):
+    if message is not None and channel:
+        channel.handle(message)
+
+def _detach_client(ws_client, channel):
+    log.info("客户端断开连接。")
+    if channel: channel.close()
+    if ws_client in clients:
+        clients.remove(ws_client)
 
 @sock.route('/ws')
 def ws(ws_client):
-    clients.append(ws_client)
-    print(f"新客户端连接，当前共 {len(clients)} 个连接。")
-    if 'speaker' in globals() and speaker:
-        # 发送初始状态
-        ws_client.send(json.dumps({"type": "conversation_history", "history": speaker.conversation_history[1:]}))
-        current_message = config.PROMPT_SLEEPING
-        ws_client.send(json.dumps({"type": "status_update", "state": "idle", "message": current_message}))
+    channel = _attach_client(ws_client, request.args, request.remote_addr)
     try:
         while True:
-            # 保持连接，可以接收来自前端的消息（目前未使用）
-            message = ws_client.receive(timeout=60)
+            _on_client_message(channel, ws_client.receive(timeout=60))
     except Exception:
-        print("客户端断开连接。")
+        pass
     finally:
-        if ws_client in clients:
-            clients.remove(ws_client)
+        _detach_client(ws_client, channel)
+
+def bootstrap():
+    """并行初始化各组件，唤醒词检测器和音频设备一就绪就开始监听，其余任务在后台继续完成"""
+    if config.FLIGHT_RECORDER_TRACKS: flight_recorder.open(tracks=config.FLIGHT_RECORDER_TRACKS)
+    sessions = session_manager.create_sessions()
+
+    # 每个会话各自的初始化任务；Vosk模型在第一个任务中加载，其余任务复用同一份模型
+    for session in sessions:
+        startup.submit(f"{session.id}.wake_word", session.audio_handler.load_detectors)
+        startup.submit(f"{session.id}.audio_devices", session.audio_handler.probe_devices)
+        startup.submit(f"{session.id}.local_models", session.speaker.load_local_models)
+    # 所有会话共享的初始化任务
+    startup.submit("llm_clients", llm_gateway.warm_up)
+    startup.submit("tos_client", get_tos_client)
+    startup.submit("tts_prewarm", sessions[0].speaker.tts.prewarm, config.TTS_PREWARM_PROMPTS)
+    startup.submit("static_assets", static_assets.build)
+
+    # 每个房间的唤醒词检测器和音频设备一就绪就开始监听
+    for session in sessions:
+        startup.wait(f"{session.id}.wake_word", f"{session.id}.audio_devices")
+        session.audio_handler.start()
+    startup.mark_ready()
+
+    startup.wait()
+    startup.report()
 
 # --- 主程序入口 ---
 if __name__ == '__main__':
     if config.check_env_vars():
-        # 1. 创建业务逻辑实例
-        speaker = SmartSpeaker()
-        
-        # 2. 创建并启动音频处理器，它会持有speaker的引用
-        audio_handler = AudioHandler(speaker)
-        audio_handler.start()
+        # 1. 在后台线程中并行初始化业务逻辑和音频处理器，Web服务器不必等待
+        threading.Thread(target=bootstrap, name="bootstrap", daemon=True).start()
         
-        # 3. 启动Web服务器 (在主线程中)
-        print("Web服务器已在 http://0.0.0.0:5000 启动")
+        # 2. 启动Web服务器 (在主线程中)，启动进度可通过 /ready 查询
         try:
-            # 使用werkzeug的开发服务器，它能很好地处理多线程和WebSocket
-            app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False)
+            if config.WEB_SERVER == "async":
+                # asyncio服务：WebSocket客户端是协程，HTML/JSON响应gzip压缩，有连接上限和心跳
+                AsyncWebServer(app, _attach_client, _on_client_message, _detach_client).serve_forever()
+            else:
+                # werkzeug的开发服务器：每个WebSocket客户端占用一个线程
+                log.info(f"Web服务器已在 http://{config.WEB_HOST}:{config.WEB_PORT} 启动")
+                app.run(host=config.WEB_HOST, port=config.WEB_PORT, debug=False, use_reloader=False)
         except KeyboardInterrupt:
             print("\n正在关闭程序...")
         finally:
             # 确保所有后台进程都被清理
-            audio_handler.stop()
-            if speaker.music_player.is_active():
-                speaker.music_player.stop()
+            session_manager.stop_all()
             print("程序已完全退出。")
     else:
         print("\n请先完成 .env 文件的配置后再运行程序。")
\ No newline at end of file
@@ -0,0 +1,293 @@
+# smart_speaker/async_server.py
+# 基于asyncio(websockets库)的生产用Web服务：面板WebSocket客户端是协程而不是各占一个阻塞线程，
+# 普通HTTP请求桥接到Flask应用（WSGI）在一个小线程池中执行，HTML/JSON响应按需gzip压缩。
+# 事件循环运行在独立线程中：音频线程广播消息时只做一次 call_soon_threadsafe，不会被慢客户端阻塞；
+# 事件循环也从不直接接触业务锁，所有可能阻塞的调用都放到线程池执行。
+import asyncio
+import gzip
+import io
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import unquote, urlsplit, parse_qs
+
+import config
+from .metrics import metrics
+from .log import get_logger
+
+log = get_logger(__name__)
+
+_COMPRESSIBLE_TYPES = ("text/html", "text/plain", "text/css", "application/json", "application/javascript")
+_HTTP_METHODS = ("GET", "HEAD", "POST")
+_MAX_HEADER_BYTES = 64 * 1024
+
+
+class AsyncClient:
+    """
+    把一条asyncio WebSocket连接包装成与 flask-sock 客户端相同的 send() 接口，可以从任意线程调用。
+    发送队列满（客户端太慢）时抛出异常并关闭连接，广播方据此把它移出客户端列表。
+    """
+    def __init__(self, loop, connection):
+        self.loop = loop
+        self.connection = connection
+        self.queue = asyncio.Queue()
+        # asyncio.Queue不是线程安全的，不能在其他线程读qsize()；待发送条数单独用锁计数
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    def send(self, data):
+        with self._pending_lock:
+            full = self._pending >= config.WEB_SEND_QUEUE_SIZE
+            if not full: self._pending += 1
+        if full:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+            raise ConnectionError("客户端发送队列已满")
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, data)
+
+    async def pump(self):
+        """把队列中的消息依次发出；收到None时关闭连接"""
+        while True:
+            data = await self.queue.get()
+            if data is None: break
+            with self._pending_lock:
+                self._pending -= 1
+            await self.connection.send(data)
+        await self.connection.close()
+
+
+class AsyncWebServer:
+    """
+    Args:
+        app: Flask应用，普通HTTP请求交给它处理。
+        on_connect (callable): on_connect(client, query, remote_addr) 在新的WebSocket连接建立时调用（线程池中），返回连接上下文。
+        on_message (callable): on_message(context, message) 处理客户端发来的消息（线程池中）。
+        on_disconnect (callable): on_disconnect(client, context) 在连接关闭时调用（线程池中）。
+    """
+    def __init__(self, app, on_connect, on_message, on_disconnect, host=None, port=None):
+        self.app = app
+        self.on_connect = on_connect
+        self.on_message = on_message
+        self.on_disconnect = on_disconnect
+        self.host = host or config.WEB_HOST
+        self.port = config.WEB_PORT if port is None else port
+        self.loop = None
+        self.thread = None
+        self.connections = 0
+        self._executor = ThreadPoolExecutor(max_workers=config.WEB_HTTP_WORKERS, thread_name_prefix="web-http")
+        self._started = threading.Event()
+        self._stop = None
+        self._server = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="web-loop", daemon=True)
+        self.thread.start()
+        self._started.wait()
+        return self
+
+    def serve_forever(self):
+        """在当前线程运行（主线程），直到 stop() 被调用"""
+        self._run()
+
+    def stop(self):
+        if self.loop and self._stop: self.loop.call_soon_threadsafe(self._stop.set)
+        if self.thread: self.thread.join(timeout=5)
+
+    @property
+    def bound_port(self):
+        return self._server.sockets[0].getsockname()[1] if self._server else None
+
+    def _run(self):
+        asyncio.run(self._main())
+
+    async def _main(self):
+        from websockets.asyncio.server import serve
+        self.loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        async with serve(self._handle_ws, self.host, self.port, process_request=self._process_request,
+                         create_connection=_http_bridge_connection(),
+                         ping_interval=config.WEB_PING_INTERVAL_S, ping_timeout=config.WEB_PING_TIMEOUT_S,
+                         max_size=config.WEB_MAX_MESSAGE_BYTES, compression=None) as server:
+            self._server = server
+            log.info(f"Web服务器(async)已在 http://{self.host}:{self.bound_port} 启动，连接上限 {config.WEB_MAX_CONNECTIONS}。")
+            self._started.set()
+            await self._stop.wait()
+        self._executor.shutdown(wait=False)
+
+    # --- HTTP ---
+
+    async def _process_request(self, connection, request):
+        if request.headers.get("Upgrade", "").lower() == "websocket":
+            if urlsplit(request.path).path != "/ws":
+                return connection.respond(HTTPStatus.NOT_FOUND, "Not Found\n")
+            if self.connections >= config.WEB_MAX_CONNECTIONS:
+                metrics.inc("web.ws_rejected")
+                return connection.respond(HTTPStatus.SERVICE_UNAVAILABLE, "Too many connections\n")
+            return None
+        if connection.http_error:
+            return connection.respond(connection.http_error, f"{connection.http_error.phrase}\n")
+        if connection.http_method not in _HTTP_METHODS:
+            response = connection.respond(HTTPStatus.METHOD_NOT_ALLOWED, "Method Not Allowed\n")
+            response.headers["Allow"] = ", ".join(_HTTP_METHODS)
+            return response
+        status, headers, body = await self.loop.run_in_executor(
+            self._executor, self._call_wsgi, request, connection.remote_address, connection.http_method, connection.http_body)
+        return self._response(status, headers, body)
+
+    def _call_wsgi(self, request, remote_address, method="GET", body=b""):
+        """在线程池中把请求交给Flask应用处理，必要时压缩响应体"""
+        url = urlsplit(request.path)
+        environ = {
+            "REQUEST_METHOD": method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": unquote(url.path, "latin-1"),
+            "QUERY_STRING": url.query,
+            "SERVER_NAME": str(self.host),
+            "SERVER_PORT": str(self.bound_port),
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "REMOTE_ADDR": remote_address[0] if remote_address else "",
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in request.headers.raw_items():
+            key = name.upper().replace("-", "_")
+            if key in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+                environ[key] = value
+            else:
+                key = "HTTP_" + key
+                environ[key] = f"{environ[key]},{value}" if key in environ else value
+        if body: environ["CONTENT_LENGTH"] = str(len(body))
+
+        response = {}
+        def start_response(status, headers, exc_info=None):
+            response["status"], response["headers"] = status, headers
+
+        result = self.app(environ, start_response)
+        try:
+            body = b"".join(result)
+        finally:
+            if hasattr(result, "close"): result.close()
+        headers = response["headers"]
+        body, headers = self._maybe_compress(body, headers, environ.get("HTTP_ACCEPT_ENCODING", ""))
+        metrics.inc("web.http_requests")
+        return int(response["status"].split(" ", 1)[0]), headers, body
+
+    @staticmethod
+    def _maybe_compress(body, headers, accept_encoding):
+        content_type = next((v for k, v in headers if k.lower() == "content-type"), "")
+        if (len(body) < config.WEB_GZIP_MIN_BYTES or "gzip" not in accept_encoding
+                or not content_type.startswith(_COMPRESSIBLE_TYPES)
+                or any(k.lower() == "content-encoding" for k, _ in headers)):
+            return body, headers
+        compressed = gzip.compress(body, compresslevel=config.WEB_GZIP_LEVEL)
+        metrics.inc("web.gzip_saved_bytes", len(body) - len(compressed))
+        headers = [(k, v) for k, v in headers if k.lower() != "content-length"]
+        headers += [("Content-Encoding", "gzip"), ("Vary", "Accept-Encoding")]
+        return compressed, headers
+
+    @staticmethod
+    def _response(status, headers, body):
+        from websockets.datastructures import Headers
+        from websockets.http11 import Response
+        response_headers = Headers()
+        for name, value in headers:
+            if name.lower() in ("content-length", "connection"): continue
+            response_headers[name] = value
+        response_headers["Content-Length"] = str(len(body))
+        # 握手前的HTTP响应之后连接会被关闭
+        response_headers["Connection"] = "close"
+        try:
+            reason = HTTPStatus(status).phrase
+        except ValueError:
+            reason = ""
+        return Response(status, reason, response_headers, body)
+
+    # --- WebSocket ---
+
+    async def _handle_ws(self, connection):
+        self.connections += 1
+        metrics.set_gauge("web.ws_connections", self.connections)
+        client = AsyncClient(self.loop, connection)
+        pump = asyncio.create_task(client.pump())
+        query = {k: v[0] for k, v in parse_qs(urlsplit(connection.request.path).query).items()}
+        context = None
+        try:
+            remote_addr = connection.remote_address[0] if connection.remote_address else None
+            context = await self.loop.run_in_executor(self._executor, self.on_connect, client, query, remote_addr)
+            async for message in connection:
+                await self.loop.run_in_executor(self._executor, self.on_message, context, message)
+        except Exception as e:
+            if not _is_connection_closed(e): log.error(f"❌ [Web] WebSocket处理出错: {e}")
+        finally:
+            self.connections -= 1
+            metrics.set_gauge("web.ws_connections", self.connections)
+            client.queue.put_nowait(None)
+            await self.loop.run_in_executor(self._executor, self.on_disconnect, client, context)
+            await asyncio.gather(pump, return_exceptions=True)
+
+
+def _http_bridge_connection():
+    """
+    websockets只解析不带请求体的GET请求，遇到其他方法会直接断开连接。
+    这里在握手解析之前截获非GET请求：收完请求体后把请求行改写为GET、去掉请求体相关的头再交给websockets，
+    原始方法和请求体保存在连接对象上，由 _process_request 原样交给Flask。
+    """
+    from websockets.asyncio.server import ServerConnection
+
+    class HttpBridgeConnection(ServerConnection):
+        http_method = "GET"
+        http_body = b""
+        http_error = None
+        _buffer = b""
+        _bridged = False
+
+        def data_received(self, data):
+            if self._bridged:
+                return super().data_received(data)
+            self._buffer += data
+            header_end = self._buffer.find(b"\r\n\r\n")
+            if header_end < 0 and len(self._buffer) <= _MAX_HEADER_BYTES: return
+            request_line, _, header_block = self._buffer[:max(header_end, 0)].partition(b"\r\n")
+            method, _, rest = request_line.partition(b" ")
+            if header_end < 0 or method == b"GET":
+                # GET请求（含WebSocket握手）和超长的请求头都原样交给websockets处理
+                self._bridged = True
+                return super().data_received(self._buffer)
+
+            length, headers = 0, []
+            for line in header_block.split(b"\r\n") if header_block else []:
+                name, _, value = line.partition(b":")
+                name = name.strip().lower()
+                if name == b"content-length":
+                    try:
+                        length = int(value)
+                    except ValueError:
+                        self.http_error = HTTPStatus.BAD_REQUEST
+                elif name == b"transfer-encoding":
+                    self.http_error = HTTPStatus.LENGTH_REQUIRED
+                else:
+                    headers.append(line)
+            if length < 0:
+                self.http_error = HTTPStatus.BAD_REQUEST
+            elif length > config.WEB_MAX_MESSAGE_BYTES:
+                self.http_error = HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+            body = self._buffer[header_end + 4:]
+            if self.http_error is None and len(body) < length: return   # 等待完整的请求体
+
+            self._bridged = True
+            self.http_method = method.decode("ascii", "replace")
+            self.http_body = body[:length] if self.http_error is None else b""
+            self._buffer = b""
+            super().data_received(b"\r\n".join([b"GET " + rest] + headers) + b"\r\n\r\n")
+
+    return HttpBridgeConnection
+
+
+def _is_connection_closed(error):
+    from websockets.exceptions import ConnectionClosed
+    return isinstance(error, ConnectionClosed)
@@ -1,128 +1,216 @@
 # smart_speaker/audio_handler.py
-import subprocess
 import threading
 import time
 import collections
 import audioop
-import pyaudio
 
 import config
 from .services.wake_word_service import VoskWakeWordDetector
-from .flask_utils import broadcast
 from .smartspeaker import SpeakerState
+from .utterance_recorder import UtteranceRecorder
+from .flight_recorder import flight_recorder
+from .frontend_process import FrontendProcess, MODE_SLEEPING, MODE_AWAKE, MODE_MUSIC
+from .capture_sources import create_capture_source, DEVICE_SOURCES
+from .capture_supervisor import CaptureSupervisor
+from .log import get_logger, set_context
+
+log = get_logger(__name__)
+
+_FRONTEND_MODES = {
+    SpeakerState.SLEEPING: MODE_SLEEPING,
+    SpeakerState.AWAKE: MODE_AWAKE,
+    SpeakerState.PLAYING_MUSIC: MODE_MUSIC,
+}
 
 class AudioHandler:
-    def __init__(self, speaker):
+    def __init__(self, speaker, arecord_device=None, input_device_keywords=None, capture_source=None, capture_port=None,
+                 standby_device=None):
         self.speaker = speaker
-        # 创建两个不同的Vosk识别器实例
-        self.wake_word_detector = VoskWakeWordDetector(keywords=[config.WAKE_WORD])
-        self.stop_music_detector = VoskWakeWordDetector(keywords=config.MUSIC_STOP_WORDS)
+        # 多房间时每个会话使用自己的采集设备
+        self.arecord_device = arecord_device or config.ARECORD_DEVICE
+        self.input_device_keywords = input_device_keywords or config.INPUT_DEVICE_KEYWORDS
+        # 采集源类型: arecord / pyaudio / wav / tcp / udp
+        self.capture_kind = capture_source or config.CAPTURE_SOURCE
+        self.capture_port = capture_port
+        # 热备采集设备：必须能与主设备同时打开（dsnoop或另一个麦克风）
+        self.standby_device = standby_device
+        # 启用独立前端进程时，唤醒词/停止词检测和VAD都在工作进程中完成
+        self.frontend = FrontendProcess() if config.AUDIO_FRONTEND_PROCESS else None
+        self._frontend_restart = None
+        # Vosk检测器和PyAudio都比较耗时，分别由 load_detectors() / probe_devices() 在启动时并行初始化
+        self.wake_word_detector = None
+        self.stop_music_detector = None
+        self.recorder = UtteranceRecorder()
         
         self.is_running = False
-        self.pipeline_process = None
+        # 采集源由监管器负责卡顿检测、退避重启和热备切换
+        standby = config.CAPTURE_WARM_STANDBY and self.capture_kind == "arecord"
+        if standby and not standby_device:
+            log.warning("[Audio] ⚠️ 已开启热备但没有配置热备设备 (CAPTURE_STANDBY_DEVICE)，同一设备无法打开两次，不启用热备。")
+        self.capture = CaptureSupervisor(self._create_source, speaker.session_id,
+                                         create_standby=self._create_standby_source if standby and standby_device else None)
         self.thread = None
-        self.p_audio = pyaudio.PyAudio()
+        self.p_audio = None
+        self._probed_device = None
+
+    def load_detectors(self):
+        """创建唤醒词和停止词检测器（会触发Vosk模型加载）；启用前端进程时则启动工作进程"""
+        if self.frontend:
+            self.frontend.start(); return
+        # 创建两个不同的Vosk识别器实例
+        self.wake_word_detector = VoskWakeWordDetector(keywords=[config.WAKE_WORD])
+        self.stop_music_detector = VoskWakeWordDetector(keywords=config.MUSIC_STOP_WORDS)
+
+    def probe_devices(self):
+        """初始化PyAudio并探测输入设备及其原生采样率，结果供下一次启动管道时使用"""
+        if self.capture_kind not in DEVICE_SOURCES:
+            return None
+        if self.p_audio is None:
+            import pyaudio
+            self.p_audio = pyaudio.PyAudio()
+        device_index = self._find_best_input_device_index()
+        if device_index is None:
+            self._probed_device = None
+            return None
+        try:
+            dev_info = self.p_audio.get_device_info_by_index(device_index)
+            native_rate = int(dev_info['defaultSampleRate'])
+            log.info(f"[Audio] 检测到设备原生采样率: {native_rate}Hz")
+        except Exception as e:
+            native_rate = 48000
+            log.error(f"❌ 获取设备原生采样率失败: {e}。将使用默认值: {native_rate}Hz")
+        self._probed_device = (device_index, native_rate)
+        return self._probed_device
 
     def _find_best_input_device_index(self):
         """在PyAudio中查找最佳输入设备"""
-        print(f"[Audio] 正在自动查找输入设备 (关键词: {config.INPUT_DEVICE_KEYWORDS})...")
+        log.info(f"[Audio] 正在自动查找输入设备 (关键词: {self.input_device_keywords})...")
         for i in range(self.p_audio.get_device_count()):
             dev_info = self.p_audio.get_device_info_by_index(i)
             if dev_info.get('maxInputChannels') > 0:
                 dev_name = dev_info.get('name', '').lower()
-                if any(keyword.lower() in dev_name for keyword in config.INPUT_DEVICE_KEYWORDS):
-                    print(f"[Audio] ✅ 找到输入设备: ID {i} - '{dev_info.get('name')}'")
+                if any(keyword.lower() in dev_name for keyword in self.input_device_keywords):
+                    log.info(f"[Audio] ✅ 找到输入设备: ID {i} - '{dev_info.get('name')}'")
                     return i
-        print("[Audio] ⚠️ 警告: 未找到匹配的USB输入设备，将使用系统默认设备。")
+        log.warning("[Audio] ⚠️ 警告: 未找到匹配的USB输入设备，将使用系统默认设备。")
         try:
             return self.p_audio.get_default_input_device_info().get('index')
         except IOError:
-            print("[Audio-Error] 无法获取默认输入设备。")
+            log.error("[Audio-Error] 无法获取默认输入设备。")
             return None
 
-    def _start_pipeline(self):
-        """动态获取原生采样率，并启动 arecord | ffmpeg 管道。"""
-        device_index = self._find_best_input_device_index()
-        if device_index is None:
-            print("[Audio-Error] 找不到任何可用的输入设备，无法启动管道。")
-            return None
-            
+    def _create_source(self, reprobe=False):
+        """
+        创建（尚未启动的）采集源，供采集监管器调用。
+        设备类采集源沿用缓存的设备索引和原生采样率，只有监管器要求时才重新探测。
+        """
+        probed = None
+        if self.capture_kind in DEVICE_SOURCES:
+            probed = self._probed_device
+            if probed is None or reprobe:
+                if reprobe: log.warning("[Audio] 缓存的输入设备连续启动失败，重新探测设备...")
+                probed = self.probe_devices()
+            if probed is None:
+                log.error("[Audio-Error] 找不到任何可用的输入设备，无法启动采集。")
+                return None
         try:
-            dev_info = self.p_audio.get_device_info_by_index(device_index)
-            native_rate = int(dev_info['defaultSampleRate'])
-            print(f"[Audio] 检测到设备原生采样率: {native_rate}Hz")
-        except Exception as e:
-            native_rate = 48000
-            print(f"❌ 获取设备原生采样率失败: {e}。将使用默认值: {native_rate}Hz")
+            return create_capture_source(self.capture_kind, self.arecord_device, self.p_audio, probed, self.capture_port)
+        except ValueError as e:
+            log.error(f"❌ {e}"); return None
 
-        arecord_cmd = ["arecord", "-D", config.ARECORD_DEVICE, "-f", "S16_LE", "-r", str(native_rate), "-c", "1", "-t", "raw"]
-        ffmpeg_cmd = ["ffmpeg", "-f", "s16le", "-ar", str(native_rate), "-ac", "1", "-i", "-", "-ar", str(config.TARGET_RATE), "-ac", "1", "-f", "s16le", "-"]
-        
-        print("[Audio] 准备启动实时重采样管道...")
-        try:
-            arecord_p = subprocess.Popen(arecord_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            ffmpeg_p = subprocess.Popen(ffmpeg_cmd, stdin=arecord_p.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            self.pipeline_process = (arecord_p, ffmpeg_p)
-            print("[Audio] ✅ 统一音频捕获管道已启动。")
-            return ffmpeg_p.stdout
-        except Exception as e:
-            print(f"❌ 启动音频管道失败: {e}"); return None
-
-    def _is_pipeline_healthy(self):
-        """检查音频管道中的进程是否都还存活"""
-        if not self.pipeline_process: return False
-        arecord_p, ffmpeg_p = self.pipeline_process
-        if arecord_p.poll() is not None or ffmpeg_p.poll() is not None:
-            print("[Audio-Health] 检测到音频管道进程已意外退出。")
-            return False
-        return True
+    def _create_standby_source(self):
+        """创建热备采集源：使用单独配置的热备设备，沿用主采集源探测到的原生采样率"""
+        if self._probed_device is None: return None
+        return create_capture_source("arecord", self.standby_device, None, self._probed_device)
 
     def start(self):
+        if self.frontend and not self.frontend.is_alive(): self.frontend.start()
         self.is_running = True
         self.thread = threading.Thread(target=self.run, daemon=True)
         self.thread.start()
 
     def stop(self):
         self.is_running = False
+        # 先停止采集，让阻塞在 read() 上的音频线程尽快返回
+        self.capture.stop()
         if self.thread: self.thread.join(timeout=2)
-        if self.pipeline_process:
-            try:
-                self.pipeline_process[0].kill(); self.pipeline_process[1].kill()
-            except Exception as e:
-                print(f"[Audio] 清理管道进程时出错: {e}")
-        self.p_audio.terminate()
-        print("[Audio] 音频处理器已停止。")
+        if self.frontend: self.frontend.stop()
+        if self.p_audio: self.p_audio.terminate()
+        log.info("[Audio] 音频处理器已停止。")
+
+    def _dispatch_with_frontend(self, chunk):
+        """进程外前端模式：只把音频写入共享内存，并处理工作进程发回的事件"""
+        if not self.frontend.is_ready():
+            # 工作进程重启（重新加载模型）期间直接丢弃音频，不能阻塞采集线程
+            if self._frontend_restart and self._frontend_restart.is_alive(): return
+            if not self.frontend.is_alive():
+                self._restart_frontend(); return
+            if not self.frontend.poll_ready(): return
+
+        self.frontend.feed(chunk, _FRONTEND_MODES[self.speaker.state])
+        for event in self.frontend.poll_events():
+            kind = event[0]
+            if kind == "wake" and self.speaker.state == SpeakerState.SLEEPING:
+                self.speaker.wake_up()
+            elif kind == "stop_music" and self.speaker.state == SpeakerState.PLAYING_MUSIC:
+                self.speaker.handle_stop_music()
+            elif kind == "listening":
+                flight_recorder.mark("vad:speech_start", self.speaker.session_id)
+                self.speaker.broadcast({"type": "status_update", "state": "listening", "message": ""})
+            elif kind == "utterance":
+                segments = self.frontend.read(event[1], event[2])
+                if segments is None:
+                    log.warning("[Frontend-Warn] 录音数据在取出前已被覆盖，丢弃本次录音。"); continue
+                # 从共享内存一次性复制到录音缓冲区
+                self.recorder.start(segments)
+                for segment in segments: segment.release()
+                log.info("[VAD] 前端进程判定录音结束，开始处理...")
+                flight_recorder.mark("vad:speech_end", self.speaker.session_id)
+                self.speaker.process_command(self.recorder.finish())
+
+    def _restart_frontend(self):
+        """在后台线程中重启已退出的前端工作进程"""
+        log.error("[Frontend-Error] 音频前端工作进程已退出，正在后台重启，期间丢弃麦克风音频...")
+
+        def restart():
+            self.frontend.stop()
+            if self.is_running: self.frontend.start()
+        self._frontend_restart = threading.Thread(target=restart, name="frontend-restart", daemon=True)
+        self._frontend_restart.start()
 
     def run(self):
         """主运行循环，根据speaker的状态分发音频流"""
+        set_context(session=self.speaker.session_id, stage="capture")
+        log.info(f"[Audio] 正在启动采集源 ({self.capture_kind})...")
+        self.capture.start()
+        stats_at = time.monotonic()
         while self.is_running:
-            if not self._is_pipeline_healthy():
-                print("[Audio-Health] 音频管道不健康，正在尝试重启...")
-                if self.pipeline_process:
-                    try: self.pipeline_process[0].kill(); self.pipeline_process[1].kill()
-                    except: pass
-                
-                audio_stream = self._start_pipeline()
-                if not audio_stream:
-                    print("[Audio-Error] 管道重启失败，将在5秒后重试。"); time.sleep(5); continue
-            else:
-                audio_stream = self.pipeline_process[1].stdout
-
+            if self.capture.ended:
+                log.info("[Audio] 采集源已结束，音频处理循环退出。"); break
+            generation = self.capture.generation
             rolling_buffer = collections.deque(maxlen=int(config.PRE_BUFFER_DURATION_S * config.TARGET_RATE / config.CHUNK_SIZE))
-            recorded_frames = []
-            is_recording = False
+            self.recorder.abort()
+            self.speaker.speculator.abort()
             last_speech_time = 0
             
-            print(f"\n[State-Loop] 进入新一轮监听循环，当前状态: {self.speaker.state.name}")
-            while self.is_running and self._is_pipeline_healthy():
+            log.info(f"[State-Loop] 进入新一轮监听循环，当前状态: {self.speaker.state.name}")
+            while self.is_running:
                 # 播放TTS或音乐时，不处理麦克风输入，避免回声
                 if self.speaker.is_speaking or self.speaker.music_player.is_active():
                     time.sleep(0.1); continue
 
-                try:
-                    chunk = audio_stream.read(config.CHUNK_SIZE)
-                    if not chunk: print("[Audio-Warn] 从管道读取到空数据..."); break
-                except (IOError, ValueError): break
+                chunk = self.capture.read(config.CHUNK_SIZE)
+                if not chunk: break
+                if self.capture.generation != generation:
+                    # 采集源已被切换或重启，之前的预录音频和进行中的录音都不再连续，重新开始监听
+                    log.info("[Audio] 采集源已切换，重置录音状态。")
+                    break
+                flight_recorder.record_mic(chunk, self.speaker.session_id)
+                if time.monotonic() - stats_at >= config.CAPTURE_STATS_INTERVAL_S:
+                    self.capture.report_stats(); stats_at = time.monotonic()
+
+                if self.frontend:
+                    self._dispatch_with_frontend(chunk); continue
 
                 # --- 核心状态分发逻辑 ---
                 current_state = self.speaker.state
@@ -137,19 +225,28 @@ class AudioHandler:
                 
                 elif current_state == SpeakerState.AWAKE:
                     is_speech = self.speaker._is_speech(chunk)
-                    if not is_recording:
+                    if not self.recorder.is_recording:
                         rolling_buffer.append(chunk)
                         if is_speech:
-                            is_recording = True
-                            recorded_frames.extend(list(rolling_buffer))
+                            # 预录制音频只在这里复制一次
+                            self.recorder.start(rolling_buffer)
+                            self.speaker.speculator.begin(rolling_buffer)
                             last_speech_time = time.time()
-                            broadcast({"type": "status_update", "state": "listening", "message": ""})
+                            flight_recorder.mark("vad:speech_start", self.speaker.session_id)
+                            self.speaker.broadcast({"type": "status_update", "state": "listening", "message": ""})
                     else:
-                        recorded_frames.append(chunk)
+                        has_room = self.recorder.append(chunk)
+                        self.speaker.speculator.feed(chunk)
                         if is_speech: last_speech_time = time.time()
-                        if time.time() - last_speech_time > config.SILENCE_DURATION_S:
-                            print("[VAD] 检测到静音，录音结束，开始处理...")
-                            self.speaker.process_command(list(recorded_frames))
-                            is_recording = False; recorded_frames.clear(); rolling_buffer.clear()
+                        if not has_room:
+                            log.info(f"[VAD] 录音达到最长时长 {config.MAX_RECORDING_S}s，强制结束，开始处理...")
+                        elif time.time() - last_speech_time > config.SILENCE_DURATION_S:
+                            log.info("[VAD] 检测到静音，录音结束，开始处理...")
+                        else:
+                            continue
+                        flight_recorder.mark("vad:speech_end", self.speaker.session_id)
+                        self.speaker.speculator.end()
+                        self.speaker.process_command(self.recorder.finish())
+                        rolling_buffer.clear()
         
-        print("[Audio] 音频处理线程已停止。")
\ No newline at end of file
+        log.info("[Audio] 音频处理线程已停止。")
\ No newline at end of file
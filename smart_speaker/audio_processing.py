@@ -1,27 +1,41 @@
 # smart_speaker/audio_processing.py
+import itertools
+import os
+import shutil
 import subprocess
 import threading
-import time
-import os
 import requests
 
 import config
+from . import http_client
+from .flight_recorder import flight_recorder
+from .log import get_logger
+
+log = get_logger(__name__)
+
+
+def _player_env(playback_device):
+    """为ffplay指定ALSA输出设备（多房间时每个房间输出到自己的声卡），未指定时使用系统默认设备"""
+    if not playback_device: return None
+    return dict(os.environ, SDL_AUDIODRIVER="alsa", AUDIODEV=playback_device)
 
 class MusicPlayer:
     """
     一个专门用于在后台播放音乐的类。
     它管理一个ffplay子进程，并可以从外部停止。
     """
-    def __init__(self):
+    def __init__(self, playback_device=None):
+        self.playback_device = playback_device
         self.process = None
         self.is_playing = False
         self.play_thread = None
         self.current_song_name = ""
+        self.last_song_name = ""    # 最近一次播放的歌曲，播放结束后仍然保留
         self.on_playback_finished_callback = None # 用于存放回调函数
 
     def _play_thread_target(self, url, song_name):
         """在后台线程中运行的播放任务"""
-        print(f"[MusicPlayer] 准备播放音乐: {song_name}")
+        log.info(f"[MusicPlayer] 准备播放音乐: {song_name}")
         command = [
             "ffplay",
             "-nodisp",              # 不显示图形窗口
@@ -30,10 +44,12 @@ class MusicPlayer:
             url                     # 直接播放URL
         ]
         try:
-            self.process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            self.process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                            env=_player_env(self.playback_device))
             self.is_playing = True
             self.current_song_name = song_name
-            print(f"[MusicPlayer] ✅ 音乐《{song_name}》开始播放...")
+            self.last_song_name = song_name
+            log.info(f"[MusicPlayer] ✅ 音乐《{song_name}》开始播放...")
             
             # 等待进程结束
             self.process.wait()
@@ -42,17 +58,17 @@ class MusicPlayer:
             stderr_output = self.process.stderr.read().decode(errors='ignore').strip()
             # 只有在不是被我们主动停止时，才打印错误
             if self.is_playing and stderr_output: 
-                print(f"[MusicPlayer] 播放出错或自然结束: {stderr_output}")
+                log.error(f"[MusicPlayer] 播放出错或自然结束: {stderr_output}")
 
         except FileNotFoundError:
-            print("❌ 错误: 'ffplay' 命令未找到。")
+            log.error("❌ 错误: 'ffplay' 命令未找到。")
         except Exception as e:
-            print(f"❌ 启动音乐播放器时出错: {e}")
+            log.error(f"❌ 启动音乐播放器时出错: {e}")
         finally:
             self.is_playing = False
             self.process = None
             self.current_song_name = ""
-            print(f"[MusicPlayer] 音乐《{song_name}》播放线程结束。")
+            log.info(f"[MusicPlayer] 音乐《{song_name}》播放线程结束。")
             # 调用回调函数，通知上层播放已结束
             if self.on_playback_finished_callback:
                 self.on_playback_finished_callback()
@@ -65,13 +81,12 @@ class MusicPlayer:
         self.on_playback_finished_callback = on_finished_callback # 保存回调
         
         try:
-            print(f"[MusicPlayer] 正在解析音乐真实地址: {url}")
-            # requests库会自动处理302跳转
-            response = requests.get(url, allow_redirects=True, stream=True, timeout=10)
-            final_url = response.url
-            print(f"[MusicPlayer] 解析到真实地址: {final_url}")
+            log.info(f"[MusicPlayer] 正在解析音乐真实地址: {url}")
+            # 只跟随302跳转，不下载音频本身，连接由共享连接池复用
+            final_url = http_client.resolve_url(url)
+            log.info(f"[MusicPlayer] 解析到真实地址: {final_url}")
         except requests.RequestException as e:
-            print(f"❌ 解析音乐URL失败: {e}")
+            log.error(f"❌ 解析音乐URL失败: {e}")
             # 解析失败也要触发回调，让系统恢复
             if self.on_playback_finished_callback:
                 self.on_playback_finished_callback()
@@ -83,7 +98,7 @@ class MusicPlayer:
     def stop(self):
         """停止当前正在播放的音乐"""
         if self.process and self.is_playing:
-            print(f"[MusicPlayer] 正在停止音乐《{self.current_song_name}》...")
+            log.info(f"[MusicPlayer] 正在停止音乐《{self.current_song_name}》...")
             self.is_playing = False # 主动设置标志，让_play_thread_target知道是主动停止
             try:
                 self.process.terminate()
@@ -91,9 +106,9 @@ class MusicPlayer:
             except subprocess.TimeoutExpired:
                 self.process.kill()
             except Exception as e:
-                print(f"❌ 停止音乐播放时出错: {e}")
+                log.error(f"❌ 停止音乐播放时出错: {e}")
             self.process = None
-            print("[MusicPlayer] ✅ 音乐已停止。")
+            log.info("[MusicPlayer] ✅ 音乐已停止。")
 
     def is_active(self):
         """检查播放器是否正在播放"""
@@ -101,59 +116,99 @@ class MusicPlayer:
 
 # --- 以下是用于播放TTS短音频流的函数 ---
 
-def _feed_audio_to_player(player_process, audio_stream_generator, save_path=None):
-    """私有辅助函数：在后台线程中将音频块喂给播放器进程"""
-    file_to_write = None
+def _player_command(encoding, playback_device=None):
+    """
+    按音频编码选择播放命令。
+    PCM和WAV不需要解码，直接用aplay写入ALSA设备；MP3/Ogg Opus 交给ffplay解码。没有aplay时都用ffplay。
+    """
+    if encoding in ("pcm", "wav") and shutil.which("aplay"):
+        command = ["aplay", "-q"] + (["-D", playback_device] if playback_device else [])
+        if encoding == "pcm":
+            command += ["-t", "raw", "-f", "S16_LE", "-r", str(config.TTS_SAMPLE_RATE), "-c", "1"]
+        return command + ["-"], None
+    command = ["ffplay", "-autoexit", "-nodisp", "-loglevel", "error"]
+    if encoding == "pcm":
+        command += ["-f", "s16le", "-ar", str(config.TTS_SAMPLE_RATE), "-ac", "1"]
+    return command + ["-i", "-"], _player_env(playback_device)
+
+def _start_player(encoding, playback_device=None):
+    command, env = _player_command(encoding, playback_device)
+    return subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, env=env)
+
+def _feed_audio_to_player(player_process, audio_stream_generator, cancel_token=None, session="default", encoding="mp3"):
+    """私有辅助函数：将音频块喂给播放器进程"""
     try:
-        if save_path:
-            file_to_write = open(save_path, 'wb')
         for chunk in audio_stream_generator:
+            if cancel_token and cancel_token.is_cancelled():
+                break
             if chunk:
                 if player_process.stdin and not player_process.stdin.closed:
                     try:
                         player_process.stdin.write(chunk)
                     except (IOError, BrokenPipeError):
-                        print("[TTS-Play] 播放管道在写入时关闭，正常现象。")
+                        log.info("[TTS-Play] 播放管道在写入时关闭，正常现象。")
                         break
                 else:
                     break
-                if file_to_write:
-                    file_to_write.write(chunk)
+                flight_recorder.record_tts(chunk, encoding, session)
             else:
                 break
     except Exception as e:
-        print(f"❌ 喂给TTS播放器时出错: {e}")
+        log.error(f"❌ 喂给TTS播放器时出错: {e}")
     finally:
         if player_process.stdin and not player_process.stdin.closed:
             try:
                 player_process.stdin.close()
             except (IOError, BrokenPipeError):
                 pass
-        if file_to_write:
-            file_to_write.close()
 
-def play_audio_stream(audio_stream_generator):
-    """使用ffplay播放一个来自内存的音频流生成器（用于TTS）。"""
+def play_audio_stream(audio_stream_generator, cancel_token=None, session="default", playback_device=None):
+    """
+    播放一个来自内存的音频流生成器（用于TTS）。可通过cancel_token随时打断。
+    生成器带有 encoding 属性时（见 TTSRouter）按编码选择播放器，否则按mp3处理。
+    """
     if not audio_stream_generator:
         return
+    if cancel_token and cancel_token.is_cancelled():
+        return
     
-    print("[TTS-Play] 准备播放语音流...")
-    command = ["ffplay", "-autoexit", "-nodisp", "-loglevel", "error", "-i", "-"]
-    save_path = None
-    if config.SAVE_TTS_AUDIO:
-        timestamp = int(time.time())
-        save_path = os.path.join(config.AUDIO_DIR, f"tts_output_{timestamp}.mp3")
+    encoding = getattr(audio_stream_generator, "encoding", "mp3")
+    log.info(f"[TTS-Play] 准备播放语音流 ({encoding})...")
+    players = []
+
+    def on_cancel():
+        # 取消时直接结束播放器，正在进行的写入和等待都会立即返回
+        for player in players:
+            if player.poll() is None: player.kill()
 
     try:
-        ffplay_process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
-        time.sleep(0.1)
-        if ffplay_process.poll() is not None:
-             stderr_output = ffplay_process.stderr.read().decode(errors='ignore')
-             print(f"❌ ffplay(TTS) 启动失败! 错误: {stderr_output.strip()}"); return
-
-        player_thread = threading.Thread(target=_feed_audio_to_player, args=(ffplay_process, audio_stream_generator, save_path))
-        player_thread.start()
-        player_thread.join()
-        ffplay_process.wait()
+        # 播放器的启动和等待第一块音频同时进行
+        players.append(_start_player(encoding, playback_device))
+        if cancel_token: cancel_token.add_callback(on_cancel)
+        try:
+            chunks = iter(audio_stream_generator)
+            first_chunk = next(chunks, None)
+            if first_chunk is None or (cancel_token and cancel_token.is_cancelled()):
+                on_cancel(); return
+            actual_encoding = getattr(audio_stream_generator, "encoding", encoding)
+            if actual_encoding != encoding:
+                # 路由器回退到了其他后端（编码不同），换用对应的播放器
+                on_cancel()
+                encoding = actual_encoding
+                players.append(_start_player(encoding, playback_device))
+            player = players[-1]
+            if player.poll() is not None:
+                stderr_output = player.stderr.read().decode(errors='ignore')
+                log.error(f"❌ TTS播放器启动失败! 错误: {stderr_output.strip()}"); return
+            # 直接在当前线程中喂数据，不再为每句话额外创建并join一个线程
+            _feed_audio_to_player(player, itertools.chain([first_chunk], chunks), cancel_token, session, encoding)
+            player.wait()
+        finally:
+            if cancel_token: cancel_token.remove_callback(on_cancel)
+            for player in players:
+                if player.stdin and not player.stdin.closed:
+                    try: player.stdin.close()
+                    except (IOError, BrokenPipeError): pass
+                if player.poll() is None: player.wait()
     except Exception as e:
-        print(f"❌ 启动TTS播放器时出错: {e}")
\ No newline at end of file
+        log.error(f"❌ 启动TTS播放器时出错: {e}")
@@ -0,0 +1,454 @@
+# smart_speaker/capture_sources.py
+# 可替换的音频采集源。所有采集源都向外提供 16kHz / 16bit / 单声道 的PCM数据，
+# 并报告各自的采集延迟和CPU开销，便于在不同开发板上选择开销最小的方案。
+import audioop
+import os
+import select
+import socket
+import subprocess
+import threading
+import time
+import wave
+
+import config
+from .metrics import metrics
+from .log import get_logger
+
+log = get_logger(__name__)
+
+_BYTES_PER_SECOND = config.TARGET_RATE * 2
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def _process_cpu_seconds(pid):
+    """从 /proc/<pid>/stat 读取子进程累计的用户态+内核态CPU时间"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+class PcmBuffer:
+    """
+    有界的PCM字节缓冲区：采集回调/接收线程写入，音频主循环阻塞读取。
+    写满时丢弃最旧的数据（计为一次溢出），保证读出的总是最近的音频。
+    """
+    def __init__(self, max_seconds=2.0):
+        self.max_bytes = int(max_seconds * _BYTES_PER_SECOND)
+        self._data = bytearray()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.overruns = 0
+
+    def write(self, data):
+        with self._cond:
+            self._data += data
+            overflow = len(self._data) - self.max_bytes
+            if overflow > 0:
+                del self._data[:overflow]
+                self.overruns += 1
+            self._cond.notify()
+
+    def read(self, size, timeout=None):
+        """读取恰好 size 字节；超时返回None，缓冲区关闭时返回空字节串"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self._data) >= size or self._closed, timeout):
+                return None
+            if self._closed: return b""
+            chunk = bytes(self._data[:size])
+            del self._data[:size]
+            return chunk
+
+    def buffered_seconds(self):
+        with self._cond:
+            return len(self._data) / _BYTES_PER_SECOND
+
+    def clear(self):
+        with self._cond:
+            self._data.clear()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class CaptureSource:
+    """
+    采集源的基类。子类实现 start/read/is_healthy/stop，并通过 latency_s() 和 _cpu_seconds() 报告开销。
+    read(size, timeout) 返回 size 字节的PCM；timeout 秒内没有数据时返回None（卡顿），
+    采集结束或出错时返回空字节串。两种情况都由 CaptureSupervisor 决定如何重启。
+    有尽头的采集源（如不循环的回放文件）读完时先把 ended 置为True再返回空字节串，监管器据此结束采集而不是重启。
+    """
+    name = "base"
+    # 卡顿时是否重启：本地设备卡顿通常需要重新打开，远程麦克风没有数据则只是发送端没在发
+    restart_on_stall = True
+    ended = False
+
+    def __init__(self):
+        self._stats_at = None
+        self._stats_cpu = 0.0
+
+    def start(self):
+        raise NotImplementedError
+
+    def read(self, size, timeout=None):
+        raise NotImplementedError
+
+    def is_healthy(self):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def latency_s(self):
+        """从声音到达采集设备到能被 read() 读出的估计延迟（秒）"""
+        return 0.0
+
+    def _cpu_seconds(self):
+        """采集源自身（包括子进程/回调线程）累计消耗的CPU时间"""
+        return 0.0
+
+    def report_stats(self):
+        """把延迟和上次报告以来的CPU占用率写入 capture.<名称>.* 指标"""
+        now, cpu = time.monotonic(), self._cpu_seconds()
+        metrics.set_gauge(f"capture.{self.name}.latency_s", round(self.latency_s(), 4))
+        if self._stats_at is not None and now > self._stats_at:
+            metrics.set_gauge(f"capture.{self.name}.cpu_pct", round(100.0 * (cpu - self._stats_cpu) / (now - self._stats_at), 2))
+        self._stats_at, self._stats_cpu = now, cpu
+
+
+class ArecordFfmpegSource(CaptureSource):
+    """原有的 arecord | ffmpeg 子进程管道：arecord按设备原生采样率采集，ffmpeg重采样到16kHz"""
+    name = "arecord"
+
+    def __init__(self, device, native_rate):
+        super().__init__()
+        self.device = device
+        self.native_rate = native_rate
+        self.processes = None
+
+    def start(self):
+        buffer_us = int(config.CAPTURE_ARECORD_BUFFER_S * 1_000_000)
+        arecord_cmd = ["arecord", "-D", self.device, "-f", "S16_LE", "-r", str(self.native_rate), "-c", "1", "-t", "raw",
+                       "--buffer-time", str(buffer_us)]
+        ffmpeg_cmd = ["ffmpeg", "-f", "s16le", "-ar", str(self.native_rate), "-ac", "1", "-i", "-",
+                      "-ar", str(config.TARGET_RATE), "-ac", "1", "-f", "s16le", "-"]
+        log.info("[Audio] 准备启动实时重采样管道...")
+        try:
+            arecord_p = subprocess.Popen(arecord_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            ffmpeg_p = subprocess.Popen(ffmpeg_cmd, stdin=arecord_p.stdout, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            # 管道的读端已交给ffmpeg，父进程关闭自己的副本，这样ffmpeg退出时arecord能收到SIGPIPE
+            arecord_p.stdout.close()
+        except Exception as e:
+            log.error(f"❌ 启动音频管道失败: {e}"); return False
+        self.processes = (arecord_p, ffmpeg_p)
+        log.info("[Audio] ✅ 统一音频捕获管道已启动。")
+        return True
+
+    def read(self, size, timeout=None):
+        """用select等待管道数据，超过timeout仍未读满时视为卡顿"""
+        if not self.processes: return b""
+        fd = self.processes[1].stdout.fileno()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        data = bytearray()
+        try:
+            while len(data) < size:
+                wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+                if not select.select([fd], [], [], wait)[0]:
+                    return None
+                piece = os.read(fd, size - len(data))
+                if not piece: return b""
+                data += piece
+        except (OSError, ValueError):
+            return b""
+        return bytes(data)
+
+    def is_healthy(self):
+        if not self.processes: return False
+        if any(p.poll() is not None for p in self.processes):
+            log.info("[Audio-Health] 检测到音频管道进程已意外退出。")
+            return False
+        return True
+
+    def stop(self):
+        if not self.processes: return
+        for p in self.processes:
+            try:
+                p.kill(); p.wait(timeout=1)
+            except Exception as e:
+                log.error(f"[Audio] 清理管道进程时出错: {e}")
+        self.processes = None
+
+    def latency_s(self):
+        # arecord的ALSA缓冲 + ffmpeg重采样的一个分块
+        return config.CAPTURE_ARECORD_BUFFER_S + config.CHUNK_SIZE / _BYTES_PER_SECOND
+
+    def _cpu_seconds(self):
+        if not self.processes: return 0.0
+        return sum(_process_cpu_seconds(p.pid) for p in self.processes)
+
+
+class PyAudioSource(CaptureSource):
+    """PyAudio回调采集：PortAudio的回调线程直接把音频重采样后写入缓冲区，不需要任何子进程"""
+    name = "pyaudio"
+
+    def __init__(self, p_audio, device_index, native_rate):
+        super().__init__()
+        self.p_audio = p_audio
+        self.device_index = device_index
+        self.native_rate = native_rate
+        self.stream = None
+        self.buffer = PcmBuffer(config.CAPTURE_BUFFER_S)
+        self._ratecv_state = None
+        self._callback_cpu = 0.0
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        import pyaudio
+        started = time.thread_time()
+        if self.native_rate != config.TARGET_RATE:
+            in_data, self._ratecv_state = audioop.ratecv(in_data, 2, 1, self.native_rate, config.TARGET_RATE, self._ratecv_state)
+        self.buffer.write(in_data)
+        self._callback_cpu += time.thread_time() - started
+        return None, pyaudio.paContinue
+
+    def start(self):
+        import pyaudio
+        frames_per_buffer = int(self.native_rate * config.CHUNK_SIZE / _BYTES_PER_SECOND)
+        try:
+            self.stream = self.p_audio.open(format=pyaudio.paInt16, channels=1, rate=self.native_rate, input=True,
+                                            input_device_index=self.device_index, frames_per_buffer=frames_per_buffer,
+                                            stream_callback=self._callback)
+            self.stream.start_stream()
+        except Exception as e:
+            log.error(f"❌ 打开PyAudio输入流失败: {e}"); self.stream = None; return False
+        log.info(f"[Audio] ✅ PyAudio回调采集已启动 (设备 {self.device_index}, {self.native_rate}Hz)。")
+        return True
+
+    def read(self, size, timeout=None):
+        if not self.is_healthy(): return b""
+        return self.buffer.read(size, timeout)
+
+    def is_healthy(self):
+        return self.stream is not None and self.stream.is_active()
+
+    def stop(self):
+        self.buffer.close()
+        if self.stream:
+            try:
+                self.stream.stop_stream(); self.stream.close()
+            except Exception as e:
+                log.error(f"[Audio] 关闭PyAudio输入流时出错: {e}")
+            self.stream = None
+
+    def latency_s(self):
+        device_latency = self.stream.get_input_latency() if self.stream else 0.0
+        return device_latency + self.buffer.buffered_seconds()
+
+    def _cpu_seconds(self):
+        return self._callback_cpu
+
+
+class WavReplaySource(CaptureSource):
+    """
+    回放WAV文件作为麦克风输入，用于在没有声卡的机器上复现问题或做回归测试。
+    speed=1.0 按实时速度回放，speed>1 加速回放，speed<=0 不做节拍控制、尽快读出。
+    """
+    name = "wav"
+
+    def __init__(self, path, speed=1.0, loop=False):
+        super().__init__()
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.wav = None
+        self._started_at = None
+        self._bytes_out = 0
+        self._pending = b""
+        self._ratecv_state = None
+        self._cpu = 0.0
+
+    def start(self):
+        try:
+            self.wav = wave.open(self.path, "rb")
+        except (OSError, wave.Error) as e:
+            log.error(f"❌ 打开回放文件失败: {e}"); return False
+        if self.wav.getsampwidth() != 2:
+            log.error("❌ 回放文件必须是16bit PCM的WAV。"); self.wav.close(); self.wav = None; return False
+        self._started_at = time.monotonic()
+        self._bytes_out = 0
+        self._pending = b""
+        self._ratecv_state = None
+        log.info(f"[Audio] ✅ 开始回放 {os.path.basename(self.path)} (速度 x{self.speed})。")
+        return True
+
+    def _next_frames(self):
+        """从文件读取下一段音频并转换为16kHz单声道；文件结束时按需从头循环"""
+        frames = self.wav.readframes(self.wav.getframerate() // 10)
+        if not frames and self.loop:
+            self.wav.rewind(); self._ratecv_state = None
+            frames = self.wav.readframes(self.wav.getframerate() // 10)
+        if not frames: return b""
+        if self.wav.getnchannels() == 2: frames = audioop.tomono(frames, 2, 0.5, 0.5)
+        if self.wav.getframerate() != config.TARGET_RATE:
+            frames, self._ratecv_state = audioop.ratecv(frames, 2, 1, self.wav.getframerate(), config.TARGET_RATE, self._ratecv_state)
+        return frames
+
+    def read(self, size, timeout=None):
+        if not self.wav: return b""
+        started = time.thread_time()
+        while len(self._pending) < size:
+            frames = self._next_frames()
+            if not frames:
+                self.wav.close(); self.wav = None
+                self.ended = True
+                log.info("[Audio] 回放文件已读完。")
+                return b""
+            self._pending += frames
+        chunk, self._pending = self._pending[:size], self._pending[size:]
+        self._cpu += time.thread_time() - started
+        self._bytes_out += size
+        if self.speed > 0:
+            # 按回放速度控制节拍：第N个字节不早于 N/码率/速度 秒之后读出
+            due = self._started_at + self._bytes_out / _BYTES_PER_SECOND / self.speed
+            delay = due - time.monotonic()
+            if delay > 0: time.sleep(delay)
+        return chunk
+
+    def is_healthy(self):
+        return self.wav is not None
+
+    def stop(self):
+        if self.wav:
+            self.wav.close(); self.wav = None
+
+    def _cpu_seconds(self):
+        return self._cpu
+
+
+class NetworkPcmSource(CaptureSource):
+    """
+    远程麦克风：通过TCP或UDP接收原始PCM（s16le、单声道，采样率为 CAPTURE_NET_RATE）。
+    TCP同一时间只接受一个发送端，新的连接会替换旧的；UDP直接接收任意来源的数据报。
+    """
+    restart_on_stall = False
+
+    def __init__(self, protocol, host, port, rate=None):
+        super().__init__()
+        self.protocol = protocol
+        self.name = protocol
+        self.host = host
+        self.port = port
+        self.rate = rate or config.TARGET_RATE
+        self.buffer = PcmBuffer(config.CAPTURE_BUFFER_S)
+        self.sock = None
+        self.thread = None
+        self.running = False
+        self._ratecv_state = None
+        self._receiver_cpu = 0.0
+
+    def start(self):
+        kind = socket.SOCK_STREAM if self.protocol == "tcp" else socket.SOCK_DGRAM
+        try:
+            self.sock = socket.socket(socket.AF_INET, kind)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.sock.bind((self.host, self.port))
+            if self.protocol == "tcp": self.sock.listen(1)
+        except OSError as e:
+            log.error(f"❌ 监听远程麦克风端口失败: {e}")
+            if self.sock: self.sock.close()
+            self.sock = None; return False
+        self.port = self.sock.getsockname()[1]
+        self.buffer = PcmBuffer(config.CAPTURE_BUFFER_S)
+        self.running = True
+        target = self._tcp_loop if self.protocol == "tcp" else self._udp_loop
+        self.thread = threading.Thread(target=target, name=f"capture-{self.protocol}", daemon=True)
+        self.thread.start()
+        log.info(f"[Audio] ✅ 等待远程麦克风 ({self.protocol.upper()} {self.host}:{self.port})。")
+        return True
+
+    def _push(self, data):
+        started = time.thread_time()
+        if len(data) % 2: data = data[:-1]
+        if self.rate != config.TARGET_RATE:
+            data, self._ratecv_state = audioop.ratecv(data, 2, 1, self.rate, config.TARGET_RATE, self._ratecv_state)
+        self.buffer.write(data)
+        self._receiver_cpu += time.thread_time() - started
+
+    def _tcp_loop(self):
+        while self.running:
+            try:
+                conn, address = self.sock.accept()
+            except OSError:
+                break
+            log.info(f"[Audio] 远程麦克风已连接: {address[0]}:{address[1]}")
+            with conn:
+                while self.running:
+                    try:
+                        data = conn.recv(config.CHUNK_SIZE)
+                    except OSError:
+                        break
+                    if not data: break
+                    self._push(data)
+            log.info("[Audio] 远程麦克风已断开，等待重新连接...")
+
+    def _udp_loop(self):
+        while self.running:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                break
+            if data: self._push(data)
+
+    def read(self, size, timeout=None):
+        # 发送端暂时没有数据只算卡顿（返回None），只有采集源被停止时才返回空字节串
+        if not self.running: return b""
+        return self.buffer.read(size, timeout)
+
+    def is_healthy(self):
+        return self.running and self.thread is not None and self.thread.is_alive()
+
+    def stop(self):
+        self.running = False
+        self.buffer.close()
+        if self.sock:
+            try:
+                if self.protocol == "tcp": self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.sock.close(); self.sock = None
+        if self.thread: self.thread.join(timeout=1)
+
+    def latency_s(self):
+        return self.buffer.buffered_seconds()
+
+    def _cpu_seconds(self):
+        return self._receiver_cpu
+
+
+# 需要先用PyAudio探测输入设备和原生采样率的采集源，也只有它们可以同时打开一个热备实例
+DEVICE_SOURCES = ("arecord", "pyaudio")
+
+
+def create_capture_source(kind, arecord_device=None, p_audio=None, probed=None, net_port=None):
+    """
+    按名称创建采集源。
+
+    Args:
+        kind (str): arecord / pyaudio / wav / tcp / udp。
+        arecord_device (str): arecord 使用的ALSA设备。
+        p_audio: 已初始化的PyAudio实例（pyaudio 采集源需要）。
+        probed (tuple): (设备索引, 原生采样率)，设备类采集源需要。
+        net_port (int): tcp/udp 采集源的监听端口，未指定时使用 CAPTURE_NET_PORT。
+    """
+    if kind == "arecord":
+        return ArecordFfmpegSource(arecord_device, probed[1])
+    if kind == "pyaudio":
+        return PyAudioSource(p_audio, probed[0], probed[1])
+    if kind == "wav":
+        return WavReplaySource(config.CAPTURE_WAV_PATH, config.CAPTURE_WAV_SPEED, config.CAPTURE_WAV_LOOP)
+    if kind in ("tcp", "udp"):
+        return NetworkPcmSource(kind, config.CAPTURE_NET_HOST, config.CAPTURE_NET_PORT if net_port is None else net_port, config.CAPTURE_NET_RATE)
+    raise ValueError(f"未知的采集源: {kind}")
@@ -0,0 +1,186 @@
+# smart_speaker/capture_supervisor.py
+import threading
+import time
+
+import config
+from .metrics import metrics
+from .flight_recorder import flight_recorder
+from .log import get_logger
+
+log = get_logger(__name__)
+
+
+class CaptureSupervisor:
+    """
+    监管一个采集源，对外提供“永不断流”的 read()。
+
+    - 卡顿检测：超过 CAPTURE_STALL_MS 毫秒没有读到任何数据即视为故障，而不只是等进程退出；
+    - 指数退避重启：第一次重试只等几十毫秒，连续失败时逐步加倍到 CAPTURE_BACKOFF_MAX_S；
+    - 设备缓存：重启时沿用上次探测到的设备和原生采样率，连续失败若干次后才重新探测；
+    - 热备（可选）：后台保持一个已经打开的备用采集源（必须是能与主采集源同时打开的设备），故障时直接切换，几乎没有间隙；
+    - 每次故障的失聪时长（最后一次读到数据 -> 新采集源读到第一块数据）记录在 capture.deaf_s 指标中。
+
+    Args:
+        create_source (callable): create_source(reprobe) 创建一个尚未启动的采集源，失败时返回None。
+        session_id (str): 所属会话，用于飞行记录仪标记。
+        create_standby (callable): create_standby() 创建一个尚未启动的热备采集源；为None时不使用热备。
+    """
+    def __init__(self, create_source, session_id="default", create_standby=None):
+        self.create_source = create_source
+        self.create_standby = create_standby
+        self.session_id = session_id
+        self.standby_enabled = create_standby is not None
+        self.active = None
+        self.standby = None
+        self.generation = 0       # 每次换用新的采集源时加一，读取方据此重置自己的缓冲状态
+        self.running = False
+        self.ended = False        # 采集源正常读完（如回放文件结束），不再重启
+        self._stopped = threading.Event()
+        self._standby_lock = threading.Lock()
+        self._standby_thread = None
+        self._backoff_s = config.CAPTURE_BACKOFF_MIN_S
+        self._failures = 0
+        self._last_data_at = None
+        self._deaf_since = None
+        self._active_since = None
+
+    def start(self):
+        self.running = True
+        self.ended = False
+        self._stopped.clear()
+        # 首次启动不算故障，但从启动到读到第一块数据的时间同样记为失聪时长
+        self._deaf_since = time.monotonic()
+        self._open_active()
+        self._ensure_standby()
+
+    def stop(self):
+        self.running = False
+        self._stopped.set()
+        for source in (self.active, self.standby):
+            if source: source.stop()
+        if self._standby_thread: self._standby_thread.join(timeout=1)
+        self.active = self.standby = None
+
+    def report_stats(self):
+        if self.active: self.active.report_stats()
+
+    def read(self, size):
+        """读取一块PCM；采集源故障时在内部完成切换或重启，只有被停止或采集源读完时才返回空字节串"""
+        while self.running:
+            source = self.active
+            if source is None:
+                self._open_active(); continue
+            chunk = source.read(size, config.CAPTURE_STALL_MS / 1000)
+            if chunk:
+                self._on_data()
+                return chunk
+            if not self.running: break
+            if chunk == b"" and source.ended:
+                log.info("[Capture] 采集源已读完，停止采集。")
+                self.ended = True
+                self.stop()
+                break
+            if chunk is None and not source.restart_on_stall:
+                continue
+            self._fail_over("卡顿" if chunk is None else "采集结束")
+        return b""
+
+    def _on_data(self):
+        now = time.monotonic()
+        self._last_data_at = now
+        if self._deaf_since is not None:
+            deaf_s = now - self._deaf_since
+            self._deaf_since = None
+            metrics.observe("capture.deaf_s", deaf_s)
+            if self.generation > 1:
+                log.info(f"[Capture] ✅ 采集已恢复，本次失聪 {deaf_s * 1000:.0f}ms。")
+                flight_recorder.mark(f"capture:recovered:{deaf_s * 1000:.0f}ms", self.session_id)
+        # 采集源稳定工作一段时间后才重置退避，避免设备反复“能读一块就坏”时频繁重启
+        if self._active_since and now - self._active_since >= config.CAPTURE_BACKOFF_RESET_S:
+            self._backoff_s = config.CAPTURE_BACKOFF_MIN_S
+            self._failures = 0
+
+    def _fail_over(self, reason):
+        now = time.monotonic()
+        self._deaf_since = self._last_data_at or now
+        metrics.inc("capture.incidents")
+        flight_recorder.mark(f"capture:{reason}", self.session_id)
+        log.info(f"[Capture] 检测到采集源{reason}，正在切换...")
+        if self.active: self.active.stop()
+        self.active = None
+
+        with self._standby_lock:
+            standby, self.standby = self.standby, None
+        # 等热备线程读完手头这一块再接管，避免两个线程同时读同一个管道把采样切错位（最多一个分块的间隙）
+        if self._standby_thread: self._standby_thread.join(timeout=config.CAPTURE_STALL_MS / 1000 + 0.1)
+        if standby and self._standby_thread.is_alive():
+            # 热备线程仍阻塞在读取上，接管会与它争读同一个管道；放弃这个热备，停止它以唤醒热备线程
+            log.warning("[Capture] 热备线程未能及时让出热备采集源，放弃热备并重新打开采集源。")
+            standby.stop(); standby = None
+            self._standby_thread.join(timeout=1)
+        if standby and standby.is_healthy():
+            metrics.inc("capture.standby_promoted")
+            self._promote(standby)
+            log.info("[Capture] 已切换到热备采集源。")
+        else:
+            if standby: standby.stop()
+            self._open_active()
+        self._ensure_standby()
+
+    def _promote(self, source):
+        self.active = source
+        self.generation += 1
+        self._active_since = time.monotonic()
+
+    def _open_active(self):
+        """按指数退避反复尝试打开新的采集源，直到成功或被停止"""
+        while self.running:
+            if self.generation > 0 or self._failures > 0:
+                # 第一次打开不等待；之后每次重试前按退避时间等待（可被stop()立即打断）
+                if self._stopped.wait(self._backoff_s): return
+                self._backoff_s = min(self._backoff_s * 2, config.CAPTURE_BACKOFF_MAX_S)
+            reprobe = self._failures >= config.CAPTURE_REPROBE_AFTER_FAILURES
+            source = self.create_source(reprobe)
+            if source and source.start():
+                self._promote(source)
+                return
+            self._failures += 1
+            metrics.inc("capture.restart_failures")
+            log.error(f"[Capture-Error] 采集源启动失败（连续 {self._failures} 次），{self._backoff_s * 1000:.0f}ms 后重试。")
+
+    def _ensure_standby(self):
+        """在后台打开热备采集源，并持续读出丢弃它的数据，保持它是最新且健康的"""
+        if not self.standby_enabled or not self.running: return
+        if self._standby_thread and self._standby_thread.is_alive(): return
+        self._standby_thread = threading.Thread(target=self._standby_loop, name=f"capture-standby-{self.session_id}", daemon=True)
+        self._standby_thread.start()
+
+    def _standby_loop(self):
+        announced = None
+        while self.running:
+            with self._standby_lock:
+                standby = self.standby
+            if standby is None:
+                standby = self.create_standby()
+                if not standby or not standby.start():
+                    # 热备只是锦上添花，打开失败时隔一段时间再试
+                    if self._stopped.wait(config.CAPTURE_BACKOFF_MAX_S): return
+                    continue
+                with self._standby_lock:
+                    self.standby = standby
+            if standby.read(config.CHUNK_SIZE, config.CAPTURE_STALL_MS / 1000) in (None, b""):
+                with self._standby_lock:
+                    # 已经被提升为主采集源时不要停止它
+                    if self.standby is not standby: return
+                    self.standby = None
+                standby.stop()
+                # 热备设备打不开（如被占用）时arecord会立即退出，等一段时间再重建，避免反复创建进程
+                log.warning("[Capture] 热备采集源读取失败，稍后重建。")
+                if self._stopped.wait(config.CAPTURE_BACKOFF_MAX_S): return
+                continue
+            if announced is not standby:
+                # 读到数据才算就绪：设备被占用时arecord能启动但读不出数据
+                log.info("[Capture] 热备采集源已就绪。")
+                announced = standby
+            with self._standby_lock:
+                if self.standby is not standby: return
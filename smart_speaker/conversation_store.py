@@ -0,0 +1,165 @@
+# smart_speaker/conversation_store.py
+import json
+import os
+import threading
+import time
+import uuid
+
+import config
+from .log import get_logger
+
+log = get_logger(__name__)
+
+
+class ConversationStore:
+    """
+    一个会话（房间）的对话状态：内存中只保留最近的若干条消息，每条消息同时追加写入磁盘上的分段JSONL日志。
+
+    日志格式（每行一条记录）:
+      {"t": 时间戳, "conv": 对话ID, "role": "user"/"assistant", "content": ...}
+      {"t": ..., "conv": ..., "event": "reset"}                     开启新会话
+      {"t": ..., "conv": ..., "event": "checkpoint", "window": [...]}  当前窗口的快照
+    当前分段超过 CONVERSATION_SEGMENT_BYTES 时做一次压缩：旧分段归档，新分段以当前窗口的快照开头，
+    只保留最近 CONVERSATION_ARCHIVE_SEGMENTS 个归档分段。
+    因此启动时只需从当前分段末尾向前读到窗口填满、重置记录或快照为止，恢复开销与窗口大小成正比，与历史总长度无关。
+    """
+    def __init__(self, session_id, system_prompt, directory=None, window=None):
+        self.session_id = session_id
+        self.system_message = {"role": "system", "content": system_prompt}
+        self.directory = directory or config.CONVERSATION_DIR
+        self.window = window or config.CONVERSATION_WINDOW_MESSAGES
+        self.path = os.path.join(self.directory, f"conversation_{session_id}.jsonl")
+        self.conversation_id = None
+        self._messages = []
+        self._history_json = None
+        self._lock = threading.Lock()
+        self._file = None
+        os.makedirs(self.directory, exist_ok=True)
+        self._restore()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    # --- 读取 ---
+    def messages(self):
+        """发给LLM的消息列表：人设 + 最近的对话窗口（返回新列表，调用方可以自由追加）"""
+        with self._lock:
+            return [self.system_message] + self._messages
+
+    def history(self):
+        """面板显示用的对话历史（不含人设）"""
+        with self._lock:
+            return list(self._messages)
+
+    def history_json(self):
+        """history() 的JSON编码，在两次修改之间缓存，面板每次连接都不必重新编码"""
+        with self._lock:
+            if self._history_json is None:
+                self._history_json = json.dumps(self._messages)
+            return self._history_json
+
+    # --- 写入 ---
+    def append(self, role, content):
+        with self._lock:
+            message = {"role": role, "content": content}
+            self._messages.append(message)
+            self._trim()
+            self._history_json = None
+            self._write({"t": time.time(), "conv": self.conversation_id, **message})
+
+    def reset(self):
+        """开启新会话：清空窗口，并在日志中记录一次重置"""
+        with self._lock:
+            self._messages = []
+            self._history_json = None
+            self.conversation_id = uuid.uuid4().hex[:12]
+            self._write({"t": time.time(), "conv": self.conversation_id, "event": "reset"})
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def _trim(self):
+        """只保留最近 window 条消息，并保证窗口以用户消息开头（保持user/assistant交替）"""
+        if len(self._messages) <= self.window: return
+        del self._messages[:len(self._messages) - self.window]
+        while self._messages and self._messages[0]["role"] != "user":
+            del self._messages[0]
+
+    def _write(self, record):
+        if not self._file: return
+        try:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            if self._file.tell() > config.CONVERSATION_SEGMENT_BYTES:
+                self._compact()
+        except OSError as e:
+            log.error(f"❌ [Conversation] 写入对话日志失败: {e}")
+
+    def _compact(self):
+        """归档当前分段，新分段以当前窗口的快照开头，并删除过旧的归档"""
+        self._file.close()
+        os.replace(self.path, f"{self.path[:-len('.jsonl')]}.{time.time_ns()}.jsonl")
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps({"t": time.time(), "conv": self.conversation_id, "event": "checkpoint",
+                                     "window": self._messages}, ensure_ascii=False) + "\n")
+        self._file.flush()
+        prefix = os.path.basename(self.path)[:-len(".jsonl")] + "."
+        archives = sorted(name for name in os.listdir(self.directory)
+                          if name.startswith(prefix) and name.endswith(".jsonl") and name != os.path.basename(self.path))
+        for name in archives[:max(0, len(archives) - config.CONVERSATION_ARCHIVE_SEGMENTS)]:
+            os.remove(os.path.join(self.directory, name))
+        log.info(f"[Conversation] 会话 '{self.session_id}' 的对话日志已压缩，保留 {min(len(archives), config.CONVERSATION_ARCHIVE_SEGMENTS)} 个归档分段。")
+
+    # --- 启动恢复 ---
+    def _restore(self):
+        """从当前分段末尾向前读取，恢复最后一次对话的最近窗口"""
+        collected = []
+        for record in self._read_backwards():
+            if self.conversation_id is None: self.conversation_id = record.get("conv")
+            if record.get("conv") != self.conversation_id: break
+            event = record.get("event")
+            if event == "reset": break
+            if event == "checkpoint":
+                collected.extend(reversed(record.get("window", [])))
+                break
+            if "role" in record:
+                collected.append({"role": record["role"], "content": record["content"]})
+                if len(collected) >= self.window: break
+        self._messages = list(reversed(collected))
+        self._trim()
+        while self._messages and self._messages[0]["role"] != "user":
+            del self._messages[0]
+        if self.conversation_id is None:
+            self.conversation_id = uuid.uuid4().hex[:12]
+        if self._messages:
+            log.info(f"[Conversation] 已为会话 '{self.session_id}' 恢复 {len(self._messages)} 条历史消息。")
+
+    def _read_backwards(self, block_size=8192):
+        """从文件末尾按块向前读取，逐条产出解析后的记录（最新的在前），跳过损坏的行"""
+        if not os.path.exists(self.path): return
+        with open(self.path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            remainder = b""
+            while position > 0:
+                read_size = min(block_size, position)
+                position -= read_size
+                f.seek(position)
+                lines = (f.read(read_size) + remainder).split(b"\n")
+                # 第一行可能不完整，留到读取前一块时再拼接
+                remainder = lines.pop(0)
+                for line in reversed(lines):
+                    record = self._parse(line)
+                    if record is not None: yield record
+            record = self._parse(remainder)
+            if record is not None: yield record
+
+    @staticmethod
+    def _parse(line):
+        if not line.strip(): return None
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        return record if isinstance(record, dict) else None
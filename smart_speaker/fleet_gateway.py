@@ -0,0 +1,474 @@
+# smart_speaker/fleet_gateway.py
+# 车队网关：局域网内多台音箱共用的本地代理服务（可选）。设备把LLM、ASR、TTS和音乐接口的地址指向网关，
+# 网关通过一个预热过的共享连接池访问云端，共享TTS音频缓存和音乐元数据缓存，
+# 把相同的并发请求合并为一次上游调用，并按来源地址限流。协议与云端接口一致，设备端除地址外无需改动。
+import gzip
+import hashlib
+import hmac
+import json
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from flask import Flask, Response, jsonify, redirect, request
+from flask_sock import Sock
+
+import config
+from .http_client import install_dns_cache
+from .rate_limiter import KeyedRateLimiter
+from .metrics import metrics
+from .log import get_logger
+
+log = get_logger(__name__)
+
+# TTS二进制协议的消息类型
+_TTS_AUDIO_ONLY = 0b1011
+_TTS_ERROR = 0b1111
+_TTS_LAST_FLAGS = (0b0010, 0b0011)
+
+
+class SharedStream:
+    """
+    一次上游调用的输出，可以被多个下游请求同时读取：每个订阅者都从头读起，之后等待新的内容直到关闭。
+    所有订阅者都离开后 abandoned 为True，生产者据此提前结束上游调用。
+    """
+    def __init__(self):
+        self.items = []
+        self.done = False
+        self.error = None
+        self._subscribers = 0
+        self._cond = threading.Condition()
+
+    @property
+    def abandoned(self):
+        return self._subscribers == 0
+
+    def put(self, item):
+        with self._cond:
+            self.items.append(item)
+            self._cond.notify_all()
+
+    def close(self, error=None):
+        with self._cond:
+            self.error = self.error or error
+            self.done = True
+            self._cond.notify_all()
+
+    def subscribe(self):
+        with self._cond:
+            self._subscribers += 1
+        return self._iterate()
+
+    def _iterate(self):
+        index = 0
+        try:
+            while True:
+                with self._cond:
+                    while index >= len(self.items) and not self.done:
+                        self._cond.wait()
+                    if index >= len(self.items): return
+                    item = self.items[index]
+                index += 1
+                yield item
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+
+class Coalescer:
+    """
+    合并相同key的并发请求：第一个请求在后台线程中调用上游，之后到达的相同请求直接订阅它的输出。
+    上游调用在独立线程中完成，发起它的设备中途断开不会影响其他订阅者和缓存。
+    """
+    def __init__(self, kind):
+        self.kind = kind
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def join(self, key, producer):
+        """
+        Args:
+            key: 请求的合并键。
+            producer (callable): producer(stream) 调用上游并把结果写入 stream，异常会被记录到 stream.error。
+
+        Returns:
+            iterator: 已订阅的输出迭代器（必须在离开前迭代完或关闭）。
+            SharedStream: 对应的共享输出，读完后可以检查 error。
+        """
+        with self._lock:
+            stream = self._inflight.get(key)
+            if stream is not None:
+                metrics.inc(f"gateway.{self.kind}.coalesced")
+                return stream.subscribe(), stream
+            stream = self._inflight[key] = SharedStream()
+            # 先订阅再启动生产者，避免生产者在第一个订阅者到来前就认为无人需要
+            items = stream.subscribe()
+
+        def run():
+            error = None
+            try:
+                producer(stream)
+            except Exception as e:
+                error = e
+                metrics.inc(f"gateway.{self.kind}.upstream_errors")
+                log.error(f"❌ [Gateway] {self.kind} 上游请求失败: {e}")
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                stream.close(error)
+
+        metrics.inc(f"gateway.{self.kind}.upstream")
+        threading.Thread(target=run, name=f"gateway-{self.kind}", daemon=True).start()
+        return items, stream
+
+
+class ByteLRUCache:
+    """按总字节数限制容量的LRU缓存，值为字节串列表（例如TTS的原始响应帧）"""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None: self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        size = sum(len(part) for part in value)
+        if size > self.max_bytes: return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None: self.size -= sum(len(part) for part in old)
+            self._entries[key] = value
+            self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= sum(len(part) for part in evicted)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TTLCache:
+    """条目数有上限、按写入时间过期的缓存（音乐搜索结果和播放地址）"""
+    def __init__(self, ttl_s, max_entries):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None: return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl_s, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FleetGateway:
+    """
+    车队网关服务。路由与云端接口一一对应：
+        POST /llm/v1/<path>      → GATEWAY_LLM_UPSTREAM（SSE原样转发，相同请求体合并；只转发设备凭据，或凭共享令牌使用网关密钥）
+        POST /asr/<op>           → GATEWAY_ASR_UPSTREAM（submit / query）
+        WS   /tts/ws_binary      → GATEWAY_TTS_UPSTREAM（音频按 声音+编码+文本 缓存，相同请求合并）
+        GET  /music/search       → GATEWAY_MUSIC_SEARCH_UPSTREAM（结果缓存 GATEWAY_MUSIC_SEARCH_TTL_S）
+        GET  /music/song/<id>.mp3 → 302到解析好的真实播放地址（缓存 GATEWAY_MUSIC_URL_TTL_S）
+        GET  /metrics            → 网关指标
+    """
+    def __init__(self):
+        install_dns_cache()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_HOSTS, pool_maxsize=config.GATEWAY_POOL_MAXSIZE, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.limiter = KeyedRateLimiter(config.GATEWAY_DEVICE_RATE_PER_S, config.GATEWAY_DEVICE_BURST, gauge="gateway.clients")
+        self.tts_cache = ByteLRUCache(config.GATEWAY_TTS_CACHE_MB * 1024 * 1024)
+        self.search_cache = TTLCache(config.GATEWAY_MUSIC_SEARCH_TTL_S, config.GATEWAY_MUSIC_CACHE_ENTRIES)
+        self.song_url_cache = TTLCache(config.GATEWAY_MUSIC_URL_TTL_S, config.GATEWAY_MUSIC_CACHE_ENTRIES)
+        self.coalescers = {kind: Coalescer(kind) for kind in ("llm", "tts", "music_search", "music_url")}
+        self.app = Flask(__name__, static_folder=None)
+        self.sock = Sock(self.app)
+        self._register_routes()
+
+    # --- 上游连接池 ---
+
+    def _upstream(self, kind, method, url, **kwargs):
+        kwargs.setdefault("timeout", config.GATEWAY_TIMEOUT)
+        start_time = time.monotonic()
+        response = self.session.request(method, url, **kwargs)
+        metrics.observe(f"gateway.{kind}.upstream_latency_s", time.monotonic() - start_time)
+        return response
+
+    def warm_up(self):
+        """为每个HTTP上游主机预先建立 GATEWAY_WARM_CONNECTIONS 条长连接（只为完成TCP/TLS握手，状态码无所谓）"""
+        upstreams = {config.GATEWAY_LLM_UPSTREAM, config.GATEWAY_ASR_UPSTREAM, config.GATEWAY_MUSIC_SEARCH_UPSTREAM}
+        hosts = {f"{urlsplit(url).scheme}://{urlsplit(url).netloc}/" for url in upstreams}
+        count = config.GATEWAY_WARM_CONNECTIONS
+        if count <= 0: return
+
+        def touch(url):
+            try:
+                self.session.head(url, timeout=config.GATEWAY_TIMEOUT).close()
+                return True
+            except requests.RequestException as e:
+                log.warning(f"[Gateway-Warn] 预热连接 {url} 失败: {e}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=count * len(hosts)) as executor:
+            warmed = sum(executor.map(touch, [host for host in hosts for _ in range(count)]))
+        log.info(f"[Gateway] ✅ 已为 {len(hosts)} 个上游主机预热 {warmed} 条连接。")
+
+    # --- 路由 ---
+
+    def _register_routes(self):
+        app = self.app
+        app.before_request(self._rate_limit)
+        app.add_url_rule("/metrics", view_func=self.metrics_endpoint)
+        app.add_url_rule("/llm/v1/<path:subpath>", view_func=self.llm_proxy, methods=["POST"])
+        app.add_url_rule("/asr/<op>", view_func=self.asr_proxy, methods=["POST"])
+        app.add_url_rule("/music/search", view_func=self.music_search)
+        app.add_url_rule("/music/song/<int:song_id>.mp3", view_func=self.music_song)
+        self.sock.route("/tts/ws_binary")(self.tts_proxy)
+
+    def _rate_limit(self):
+        if request.path == "/metrics": return None
+        # 按来源地址限流；X-Device-Id 由客户端自己填写，只用于日志
+        retry_after = self.limiter.check(request.remote_addr)
+        if retry_after is None: return None
+        metrics.inc("gateway.rate_limited")
+        log.warning(f"[Gateway-Warn] {request.remote_addr} (设备 {request.headers.get('X-Device-Id', '未知')}) 请求过于频繁，已限流。")
+        return jsonify({"error": "rate limited", "retry_after": round(retry_after, 2)}), 429, {"Retry-After": str(max(1, round(retry_after)))}
+
+    def metrics_endpoint(self):
+        metrics.set_gauge("gateway.tts_cache.entries", len(self.tts_cache))
+        metrics.set_gauge("gateway.tts_cache.bytes", self.tts_cache.size)
+        metrics.set_gauge("gateway.music_search_cache.entries", len(self.search_cache))
+        metrics.set_gauge("gateway.music_url_cache.entries", len(self.song_url_cache))
+        return jsonify(metrics.snapshot())
+
+    # --- LLM ---
+
+    def llm_proxy(self, subpath):
+        metrics.inc("gateway.llm.requests")
+        body = request.get_data()
+        authorization = self._llm_authorization()
+        if authorization is None:
+            metrics.inc("gateway.llm.unauthorized")
+            return jsonify({"error": "missing credentials"}), 401
+        headers = {"Authorization": authorization, "Content-Type": request.headers.get("Content-Type", "application/json"),
+                   "Accept": request.headers.get("Accept", "text/event-stream")}
+        url = f"{config.GATEWAY_LLM_UPSTREAM.rstrip('/')}/{subpath}"
+
+        def produce(stream):
+            with self._upstream("llm", "POST", url, data=body, headers=headers, stream=True) as response:
+                stream.put((response.status_code, response.headers.get("Content-Type", "application/json")))
+                for chunk in response.iter_content(chunk_size=None):
+                    # 所有设备都已离开（例如被打断）时尽早关闭上游连接，不再消耗token
+                    if stream.abandoned: return
+                    stream.put(chunk)
+
+        items, stream = self.coalescers["llm"].join((authorization, subpath, body), produce)
+        return self._stream_response(items, stream)
+
+    @staticmethod
+    def _llm_authorization():
+        """
+        设备自己带了密钥就原样转发；没有带时，只有出示了车队共享令牌 (GATEWAY_TOKEN) 才使用网关自己的密钥，
+        否则返回None——网关监听在局域网上，不能让任何客户端免费用网关的付费密钥。
+        """
+        if request.headers.get("Authorization"):
+            return request.headers["Authorization"]
+        supplied = request.headers.get("X-Gateway-Token", "")
+        if config.GATEWAY_TOKEN and config.ARK_API_KEY and hmac.compare_digest(supplied.encode(), config.GATEWAY_TOKEN.encode()):
+            return f"Bearer {config.ARK_API_KEY}"
+        return None
+
+    @staticmethod
+    def _stream_response(items, stream):
+        """第一项是 (状态码, Content-Type)，其余为原样转发的响应体"""
+        head = next(items, None)
+        if head is None:
+            items.close()
+            return jsonify({"error": f"upstream failed: {stream.error}"}), 502
+        status, content_type = head
+        return Response(items, status=status, content_type=content_type)
+
+    # --- ASR ---
+
+    def asr_proxy(self, op):
+        # 录音仍由设备直接上传到TOS（ASR服务按公网URL拉取音频），这里只转发提交和查询
+        if op not in ("submit", "query"):
+            return jsonify({"error": "unknown operation"}), 404
+        metrics.inc("gateway.asr.requests")
+        headers = {"Content-Type": request.headers.get("Content-Type", "application/json")}
+        if request.headers.get("Authorization"): headers["Authorization"] = request.headers["Authorization"]
+        try:
+            response = self._upstream("asr", "POST", f"{config.GATEWAY_ASR_UPSTREAM.rstrip('/')}/{op}",
+                                      data=request.get_data(), headers=headers)
+        except requests.RequestException as e:
+            metrics.inc("gateway.asr.upstream_errors")
+            log.error(f"❌ [Gateway] ASR 上游请求失败: {e}")
+            return jsonify({"error": f"upstream failed: {e}"}), 502
+        return Response(response.content, status=response.status_code,
+                        content_type=response.headers.get("Content-Type", "application/json"))
+
+    # --- 音乐 ---
+
+    def music_search(self):
+        metrics.inc("gateway.music_search.requests")
+        key = request.query_string.decode()
+        cached = self.search_cache.get(key)
+        if cached is not None:
+            metrics.inc("gateway.music_search.cache_hit")
+            return Response(cached[1], status=200, content_type=cached[0])
+        headers = {"User-Agent": request.headers.get("User-Agent", "")}
+
+        def produce(stream):
+            response = self._upstream("music_search", "GET", f"{config.GATEWAY_MUSIC_SEARCH_UPSTREAM}?{key}", headers=headers)
+            content_type = response.headers.get("Content-Type", "application/json")
+            if response.status_code == 200: self.search_cache.put(key, (content_type, response.content))
+            stream.put((response.status_code, content_type))
+            stream.put(response.content)
+
+        items, stream = self.coalescers["music_search"].join(key, produce)
+        return self._stream_response(items, stream)
+
+    def music_song(self, song_id):
+        """播放地址：把云端的302跳转链在网关解析一次并缓存，设备只需再跟随一次跳转"""
+        metrics.inc("gateway.music_url.requests")
+        final_url = self.song_url_cache.get(song_id)
+        if final_url is not None:
+            metrics.inc("gateway.music_url.cache_hit")
+            return redirect(final_url, 302)
+        headers = {"User-Agent": request.headers.get("User-Agent", "")}
+
+        def produce(stream):
+            url = config.GATEWAY_MUSIC_SONG_UPSTREAM.format(song_id)
+            for _ in range(5):
+                with self._upstream("music_url", "GET", url, headers=headers, allow_redirects=False, stream=True) as response:
+                    if not response.is_redirect: break
+                    response.content  # 读完重定向响应体，让连接可以被复用
+                    url = urljoin(url, response.headers["location"])
+            self.song_url_cache.put(song_id, url)
+            stream.put(url)
+
+        items, stream = self.coalescers["music_url"].join(song_id, produce)
+        final_url = next(items, None)
+        items.close()
+        if final_url is None:
+            return jsonify({"error": f"upstream failed: {stream.error}"}), 502
+        return redirect(final_url, 302)
+
+    # --- TTS ---
+
+    def tts_proxy(self, ws):
+        metrics.inc("gateway.tts.requests")
+        message = ws.receive(timeout=config.GATEWAY_TIMEOUT[0])
+        if not isinstance(message, bytes): return
+        try:
+            payload = _parse_tts_request(message)
+            text = payload["request"]["text"]
+        except (ValueError, KeyError, IndexError, struct.error) as e:
+            ws.send(_tts_error_frame(45000001, f"invalid request: {e}"))
+            return
+        # reqid每次不同，不参与缓存键；声音、编码、采样率等全部音频参数都参与。
+        # 凭据（Authorization和appid/token）的摘要也参与：凭据无效的设备不能借用别人的合成结果
+        authorization = request.headers.get("Authorization", "")
+        key = json.dumps([_credential_digest(authorization, payload.get("app", {})), payload.get("app", {}).get("cluster"),
+                          payload.get("audio"), text], sort_keys=True, ensure_ascii=False)
+        cached = self.tts_cache.get(key)
+        if cached is not None:
+            metrics.inc("gateway.tts.cache_hit")
+            for frame in cached: ws.send(frame)
+            return
+
+        cacheable = len(text) <= config.GATEWAY_TTS_CACHE_MAX_CHARS and payload["request"].get("operation") == "submit"
+
+        def produce(stream):
+            self._synthesize(message, authorization, stream)
+            if cacheable and stream.items and _is_last_audio_frame(stream.items[-1]):
+                self.tts_cache.put(key, list(stream.items))
+
+        items, stream = self.coalescers["tts"].join(key, produce)
+        try:
+            for frame in items: ws.send(frame)
+        finally:
+            items.close()
+        if stream.error is not None:
+            ws.send(_tts_error_frame(55000001, f"gateway upstream failed: {stream.error}"))
+
+    def _synthesize(self, message, authorization, stream):
+        """按云端协议合成一句话（每条WebSocket连接只处理一次合成），把原始响应帧依次写入 stream"""
+        import websocket
+        start_time = time.monotonic()
+        upstream = websocket.create_connection(config.GATEWAY_TTS_UPSTREAM, header=[f"Authorization: {authorization}"],
+                                               timeout=config.GATEWAY_TIMEOUT[1])
+        try:
+            upstream.send_binary(message)
+            first = True
+            while not stream.abandoned:
+                frame = upstream.recv()
+                if not isinstance(frame, bytes): continue
+                if first:
+                    metrics.observe("gateway.tts.upstream_latency_s", time.monotonic() - start_time)
+                    first = False
+                stream.put(frame)
+                msg_type = (frame[1] >> 4) & 0xF if len(frame) >= 4 else None
+                if msg_type == _TTS_ERROR or _is_last_audio_frame(frame): return
+        finally:
+            upstream.close()
+
+    # --- 运行 ---
+
+    def serve(self, host=None, port=None):
+        """在当前线程运行（多线程werkzeug服务器，LLM流式响应需要每个请求一个线程）"""
+        host = host or config.GATEWAY_HOST
+        port = config.GATEWAY_PORT if port is None else port
+        threading.Thread(target=self.warm_up, name="gateway-warmup", daemon=True).start()
+        log.info(f"[Gateway] 车队网关已在 http://{host}:{port} 启动。")
+        self.app.run(host=host, port=port, debug=False, use_reloader=False, threaded=True)
+
+
+def _parse_tts_request(message):
+    """解析设备发来的TTS请求帧：Header(头长度×4字节) + Size(4) + JSON负载（可能gzip压缩）"""
+    header_size = (message[0] & 0x0F) * 4
+    payload_size = struct.unpack(">I", message[header_size:header_size + 4])[0]
+    payload = message[header_size + 4:header_size + 4 + payload_size]
+    if message[2] & 0x0F == 1: payload = gzip.decompress(payload)
+    return json.loads(payload)
+
+
+def _credential_digest(authorization, app):
+    """TTS请求所用凭据的摘要，用作缓存键和合并键的一部分（键里不保存明文令牌）"""
+    credential = json.dumps([authorization, app.get("appid"), app.get("token")], ensure_ascii=False)
+    return hashlib.sha256(credential.encode("utf-8")).hexdigest()
+
+
+def _is_last_audio_frame(frame):
+    return len(frame) >= 4 and (frame[1] >> 4) & 0xF == _TTS_AUDIO_ONLY and frame[1] & 0xF in _TTS_LAST_FLAGS
+
+
+def _tts_error_frame(code, text):
+    body = text.encode("utf-8")
+    header = (1 << 28) | (1 << 24) | (_TTS_ERROR << 20)
+    return struct.pack(">III", header, code, len(body)) + body
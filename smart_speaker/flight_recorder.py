@@ -0,0 +1,231 @@
+# smart_speaker/flight_recorder.py
+# 音频"黑匣子"：把最近N分钟的麦克风PCM、TTS输出和轮次/状态标记写入固定大小的内存映射环形文件。
+# 写入只是对映射内存的一次拷贝（由内核按需回写），热路径上没有任何系统调用，磁盘占用恒定；
+# 进程崩溃或重启后，文件中的内容依然可以导出，用于复现误唤醒、延迟等问题。
+import io
+import mmap
+import os
+import struct
+import subprocess
+import threading
+import time
+import wave
+
+import config
+from .log import get_logger
+
+log = get_logger(__name__)
+
+_MAGIC = b"FLTREC01"
+_HEADER = struct.Struct("<8sQIQQ")   # magic, 数据区大小, 索引槽数, 累计写入字节数, 累计索引记录数
+_RECORD = struct.Struct("<dQII")     # 时间戳, 数据起始位置(累计字节数), 长度, 编码
+_HEADER_SIZE = 64
+
+ENCODING_PCM = 0
+ENCODING_MP3 = 1
+ENCODING_OGG_OPUS = 2
+ENCODING_WAV = 3
+_ENCODING_CODES = {"pcm": ENCODING_PCM, "mp3": ENCODING_MP3, "ogg_opus": ENCODING_OGG_OPUS, "wav": ENCODING_WAV}
+_FFMPEG_FORMATS = {ENCODING_MP3: "mp3", ENCODING_OGG_OPUS: "ogg", ENCODING_WAV: "wav"}
+
+
+class RingFile:
+    """
+    一个内存映射的环形文件：头部 + 索引环 + 数据环。
+    每条记录都在索引环中登记时间戳和位置，数据被新内容覆盖后对应的记录自动失效。
+    同名文件的几何参数一致时会沿用其中已有的内容。
+    """
+    def __init__(self, path, data_size, index_slots):
+        self.path = path
+        self.data_size = data_size
+        self.index_slots = index_slots
+        self._index_offset = _HEADER_SIZE
+        self._data_offset = _HEADER_SIZE + index_slots * _RECORD.size
+        self._lock = threading.Lock()
+
+        total_size = self._data_offset + data_size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != total_size:
+                os.ftruncate(fd, total_size)
+            self._mm = mmap.mmap(fd, total_size)
+        finally:
+            os.close(fd)
+
+        magic, stored_size, stored_slots, self.write_pos, self.record_count = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or stored_size != data_size or stored_slots != index_slots:
+            self.write_pos, self.record_count = 0, 0
+            self._write_header()
+
+    def _write_header(self):
+        _HEADER.pack_into(self._mm, 0, _MAGIC, self.data_size, self.index_slots, self.write_pos, self.record_count)
+
+    def append(self, data, timestamp=None, encoding=ENCODING_PCM):
+        length = len(data)
+        if not length or length > self.data_size: return
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            offset = self.write_pos % self.data_size
+            first = min(length, self.data_size - offset)
+            start = self._data_offset + offset
+            self._mm[start:start + first] = data[:first]
+            if first < length:
+                self._mm[self._data_offset:self._data_offset + length - first] = data[first:]
+            slot = self.record_count % self.index_slots
+            _RECORD.pack_into(self._mm, self._index_offset + slot * _RECORD.size, timestamp, self.write_pos, length, encoding)
+            self.write_pos += length
+            self.record_count += 1
+            self._write_header()
+
+    def _read_data(self, position, length):
+        offset = position % self.data_size
+        first = min(length, self.data_size - offset)
+        start = self._data_offset + offset
+        data = self._mm[start:start + first]
+        if first < length:
+            data += self._mm[self._data_offset:self._data_offset + length - first]
+        return data
+
+    def records(self, start_ts=0.0, end_ts=float("inf")):
+        """返回时间窗口内仍然有效的记录列表 [(时间戳, 数据, 编码)]，按写入顺序排列"""
+        results = []
+        with self._lock:
+            oldest_valid = self.write_pos - self.data_size
+            first_record = max(0, self.record_count - self.index_slots)
+            for n in range(first_record, self.record_count):
+                slot = n % self.index_slots
+                timestamp, position, length, encoding = _RECORD.unpack_from(self._mm, self._index_offset + slot * _RECORD.size)
+                if position < oldest_valid or not start_ts <= timestamp <= end_ts:
+                    continue
+                results.append((timestamp, self._read_data(position, length), encoding))
+        return results
+
+    def close(self):
+        with self._lock:
+            self._mm.close()
+
+
+class FlightRecorder:
+    """
+    麦克风、TTS和标记三条轨道的飞行记录仪。
+    每个会话（房间）的麦克风和TTS轨道各自使用独立的环形文件，在第一次写入时创建；标记轨道由所有会话共用。
+    未调用 open()（即未启用）时，所有记录方法都是空操作；open() 时未列出的轨道同样不记录。
+    """
+    def __init__(self):
+        self.directory = None
+        self.minutes = None
+        self.markers = None
+        self.tracks = ()
+        self._tracks = {}  # (轨道, 会话) -> RingFile
+        self._lock = threading.Lock()
+
+    def open(self, directory=None, minutes=None, tracks=("mic", "tts")):
+        self.directory = directory or config.FLIGHT_RECORDER_DIR
+        self.tracks = tuple(tracks)
+        self.minutes = minutes or config.FLIGHT_RECORDER_MINUTES
+        os.makedirs(self.directory, exist_ok=True)
+        self.markers = RingFile(os.path.join(self.directory, "flight_markers.ring"), 256 * 1024, 4096)
+        log.info(f"[FlightRecorder] ✅ 已启用 (轨道: {', '.join(self.tracks)})，保留最近 {self.minutes} 分钟的音频 (目录: {self.directory})。")
+
+    @property
+    def enabled(self):
+        return self.markers is not None
+
+    def _ring(self, track, session):
+        ring = self._tracks.get((track, session))
+        if ring is not None or not self.enabled or track not in self.tracks: return ring
+        with self._lock:
+            if (track, session) not in self._tracks:
+                pcm_bytes = int(self.minutes * 60 * config.TARGET_RATE * 2)
+                # 麦克风每100ms一个块；TTS的块更小更密，按同样的时长预留两倍的索引槽
+                slots = int(pcm_bytes / config.CHUNK_SIZE) + 64
+                if track == "tts": slots *= 2
+                prefix = "flight" if session == "default" else f"flight_{session}"
+                self._tracks[(track, session)] = RingFile(os.path.join(self.directory, f"{prefix}_{track}.ring"), pcm_bytes, slots)
+            return self._tracks[(track, session)]
+
+    def record_mic(self, chunk, session="default"):
+        ring = self._ring("mic", session)
+        if ring: ring.append(chunk)
+
+    def record_tts(self, chunk, encoding="mp3", session="default"):
+        ring = self._ring("tts", session)
+        if ring: ring.append(chunk, encoding=_ENCODING_CODES.get(encoding, ENCODING_PCM))
+
+    def mark(self, text, session="default"):
+        """记录一个轮次/状态标记，例如 "wake"、"turn:command"、"asr:打开音乐" """
+        if self.markers: self.markers.append(f"{session}\x1f{text}".encode("utf-8"))
+
+    def marker_list(self, start_ts, end_ts, session=None):
+        """返回时间窗口内的标记；指定session时只返回该会话的标记"""
+        if not self.markers: return []
+        results = []
+        for ts, data, _ in self.markers.records(start_ts, end_ts):
+            marker_session, _, text = data.decode("utf-8", errors="replace").partition("\x1f")
+            if session and marker_session != session: continue
+            results.append({"time": ts, "session": marker_session, "text": text})
+        return results
+
+    def export_wav(self, track, start_ts, end_ts, session="default"):
+        """
+        把某条轨道在时间窗口内的音频导出为16kHz单声道WAV。
+        麦克风轨道中两次写入之间的空档用静音填充，使导出的时间轴与真实时间对齐；
+        TTS轨道中的压缩音频会先用ffmpeg解码为PCM。
+
+        Returns:
+            bytes | None: WAV文件内容；未启用或该窗口内没有音频时返回None。
+        """
+        # 只导出已经打开的轨道，不根据外部传入的会话名创建文件
+        ring = self._tracks.get((track, session))
+        if not ring: return None
+        records = ring.records(start_ts, end_ts)
+        if not records: return None
+
+        if track == "mic":
+            pcm = self._align_pcm(records, start_ts)
+        else:
+            pcm = b"".join(self._decode_runs(records))
+
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as wf:
+            wf.setnchannels(1); wf.setsampwidth(2); wf.setframerate(config.TARGET_RATE)
+            wf.writeframes(pcm)
+        return buf.getvalue()
+
+    @staticmethod
+    def _align_pcm(records, start_ts):
+        bytes_per_s = config.TARGET_RATE * 2
+        parts, cursor = [], None
+        for timestamp, data, _ in records:
+            chunk_start = timestamp - len(data) / bytes_per_s
+            if cursor is None: cursor = max(start_ts, chunk_start)
+            gap_bytes = int((chunk_start - cursor) * bytes_per_s) & ~1
+            if gap_bytes > config.CHUNK_SIZE:
+                parts.append(bytes(gap_bytes))
+            parts.append(data)
+            cursor = max(cursor, timestamp)
+        return b"".join(parts)
+
+    @staticmethod
+    def _decode_runs(records):
+        """把编码相同的连续记录拼成一段，压缩格式用ffmpeg解码为PCM"""
+        runs = []
+        for _, data, encoding in records:
+            if runs and runs[-1][0] == encoding:
+                runs[-1][1].append(data)
+            else:
+                runs.append((encoding, [data]))
+        for encoding, chunks in runs:
+            payload = b"".join(chunks)
+            if encoding == ENCODING_PCM:
+                yield payload; continue
+            command = ["ffmpeg", "-loglevel", "error", "-f", _FFMPEG_FORMATS[encoding], "-i", "-",
+                       "-ar", str(config.TARGET_RATE), "-ac", "1", "-f", "s16le", "-"]
+            try:
+                result = subprocess.run(command, input=payload, capture_output=True, timeout=30)
+                yield result.stdout
+            except (OSError, subprocess.TimeoutExpired) as e:
+                log.error(f"❌ [FlightRecorder] 解码TTS音频失败: {e}")
+
+
+flight_recorder = FlightRecorder()
@@ -0,0 +1,213 @@
+# smart_speaker/frontend_process.py
+# 把唤醒词、停止词检测和VAD这些实时音频前端工作放到独立的工作进程中，
+# 避免与Flask/WebSocket、LLM流、TTS回调等线程争抢同一个GIL。
+#
+# 音频本身通过共享内存环形缓冲区传递（不经过管道、不做序列化拷贝），
+# 两个进程之间只交换很小的控制消息：
+#   主进程 -> 工作进程: ("audio", 写入位置, 模式) / ("stop",)
+#   工作进程 -> 主进程: ("ready",) / ("wake",) / ("stop_music",) / ("listening",) / ("utterance", 起始位置, 结束位置)
+# 位置均为自启动以来写入的总字节数，对容量取模即为环形缓冲区中的偏移。
+import audioop
+import multiprocessing
+from multiprocessing import shared_memory
+
+import config
+
+MODE_SLEEPING = "sleeping"
+MODE_AWAKE = "awake"
+MODE_MUSIC = "music"
+
+
+class SharedAudioRing:
+    """建立在一块共享内存上的单写者音频环形缓冲区"""
+    def __init__(self, buf, capacity):
+        self.buf = buf
+        self.capacity = capacity
+        self.write_pos = 0
+
+    def write(self, chunk):
+        offset = self.write_pos % self.capacity
+        first = min(len(chunk), self.capacity - offset)
+        self.buf[offset:offset + first] = chunk[:first]
+        if first < len(chunk):
+            self.buf[0:len(chunk) - first] = chunk[first:]
+        self.write_pos += len(chunk)
+        return self.write_pos
+
+    def read(self, start, end, write_pos=None):
+        """
+        返回 [start, end) 区间的音频，形式为1~2个memoryview片段（跨越环形缓冲区末尾时为2个）。
+        如果该区间已经被新数据覆盖，返回None。
+        """
+        write_pos = self.write_pos if write_pos is None else write_pos
+        if end - start > self.capacity or write_pos - start > self.capacity:
+            return None
+        offset = start % self.capacity
+        length = end - start
+        first = min(length, self.capacity - offset)
+        segments = [self.buf[offset:offset + first]]
+        if first < length:
+            segments.append(self.buf[0:length - first])
+        return segments
+
+
+class _FrontendState:
+    """工作进程中的检测状态机，逻辑与AudioHandler中的进程内版本保持一致"""
+    def __init__(self, ring, conn):
+        from .services.wake_word_service import VoskWakeWordDetector
+        self.ring = ring
+        self.conn = conn
+        self.wake_word_detector = VoskWakeWordDetector(keywords=[config.WAKE_WORD])
+        self.stop_music_detector = VoskWakeWordDetector(keywords=config.MUSIC_STOP_WORDS)
+        self.pre_roll_bytes = int(config.PRE_BUFFER_DURATION_S * config.TARGET_RATE / config.CHUNK_SIZE) * config.CHUNK_SIZE
+        self.silence_bytes = int(config.SILENCE_DURATION_S * config.TARGET_RATE) * 2
+        self.max_bytes = int((config.MAX_RECORDING_S + config.PRE_BUFFER_DURATION_S) * config.TARGET_RATE) * 2
+        self.mode = None
+        self.mode_start = 0
+        self.read_pos = 0
+        self._reset_recording()
+
+    def _reset_recording(self):
+        self.recording_start = None
+        self.last_speech_end = 0
+
+    def feed(self, end_pos, mode):
+        if mode != self.mode:
+            self.mode = mode
+            self.mode_start = self.read_pos
+            self._reset_recording()
+        # 工作进程落后太多时直接跳到最新位置，实时性优先
+        if end_pos - self.read_pos > self.ring.capacity // 2:
+            self.read_pos = end_pos - config.CHUNK_SIZE
+        while self.read_pos < end_pos:
+            chunk_end = min(self.read_pos + config.CHUNK_SIZE, end_pos)
+            segments = self.ring.read(self.read_pos, chunk_end, end_pos)
+            if segments:
+                self._process(b''.join(segments), self.read_pos, chunk_end)
+            self.read_pos = chunk_end
+
+    def _process(self, chunk, chunk_start, chunk_end):
+        if self.mode == MODE_SLEEPING:
+            if self.wake_word_detector.process(chunk):
+                self.conn.send(("wake",))
+        elif self.mode == MODE_MUSIC:
+            if self.stop_music_detector.process(chunk):
+                self.conn.send(("stop_music",))
+        elif self.mode == MODE_AWAKE:
+            is_speech = audioop.rms(chunk, 2) > config.VAD_THRESHOLD
+            if self.recording_start is None:
+                if is_speech:
+                    self.recording_start = max(self.mode_start, chunk_end - self.pre_roll_bytes)
+                    self.last_speech_end = chunk_end
+                    self.conn.send(("listening",))
+                return
+            if is_speech: self.last_speech_end = chunk_end
+            if chunk_end - self.recording_start >= self.max_bytes or chunk_end - self.last_speech_end > self.silence_bytes:
+                self.conn.send(("utterance", self.recording_start, min(chunk_end, self.recording_start + self.max_bytes)))
+                self._reset_recording()
+
+
+def _worker_main(shm_name, capacity, conn):
+    """工作进程入口"""
+    # spawn出的子进程与主进程共用同一个resource_tracker，共享内存由主进程统一unlink
+    shm = shared_memory.SharedMemory(name=shm_name)
+    ring = SharedAudioRing(shm.buf, capacity)
+    state = _FrontendState(ring, conn)
+    conn.send(("ready",))
+    try:
+        while True:
+            message = conn.recv()
+            if message[0] == "stop": break
+            _, end_pos, mode = message
+            state.feed(end_pos, mode)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del ring, state
+        shm.close()
+
+
+class FrontendProcess:
+    """
+    主进程一侧的句柄：把采集到的音频写入共享内存，并收取工作进程发回的事件。
+    """
+    def __init__(self):
+        self.capacity = int(config.AUDIO_RING_SECONDS * config.TARGET_RATE) * 2
+        self.shm = None
+        self.ring = None
+        self.process = None
+        self.conn = None
+        # 工作进程发回ready之前（含后台重启期间）ring/conn可能尚未建立，不能写入音频
+        self.ready = False
+
+    def start(self):
+        context = multiprocessing.get_context("spawn")
+        self.shm = shared_memory.SharedMemory(create=True, size=self.capacity)
+        self.ring = SharedAudioRing(self.shm.buf, self.capacity)
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(self.shm.name, self.capacity, child_conn),
+                                       name="audio-frontend", daemon=True)
+        self.process.start()
+        child_conn.close()
+        print(f"[Frontend] 音频前端工作进程已启动 (PID: {self.process.pid})，等待模型加载...")
+        try:
+            ready = self.conn.poll(60) and self.conn.recv()[0] == "ready"
+        except EOFError:
+            ready = False
+        self.ready = ready
+        if ready:
+            print("[Frontend] ✅ 音频前端工作进程已就绪。")
+        else:
+            print("[Frontend-Warn] 音频前端工作进程未能在规定时间内就绪。")
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def is_ready(self):
+        return self.ready and self.is_alive()
+
+    def poll_ready(self):
+        """补收启动超时之后才到达的ready消息（它总是工作进程发出的第一条消息）"""
+        try:
+            if not self.ready and self.conn.poll() and self.conn.recv()[0] == "ready":
+                self.ready = True
+                print("[Frontend] ✅ 音频前端工作进程已就绪。")
+        except (EOFError, OSError):
+            pass
+        return self.ready
+
+    def feed(self, chunk, mode):
+        """写入一个音频块并通知工作进程（只发送写入位置，不发送音频数据）"""
+        end_pos = self.ring.write(chunk)
+        try:
+            self.conn.send(("audio", end_pos, mode))
+        except (BrokenPipeError, OSError):
+            print("[Frontend-Error] 与音频前端工作进程的连接已断开。")
+
+    def poll_events(self):
+        events = []
+        try:
+            while self.conn.poll():
+                events.append(self.conn.recv())
+        except (EOFError, OSError):
+            pass
+        return events
+
+    def read(self, start, end):
+        return self.ring.read(start, end)
+
+    def stop(self):
+        if self.process is None: return
+        self.ready = False
+        try:
+            self.conn.send(("stop",))
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=2)
+        if self.process.is_alive(): self.process.kill()
+        self.conn.close()
+        self.ring = None
+        self.shm.close()
+        self.shm.unlink()
+        self.process = None
+        print("[Frontend] 音频前端工作进程已停止。")
@@ -0,0 +1,134 @@
+# smart_speaker/http_client.py
+import random
+import socket
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+from .metrics import metrics
+from .log import get_logger
+
+log = get_logger(__name__)
+
+# --- 共享会话：一个Session + 一个HTTPAdapter，内部按 (scheme, host, port) 维护各自的长连接池 ---
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_HOSTS, pool_maxsize=config.HTTP_POOL_MAXSIZE, max_retries=0)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+# 走车队网关时附带设备标识，网关据此按设备限流
+_session.headers.update(config.DEVICE_HEADERS)
+
+_IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+# --- 进程内DNS缓存 ---
+_dns_cache = {}
+_dns_lock = threading.Lock()
+_original_getaddrinfo = socket.getaddrinfo
+
+def _cached_getaddrinfo(host, port, *args, **kwargs):
+    key = (host, port) + args + tuple(sorted(kwargs.items()))
+    now = time.monotonic()
+    with _dns_lock:
+        entry = _dns_cache.get(key)
+        if entry and entry[0] > now:
+            metrics.inc("http.dns_cache_hit")
+            return entry[1]
+    result = _original_getaddrinfo(host, port, *args, **kwargs)
+    metrics.inc("http.dns_cache_miss")
+    with _dns_lock:
+        _dns_cache[key] = (now + config.HTTP_DNS_CACHE_TTL_S, result)
+    return result
+
+def install_dns_cache():
+    """用带TTL的缓存包装socket.getaddrinfo，对进程内所有连接（包括TTS WebSocket）生效"""
+    if config.HTTP_DNS_CACHE_TTL_S > 0 and socket.getaddrinfo is not _cached_getaddrinfo:
+        socket.getaddrinfo = _cached_getaddrinfo
+
+install_dns_cache()
+
+
+def _timeout_for(endpoint):
+    return config.HTTP_TIMEOUTS.get(endpoint, config.HTTP_TIMEOUTS["default"])
+
+def _record_pool_stats(url):
+    """记录目标主机连接池的新建连接数和请求数，二者之差即为连接复用次数"""
+    try:
+        pool = _adapter.poolmanager.connection_from_url(url)
+        host = urlsplit(url).hostname
+        metrics.set_gauge(f"http.{host}.connections", pool.num_connections)
+        metrics.set_gauge(f"http.{host}.requests", pool.num_requests)
+        metrics.set_gauge(f"http.{host}.reused", pool.num_requests - pool.num_connections)
+    except Exception:
+        pass
+
+def request(method, url, endpoint="default", idempotent=None, retries=None, **kwargs):
+    """
+    通过共享连接池发送HTTP请求。
+
+    Args:
+        method (str): HTTP方法。
+        url (str): 请求地址。
+        endpoint (str): 端点类别，决定连接/读取超时，见 config.HTTP_TIMEOUTS。
+        idempotent (bool, optional): 是否幂等；只有幂等请求才会重试。默认按HTTP方法判断。
+        retries (int, optional): 最大重试次数，默认 config.HTTP_MAX_RETRIES。
+        **kwargs: 透传给 requests 的其他参数。
+
+    Returns:
+        requests.Response
+
+    Raises:
+        requests.RequestException: 重试耗尽后仍然失败。
+    """
+    method = method.upper()
+    if idempotent is None: idempotent = method in _IDEMPOTENT_METHODS
+    retries = config.HTTP_MAX_RETRIES if retries is None else retries
+    kwargs.setdefault("timeout", _timeout_for(endpoint))
+    attempts = retries + 1 if idempotent else 1
+
+    for attempt in range(attempts):
+        start_time = time.monotonic()
+        try:
+            response = _session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.inc(f"http.{endpoint}.errors")
+            if attempt + 1 >= attempts: raise
+            log.warning(f"[HTTP-Warn] {endpoint} 请求失败 ({e.__class__.__name__})，准备第 {attempt + 1} 次重试...")
+        else:
+            metrics.observe(f"http.{endpoint}.latency_s", time.monotonic() - start_time)
+            _record_pool_stats(url)
+            if response.status_code not in _RETRY_STATUS or attempt + 1 >= attempts:
+                return response
+            log.warning(f"[HTTP-Warn] {endpoint} 返回状态码 {response.status_code}，准备第 {attempt + 1} 次重试...")
+            response.close()
+        metrics.inc(f"http.{endpoint}.retries")
+        # 带抖动的指数退避
+        backoff = config.HTTP_RETRY_BACKOFF_S * (2 ** attempt)
+        time.sleep(random.uniform(backoff / 2, backoff))
+
+def get(url, endpoint="default", **kwargs):
+    return request("GET", url, endpoint=endpoint, **kwargs)
+
+def post(url, endpoint="default", **kwargs):
+    return request("POST", url, endpoint=endpoint, **kwargs)
+
+def resolve_url(url, endpoint="resolve", max_redirects=5, **kwargs):
+    """
+    手动跟随重定向，返回最终地址。
+    只读取重定向响应（很小），不会下载最终资源本身，连接可以被放回连接池复用。
+    """
+    for _ in range(max_redirects):
+        response = get(url, endpoint=endpoint, allow_redirects=False, stream=True, **kwargs)
+        try:
+            if not response.is_redirect:
+                return url
+            response.content  # 读完重定向响应体，让连接可以被复用
+            url = urljoin(url, response.headers["location"])
+        finally:
+            response.close()
+    return url
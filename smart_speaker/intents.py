@@ -0,0 +1,91 @@
+# smart_speaker/intents.py
+import re
+from .log import get_logger
+
+log = get_logger(__name__)
+
+# 匹配前先去掉空白和常见标点，云端识别结果常带有句末标点
+_PUNCTUATION_RE = re.compile(r"[\s，。！？、；：,.!?;:~～…]+")
+
+def normalize_text(text):
+    """去掉文本中的空白和标点，便于做意图匹配"""
+    return _PUNCTUATION_RE.sub("", text or "")
+
+
+class Intent:
+    """
+    一个可注册的意图。
+
+    Args:
+        name (str): 意图名称，用于日志。
+        pattern (str): 对完整转写文本做匹配的正则，槽位使用命名分组。
+        handler (callable): 命中后调用的处理函数，以槽位作为关键字参数。
+        slots (tuple): 需要从文本中提取的槽位名称。带槽位的意图必须等待云端识别结果。
+        local_phrases (tuple): 本地Vosk语法中用于识别该意图的短语（词之间用空格分隔）。
+    """
+    def __init__(self, name, pattern, handler, slots=(), local_phrases=()):
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.handler = handler
+        self.slots = tuple(slots)
+        self.local_phrases = tuple(local_phrases)
+
+    @property
+    def needs_cloud(self):
+        return bool(self.slots)
+
+
+class IntentMatch:
+    def __init__(self, intent, slots, source, confidence=1.0):
+        self.intent = intent
+        self.slots = slots
+        self.source = source
+        self.confidence = confidence
+
+    def dispatch(self):
+        log.info(f"[Intent] 命中意图 '{self.intent.name}' (来源: {self.source}, 置信度: {self.confidence:.2f}, 槽位: {self.slots})")
+        self.intent.handler(**self.slots)
+
+
+class IntentRegistry:
+    """按注册顺序匹配的意图注册表，先注册的意图优先级更高。"""
+    def __init__(self):
+        self._intents = []
+
+    def register(self, name, pattern, handler, slots=(), local_phrases=()):
+        intent = Intent(name, pattern, handler, slots, local_phrases)
+        self._intents.append(intent)
+        return intent
+
+    def local_phrases(self):
+        """所有意图的本地短语，用于构建Vosk语法"""
+        phrases = []
+        for intent in self._intents:
+            phrases.extend(p for p in intent.local_phrases if p not in phrases)
+        return phrases
+
+    def match(self, text):
+        """对完整的转写文本（通常来自云端ASR）进行匹配"""
+        normalized = normalize_text(text)
+        for intent in self._intents:
+            m = intent.pattern.search(normalized)
+            if m:
+                slots = {slot: (m.group(slot) or "").strip() for slot in intent.slots}
+                return IntentMatch(intent, slots, "cloud")
+        return None
+
+    def match_local(self, local_result):
+        """
+        对本地语法识别的结果进行匹配。
+        只有识别出的词恰好构成某个意图的本地短语时才算命中；
+        不带槽位的意图还要求整句中没有任何未知词([unk])，以避免误触发。
+        """
+        if not local_result or not local_result.get("text"):
+            return None
+        text = normalize_text(local_result["text"])
+        for intent in self._intents:
+            if local_result.get("has_unknown") and not intent.slots:
+                continue
+            if any(normalize_text(phrase) == text for phrase in intent.local_phrases):
+                return IntentMatch(intent, {}, "local", local_result.get("confidence", 0.0))
+        return None
@@ -0,0 +1,167 @@
+# smart_speaker/log.py
+# 非阻塞日志：调用方只把日志记录放进内存队列（不格式化、不做I/O），
+# 由后台线程统一格式化并写到stdout和最近日志缓冲区，stdout写入慢（journald、串口控制台）时不会卡住采集线程和LLM流。
+import atexit
+import collections
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+
+import config
+
+# 会被附加到日志中的结构化字段
+STRUCTURED_FIELDS = ("session", "turn", "state", "stage")
+
+_context = threading.local()
+_setup_lock = threading.Lock()
+_listener = None
+
+
+def set_context(**fields):
+    """为当前线程设置结构化字段（如轮次工作线程的 turn/session），之后该线程的每条日志都会带上它们"""
+    current = getattr(_context, "fields", {})
+    _context.fields = {**current, **{k: v for k, v in fields.items() if v is not None}}
+
+
+def clear_context(*names):
+    """清除当前线程的结构化字段；不指定名称时全部清除"""
+    if not names:
+        _context.fields = {}
+        return
+    current = dict(getattr(_context, "fields", {}))
+    for name in names: current.pop(name, None)
+    _context.fields = current
+
+
+class _ContextFilter(logging.Filter):
+    """在调用方线程中收集结构化字段：线程上下文 + 调用时通过 extra 传入的字段"""
+    def filter(self, record):
+        fields = dict(getattr(_context, "fields", {}))
+        for name in STRUCTURED_FIELDS:
+            value = record.__dict__.get(name)
+            if value is not None: fields[name] = value
+        record.fields = fields
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    按调用位置（文件+行号）限流警告：每个位置在 window_s 秒内最多输出 burst 条，多余的被丢弃并计数，
+    下一条被放行的日志会附带被抑制的条数。用于采集源反复卡顿重启、HTTP重试这类会刷屏的警告。
+    只使用字典操作（在GIL下是原子的），不加锁。
+    """
+    def __init__(self, burst=None, window_s=None):
+        super().__init__()
+        self.burst = burst or config.LOG_RATE_LIMIT_BURST
+        self.window_s = window_s or config.LOG_RATE_LIMIT_WINDOW_S
+        self._sites = {}   # (pathname, lineno) -> [窗口开始时间, 窗口内条数, 被抑制条数]
+
+    def filter(self, record):
+        # 只限流警告和错误；INFO日志（如逐句的播放日志）本来就是按事件输出的，不应被合并
+        if record.levelno < logging.WARNING:
+            record.suppressed = 0
+            return True
+        key = (record.pathname, record.lineno)
+        now = record.created
+        site = self._sites.get(key)
+        if site is None or now - site[0] >= self.window_s:
+            suppressed = site[2] if site else 0
+            self._sites[key] = [now, 1, 0]
+            record.suppressed = suppressed
+            return True
+        if site[1] < self.burst:
+            site[1] += 1
+            record.suppressed = 0
+            return True
+        site[2] += 1
+        return False
+
+
+class _EnqueueHandler(logging.handlers.QueueHandler):
+    """只把记录放进队列；消息的格式化留给后台线程完成"""
+    def prepare(self, record):
+        return record
+
+
+class RecentLogBuffer(logging.Handler):
+    """最近若干条日志的有界环形缓冲区，由 /logs 接口提供给面板"""
+    def __init__(self, capacity):
+        super().__init__()
+        self._records = collections.deque(maxlen=capacity)
+        self._seq = 0
+
+    def emit(self, record):
+        self._seq += 1
+        self._records.append({
+            "seq": self._seq,
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+            "fields": getattr(record, "fields", {}),
+            "suppressed": getattr(record, "suppressed", 0),
+        })
+
+    def snapshot(self, level=None, since_seq=0, limit=200):
+        """按最低级别和序号过滤，返回最新的 limit 条（旧的在前）"""
+        min_level = logging.getLevelName(level.upper()) if level else logging.NOTSET
+        if not isinstance(min_level, int): min_level = logging.NOTSET
+        records = [r for r in list(self._records)
+                   if r["seq"] > since_seq and logging.getLevelName(r["level"]) >= min_level]
+        return records[-limit:]
+
+
+class _Formatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " {" + " ".join(f"{k}={v}" for k, v in fields.items()) + "}"
+        if getattr(record, "suppressed", 0):
+            line += f" (期间另有 {record.suppressed} 条相同日志被抑制)"
+        return line
+
+
+recent_logs = RecentLogBuffer(config.LOG_RECENT_CAPACITY)
+
+
+def _parse_levels(spec):
+    """解析 "smart_speaker.audio_handler=WARNING,smart_speaker.services=DEBUG" 形式的分模块级别"""
+    levels = {}
+    for item in (spec or "").split(","):
+        name, _, level = item.strip().partition("=")
+        if name and level: levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """配置根日志器（只执行一次）：调用方 -> 无锁队列 -> 后台线程 -> stdout + 最近日志缓冲区"""
+    global _listener
+    with _setup_lock:
+        if _listener: return
+        log_queue = queue.SimpleQueue()
+        enqueue = _EnqueueHandler(log_queue)
+        enqueue.addFilter(_ContextFilter())
+        enqueue.addFilter(RateLimitFilter())
+
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(_Formatter("%(asctime)s %(levelname).1s %(message)s", "%H:%M:%S"))
+        _listener = logging.handlers.QueueListener(log_queue, console, recent_logs, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        root = logging.getLogger()
+        root.addHandler(enqueue)
+        root.setLevel(config.LOG_LEVEL)
+        for name, level in _parse_levels(config.LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level)
+
+
+def get_logger(name):
+    """各模块通过 log = get_logger(__name__) 获取日志器；首次调用时完成日志系统的配置"""
+    if _listener is None: setup_logging()
+    return logging.getLogger(name)
+
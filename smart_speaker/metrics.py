@@ -0,0 +1,54 @@
+# smart_speaker/metrics.py
+import threading
+
+
+class Metrics:
+    """
+    一个极简的、线程安全的进程内指标注册表。
+    支持计数器(counter)、仪表(gauge)和数值观测(timing/size等)三类指标，
+    通过 snapshot() 导出为可直接JSON序列化的字典。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._observations = {}
+
+    def inc(self, name, value=1):
+        """计数器累加"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        """设置仪表的当前值"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, value):
+        """记录一次观测值，汇总为 count/sum/min/max/last"""
+        with self._lock:
+            stat = self._observations.get(name)
+            if stat is None:
+                self._observations[name] = {"count": 1, "sum": value, "min": value, "max": value, "last": value}
+                return
+            stat["count"] += 1
+            stat["sum"] += value
+            stat["min"] = min(stat["min"], value)
+            stat["max"] = max(stat["max"], value)
+            stat["last"] = value
+
+    def snapshot(self):
+        """导出所有指标的快照"""
+        with self._lock:
+            observations = {}
+            for name, stat in self._observations.items():
+                observations[name] = dict(stat, avg=stat["sum"] / stat["count"])
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "observations": observations,
+            }
+
+
+# 全局共享的指标实例
+metrics = Metrics()
@@ -0,0 +1,183 @@
+# smart_speaker/profiling.py
+# 现场诊断用的按需剖析工具：全线程采样剖析（输出折叠栈，可直接生成火焰图）、tracemalloc内存快照与差异、各线程CPU时间。
+# 不调用时没有任何开销：采样线程只在请求期间存在，tracemalloc只在显式开启后才跟踪分配，可以随正式版本一起启用。
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import config
+from .log import get_logger
+
+log = get_logger(__name__)
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+class ProfilerBusy(Exception):
+    """已有一次采样剖析正在进行。"""
+
+
+class SamplingProfiler:
+    """
+    基于 sys._current_frames() 的采样剖析器：每隔 interval_s 抓取一次所有Python线程的调用栈并计数。
+    不使用 sys.setprofile/settrace，被剖析的线程不需要任何配合，开销只有采样线程本身。
+    同一时间只允许一次剖析。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def profile(self, seconds, interval_s=None):
+        """
+        阻塞采样 seconds 秒。
+
+        Returns:
+            tuple: (折叠栈文本, 采样次数)。折叠栈每行为 "线程名;外层函数;...;内层函数 次数"，
+                   可直接交给 flamegraph.pl 或 speedscope 生成火焰图。
+        """
+        interval_s = interval_s or config.PROFILE_SAMPLE_INTERVAL_S
+        seconds = min(max(seconds, interval_s), config.PROFILE_MAX_SECONDS)
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy()
+        try:
+            log.info(f"[Profile] 开始采样剖析 {seconds:.1f}s，采样间隔 {interval_s * 1000:.1f}ms...")
+            stacks = collections.Counter()
+            own_id = threading.get_ident()
+            samples = 0
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id: continue
+                    stacks[self._collapse(names.get(thread_id, str(thread_id)), frame)] += 1
+                samples += 1
+                time.sleep(interval_s)
+            log.info(f"[Profile] 采样剖析结束，共 {samples} 次采样、{len(stacks)} 种调用栈。")
+            return "\n".join(f"{stack} {count}" for stack, count in stacks.most_common()) + "\n", samples
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def _collapse(thread_name, frame):
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        parts.append(thread_name.replace(";", ":"))
+        return ";".join(reversed(parts))
+
+
+class MemoryProfiler:
+    """
+    tracemalloc 的开关与快照管理。开启后每次内存分配都会记录调用栈（有明显开销），
+    因此默认关闭，只在排查泄漏时开启，排查完毕后关闭。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baseline = None
+
+    def status(self):
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {"tracing": tracing, "traced_bytes": current, "peak_bytes": peak,
+                "has_baseline": self._baseline is not None}
+
+    def start(self, frames=None):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames or config.PROFILE_TRACEMALLOC_FRAMES)
+                log.info("[Profile] 已开启内存分配跟踪。")
+            self._baseline = tracemalloc.take_snapshot()
+        return self.status()
+
+    def stop(self):
+        with self._lock:
+            tracemalloc.stop()
+            self._baseline = None
+        log.info("[Profile] 已关闭内存分配跟踪。")
+        return self.status()
+
+    def snapshot(self, limit=20, group_by="lineno"):
+        """当前内存占用最多的 limit 个分配位置"""
+        if not tracemalloc.is_tracing(): return None
+        stats = self._filtered(tracemalloc.take_snapshot()).statistics(group_by)
+        return [self._describe(stat.traceback, stat.size, stat.count) for stat in stats[:limit]]
+
+    def diff(self, limit=20, group_by="lineno", reset=False):
+        """
+        与基准快照（开启跟踪时或上次 reset 时拍摄）相比增长最多的 limit 个分配位置，
+        反复调用并观察同一位置是否持续增长即可定位泄漏。
+        """
+        if not tracemalloc.is_tracing(): return None
+        with self._lock:
+            current = tracemalloc.take_snapshot()
+            baseline = self._baseline or current
+            if reset: self._baseline = current
+        stats = self._filtered(current).compare_to(self._filtered(baseline), group_by)
+        return [dict(self._describe(stat.traceback, stat.size, stat.count), size_diff=stat.size_diff, count_diff=stat.count_diff)
+                for stat in stats[:limit]]
+
+    @staticmethod
+    def _filtered(snapshot):
+        # 排除tracemalloc自身和导入机制的分配
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+
+    @staticmethod
+    def _describe(traceback, size, count):
+        return {"size": size, "count": count, "traceback": [f"{frame.filename}:{frame.lineno}" for frame in traceback]}
+
+
+def thread_cpu_times():
+    """
+    各线程累计的CPU时间（秒）。Linux上读取 /proc/self/task，能同时看到Vosk、PyAudio等原生线程；
+    其他平台退化为只统计Python线程。
+    Returns:
+        dict: {线程ID(native_id): {"name", "cpu_s"}}
+    """
+    names = {t.native_id: t.name for t in threading.enumerate()}
+    result = {}
+    task_dir = "/proc/self/task"
+    if os.path.isdir(task_dir):
+        for tid in os.listdir(task_dir):
+            try:
+                with open(f"{task_dir}/{tid}/stat") as f:
+                    stat = f.read()
+            except OSError:
+                continue   # 线程在遍历期间已退出
+            # 第2个字段(comm)可能包含空格，用最后一个右括号定位其后的字段
+            comm = stat[stat.index("(") + 1:stat.rindex(")")]
+            fields = stat[stat.rindex(")") + 2:].split()
+            utime, stime = int(fields[11]), int(fields[12])
+            result[int(tid)] = {"name": names.get(int(tid), comm), "cpu_s": (utime + stime) / _CLOCK_TICKS}
+        return result
+    for thread in threading.enumerate():
+        try:
+            cpu_s = time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+        except (AttributeError, OSError):
+            continue
+        result[thread.native_id] = {"name": thread.name, "cpu_s": cpu_s}
+    return result
+
+
+def thread_cpu_usage(interval_s=1.0):
+    """间隔 interval_s 秒读取两次线程CPU时间，返回按CPU占用率从高到低排序的列表"""
+    before = thread_cpu_times()
+    time.sleep(interval_s)
+    after = thread_cpu_times()
+    usage = []
+    for tid, info in after.items():
+        delta = info["cpu_s"] - before.get(tid, {"cpu_s": 0.0})["cpu_s"]
+        usage.append({"tid": tid, "name": info["name"], "cpu_s": round(info["cpu_s"], 3),
+                      "cpu_pct": round(delta / interval_s * 100, 1)})
+    return sorted(usage, key=lambda item: item["cpu_pct"], reverse=True)
+
+
+sampling_profiler = SamplingProfiler()
+memory_profiler = MemoryProfiler()
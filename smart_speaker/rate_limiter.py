@@ -0,0 +1,83 @@
+# smart_speaker/rate_limiter.py
+import threading
+import time
+from collections import OrderedDict
+
+from .metrics import metrics
+
+
+class TokenBucket:
+    """
+    令牌桶限流器：以 rate 个/秒的速度补充令牌，最多积攒 burst 个。
+    每个客户端各持有一个，互不影响。
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self, tokens=1):
+        """有足够令牌时扣除并返回True，否则返回False（不阻塞）"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def retry_after(self, tokens=1):
+        """距离攒够指定数量令牌还需要的秒数"""
+        with self._lock:
+            self._refill(time.monotonic())
+            missing = tokens - self._tokens
+        return max(0.0, missing / self.rate) if self.rate > 0 else float("inf")
+
+
+class KeyedRateLimiter:
+    """
+    按客户端标识（来源地址、设备ID等）各持有一个令牌桶，重新连接不会拿到新的突发额度。
+    空闲到令牌已经补满的客户端，它的令牌桶与新建的没有区别，直接移除，避免客户端不断变化时无限增长。
+
+    Args:
+        gauge (str): 可选，当前跟踪的客户端数量写入该指标。
+    """
+    def __init__(self, rate, burst, gauge=None):
+        self.rate = rate
+        self.burst = burst
+        self.gauge = gauge
+        self._buckets = OrderedDict()   # 客户端 -> [令牌桶, 最近一次请求时间]，按最近请求时间排序
+        self._idle_s = burst / rate if rate > 0 else None
+        self._lock = threading.Lock()
+
+    def check(self, key):
+        """允许时返回None，否则返回建议的重试等待秒数"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._buckets.get(key)
+            if entry is None:
+                entry = self._buckets[key] = [TokenBucket(self.rate, self.burst), now]
+            else:
+                entry[1] = now
+                self._buckets.move_to_end(key)
+            self._evict_idle(now)
+            size = len(self._buckets)
+        if self.gauge: metrics.set_gauge(self.gauge, size)
+        bucket = entry[0]
+        if bucket.try_acquire(): return None
+        return bucket.retry_after()
+
+    def _evict_idle(self, now):
+        if self._idle_s is None: return
+        while self._buckets:
+            _, last_seen = next(iter(self._buckets.values()))
+            if now - last_seen < self._idle_s: break
+            self._buckets.popitem(last=False)
+
+    def __len__(self):
+        return len(self._buckets)
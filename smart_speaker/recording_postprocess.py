@@ -0,0 +1,115 @@
+# smart_speaker/recording_postprocess.py
+import audioop
+import os
+import subprocess
+import time
+import wave
+
+import config
+from .services.asr_service import estimate_upload_seconds
+from .metrics import metrics
+from .log import get_logger
+
+log = get_logger(__name__)
+
+_BYTES_PER_SECOND = config.TARGET_RATE * 2
+_WAV_HEADER_SIZE = 44
+
+# 支持的压缩上传格式: 格式 -> (ffmpeg编码参数, 文件扩展名, ASR接口的codec字段)
+_ENCODERS = {
+    "ogg": (["-c:a", "libopus", "-b:a", "24k", "-application", "voip", "-f", "ogg"], ".ogg", "opus"),
+    "mp3": (["-c:a", "libmp3lame", "-b:a", "32k", "-f", "mp3"], ".mp3", None),
+}
+
+
+def trim_silence(pcm, threshold=None, guard_s=None, frame_s=0.02):
+    """
+    去掉录音首尾的静音，只在语音两侧各保留一小段保护带。
+
+    Args:
+        pcm (bytes): 16kHz, 16-bit, 单声道的PCM音频。
+        threshold (int, optional): 能量阈值，默认使用 config.VAD_THRESHOLD。
+        guard_s (float, optional): 保护带时长，默认使用 config.TRIM_GUARD_S。
+        frame_s (float): 分析帧长。
+
+    Returns:
+        bytes-like: 裁剪后的音频（对原缓冲区的切片视图）；找不到语音时原样返回。
+    """
+    threshold = config.VAD_THRESHOLD if threshold is None else threshold
+    guard_s = config.TRIM_GUARD_S if guard_s is None else guard_s
+    frame_bytes = int(frame_s * _BYTES_PER_SECOND) // 2 * 2
+    view = memoryview(pcm)
+
+    first = last = None
+    for offset in range(0, len(view) - frame_bytes + 1, frame_bytes):
+        if audioop.rms(view[offset:offset + frame_bytes], 2) > threshold:
+            if first is None: first = offset
+            last = offset + frame_bytes
+    if first is None:
+        return pcm
+
+    guard_bytes = int(guard_s * _BYTES_PER_SECOND) // 2 * 2
+    return view[max(0, first - guard_bytes):min(len(view), last + guard_bytes)]
+
+
+def _encode(pcm, audio_format):
+    """使用ffmpeg将PCM编码为压缩格式，失败时返回None"""
+    codec_args = _ENCODERS[audio_format][0]
+    command = ["ffmpeg", "-loglevel", "error", "-f", "s16le", "-ar", str(config.TARGET_RATE), "-ac", "1", "-i", "-"] + codec_args + ["-"]
+    try:
+        result = subprocess.run(command, input=bytes(pcm), stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=5)
+        if result.returncode != 0 or not result.stdout:
+            log.error(f"❌ 录音压缩编码失败: {result.stderr.decode(errors='ignore').strip()}")
+            return None
+        return result.stdout
+    except Exception as e:
+        log.error(f"❌ 调用ffmpeg压缩录音时出错: {e}")
+        return None
+
+
+def prepare_upload(pcm, original_size=None, record_path=None):
+    """
+    将（已裁剪的）录音写成待上传的文件，按 config.ASR_UPLOAD_FORMAT 可选地压缩。
+
+    Args:
+        pcm (bytes): 待上传的PCM音频。
+        original_size (int, optional): 处理前的原始PCM字节数，用于统计节省的流量。
+        record_path (str, optional): 录音文件路径（每个会话各用一个），默认为 config.RECORD_FILENAME。
+
+    Returns:
+        tuple: (文件路径, ASR格式, ASR编解码器或None)
+    """
+    record_path = record_path or config.RECORD_FILENAME
+    base_path = os.path.splitext(record_path)[0]
+    audio_format, encoded = "wav", None
+    if config.ASR_UPLOAD_FORMAT in _ENCODERS:
+        start_time = time.time()
+        encoded = _encode(pcm, config.ASR_UPLOAD_FORMAT)
+        metrics.observe("upload.encode_s", time.time() - start_time)
+
+    if encoded:
+        audio_format = config.ASR_UPLOAD_FORMAT
+        _, extension, codec = _ENCODERS[audio_format]
+        path = base_path + extension
+        with open(path, 'wb') as f:
+            f.write(encoded)
+        upload_size = len(encoded)
+    else:
+        codec = None
+        path = record_path
+        with wave.open(path, 'wb') as wf:
+            wf.setnchannels(1); wf.setsampwidth(2); wf.setframerate(config.TARGET_RATE); wf.writeframes(pcm)
+        upload_size = len(pcm) + _WAV_HEADER_SIZE
+
+    original_pcm_size = len(pcm) if original_size is None else original_size
+    original_size = original_pcm_size + _WAV_HEADER_SIZE
+    saved_bytes = original_size - upload_size
+    saved_seconds = estimate_upload_seconds(saved_bytes)
+    metrics.inc("upload.bytes_saved", saved_bytes)
+    if saved_seconds is not None:
+        metrics.observe("upload.seconds_saved", saved_seconds)
+    saved_time_text = f"，预计节省上传 {saved_seconds * 1000:.0f}ms" if saved_seconds is not None else ""
+    log.info(f"[Upload] 录音 {original_pcm_size / _BYTES_PER_SECOND:.1f}s/{original_size}B -> "
+          f"{len(pcm) / _BYTES_PER_SECOND:.1f}s {audio_format} {upload_size}B，"
+          f"节省 {saved_bytes}B{saved_time_text}。")
+    return path, audio_format, codec
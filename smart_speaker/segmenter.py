@@ -0,0 +1,34 @@
+# smart_speaker/segmenter.py
+
+SENTENCE_DELIMITERS = ("。", "！", "？", "...", "…", "；", "\n")
+
+
+class SentenceSegmenter:
+    """
+    把LLM的流式文本切分成适合逐句合成语音的完整句子。
+    语音对话和文字对话共用同一个切分器，保证两边的断句行为一致。
+    """
+    def __init__(self, delimiters=SENTENCE_DELIMITERS):
+        self.delimiters = delimiters
+        self.buffer = ""
+
+    def feed(self, text_chunk):
+        """追加一个文本片段，返回其中已经完整的句子列表（可能为空）"""
+        self.buffer += text_chunk
+        sentences = []
+        while True:
+            delimiter_pos = -1; found_delimiter = None
+            for d in self.delimiters:
+                pos = self.buffer.find(d)
+                if pos != -1 and (delimiter_pos == -1 or pos < delimiter_pos):
+                    delimiter_pos = pos; found_delimiter = d
+            if delimiter_pos == -1:
+                return sentences
+            end = delimiter_pos + len(found_delimiter)
+            sentences.append(self.buffer[:end])
+            self.buffer = self.buffer[end:]
+
+    def flush(self):
+        """返回剩余的不完整句子（只有空白时返回空字符串）"""
+        rest, self.buffer = self.buffer, ""
+        return rest if rest.strip() else ""
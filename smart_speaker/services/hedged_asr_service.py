@@ -0,0 +1,137 @@
+# smart_speaker/services/hedged_asr_service.py
+import time
+from queue import Queue, Empty
+
+import config
+from .asr_service import transcribe_audio_file
+from .local_asr_service import LocalTranscriber
+from ..turn_scheduler import CancelToken, submit_io
+from ..metrics import metrics
+from ..log import get_logger
+
+log = get_logger(__name__)
+
+
+class HedgedASR:
+    """
+    对冲(hedged)式语音识别协调器。
+
+    对于短录音，同时启动本地Vosk转写和云端识别：
+    - 本地结果满足置信度阈值时，只有按云端延迟的EWMA预计云端能在截止时间前返回，才等待云端，否则立即采用；
+    - 云端结果在等待期间到达时，云端胜出；
+    - 没有任何结果满足阈值时继续等待，直到有结果满足阈值或两路都结束，此时返回置信度最高的可用文本。
+    长录音直接走云端，本地小模型在长句上准确率不够。
+    """
+    def __init__(self):
+        # 本地转写器依赖Vosk模型，由 load_local() 在启动时的后台任务中创建；创建完成前只走云端
+        self.local = None
+        self.cloud_latency_ewma_s = None
+
+    def load_local(self):
+        if config.HEDGED_ASR_ENABLED:
+            self.local = LocalTranscriber()
+
+    def transcribe(self, pcm, audio_path, cancel_token=None, audio_format="wav", audio_codec=None):
+        """
+        Args:
+            pcm (bytes): 用于本地转写的PCM音频。
+            audio_path (str): 用于云端识别的音频文件（可以是压缩格式）。
+
+        Returns:
+            str | None: 识别文本；失败或被取消时返回None。
+        """
+        cloud_args = (audio_path, audio_format, audio_codec)
+        duration = len(pcm) / (2 * config.TARGET_RATE)
+        if not self.local or not self.local.model or duration > config.HEDGED_ASR_MAX_UTTERANCE_S:
+            return self._cloud_only(cloud_args, cancel_token)
+
+        hedge_token = CancelToken(parent=cancel_token)
+        results = Queue()
+        start_time = time.monotonic()
+
+        def run(source, fn, *args):
+            try:
+                result = fn(*args)
+            except Exception as e:
+                log.error(f"❌ [ASR-Hedge] {source} 识别出错: {e}")
+                result = None
+            results.put((source, result, time.monotonic() - start_time))
+
+        submit_io(run, "local", self.local.transcribe, pcm, hedge_token)
+        submit_io(run, "cloud", self._cloud, cloud_args, hedge_token)
+        hedge_token.add_callback(lambda: results.put(None))
+
+        best = None         # 满足置信度阈值的最佳结果
+        fallback = None     # 不满足阈值的最佳结果，两路都没有达标的结果时使用
+        pending = 2
+        deadline = self._cloud_deadline(start_time)
+        try:
+            while pending:
+                if best and (best[0] == "cloud" or deadline is None or time.monotonic() >= deadline):
+                    break
+                timeout = max(0.0, deadline - time.monotonic()) if best else None
+                try:
+                    item = results.get(timeout=timeout)
+                except Empty:
+                    break
+                if item is None:
+                    return None
+                pending -= 1
+                source, result, latency = item
+                metrics.observe(f"asr.latency_s.{source}", latency)
+                if source == "cloud" and result: self._record_cloud_latency(latency)
+                if not result or not result[0]:
+                    log.info(f"[ASR-Hedge] {source} 无结果 ({latency * 1000:.0f}ms)。")
+                    continue
+                text, confidence = result
+                log.info(f"[ASR-Hedge] {source} 结果: '{text}' (置信度 {confidence:.2f}, {latency * 1000:.0f}ms)")
+                if confidence >= config.HEDGED_ASR_MIN_CONFIDENCE:
+                    if not best or confidence > best[2]: best = (source, text, confidence, latency)
+                elif not fallback or confidence > fallback[2]:
+                    fallback = (source, text, confidence, latency)
+        finally:
+            # 胜者确定后取消另一路（云端会停止轮询并清理TOS文件）
+            hedge_token.cancel()
+
+        if cancel_token and cancel_token.is_cancelled():
+            return None
+        # 两路都结束但都不满足阈值，仍返回可用的文本
+        best = best or fallback
+        if not best:
+            metrics.inc("asr.win.none")
+            return None
+        source, text, confidence, latency = best
+        metrics.inc(f"asr.win.{source}")
+        log.info(f"[ASR-Hedge] ✅ 采用 {source} 结果，总耗时 {latency * 1000:.0f}ms。")
+        return text
+
+    def _cloud_deadline(self, start_time):
+        """
+        本地结果达标后等待云端的截止时间点。云端（上传+提交+轮询）通常比截止时间慢，
+        按历史延迟预计赶不上时返回None，达标的本地结果直接采用，不白白等待。
+        """
+        if self.cloud_latency_ewma_s is None or self.cloud_latency_ewma_s > config.HEDGED_ASR_DEADLINE_S:
+            return None
+        return start_time + config.HEDGED_ASR_DEADLINE_S
+
+    def _record_cloud_latency(self, seconds):
+        alpha = config.HEDGED_ASR_CLOUD_EWMA_ALPHA
+        ewma = self.cloud_latency_ewma_s
+        self.cloud_latency_ewma_s = seconds if ewma is None else alpha * seconds + (1 - alpha) * ewma
+        metrics.set_gauge("asr.cloud_latency_ewma_s", round(self.cloud_latency_ewma_s, 3))
+
+    def _cloud(self, cloud_args, cancel_token):
+        audio_path, audio_format, audio_codec = cloud_args
+        text = transcribe_audio_file(audio_path, cancel_token, audio_format, audio_codec)
+        if not text: return None
+        return text, config.ASR_CLOUD_CONFIDENCE
+
+    def _cloud_only(self, cloud_args, cancel_token):
+        audio_path, audio_format, audio_codec = cloud_args
+        start_time = time.monotonic()
+        text = transcribe_audio_file(audio_path, cancel_token, audio_format, audio_codec)
+        latency = time.monotonic() - start_time
+        metrics.observe("asr.latency_s.cloud", latency)
+        if text: self._record_cloud_latency(latency)
+        metrics.inc("asr.cloud_only")
+        return text
@@ -0,0 +1,207 @@
+# smart_speaker/services/llm_gateway.py
+import threading
+import time
+from queue import Queue, Empty
+
+import config
+from ..turn_scheduler import CancelToken
+from ..metrics import metrics
+from ..log import get_logger
+
+log = get_logger(__name__)
+
+
+class LLMEndpoint:
+    """
+    一个兼容OpenAI协议的LLM端点（base_url + 模型），并维护其首字延迟的EWMA。
+    client_type 为 "sdk" 时使用openai SDK，为 "lite" 时使用标准库实现的极简SSE客户端。
+    """
+    def __init__(self, name, base_url, model, api_key, client_type=None):
+        self.name = name
+        self.base_url = base_url
+        self.model = model
+        self.api_key = api_key
+        self.client_type = client_type or config.LLM_CLIENT
+        self.ewma_first_token_s = None
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def _get_client(self):
+        with self._client_lock:
+            if self._client is None:
+                if self.client_type == "lite":
+                    from .llm_sse_client import SSEChatClient
+                    self._client = SSEChatClient(self.base_url, self.api_key, timeout=config.LLM_CHUNK_TIMEOUT_S,
+                                                 extra_headers=config.DEVICE_HEADERS)
+                else:
+                    # 延迟导入openai SDK，只有真正用到时才付出导入开销
+                    import httpx
+                    from openai import OpenAI
+                    # 由网关负责超时和故障切换，SDK内部不再重试；读取超时按片段间隔计算，
+                    # 卡在 create() 里的请求（此时还无法取消）最多占用一个读取超时
+                    timeout = httpx.Timeout(config.LLM_CHUNK_TIMEOUT_S, connect=config.LLM_CONNECT_TIMEOUT_S)
+                    self._client = OpenAI(base_url=self.base_url, api_key=self.api_key,
+                                          timeout=timeout, max_retries=0,
+                                          default_headers=config.DEVICE_HEADERS)
+            return self._client
+
+    def stream_content(self, messages, cancel_token):
+        """流式请求该端点，逐个产出 delta.content 文本片段；取消时立即关闭底层连接"""
+        if self.client_type == "lite":
+            yield from self._get_client().stream_content(self.model, messages, cancel_token)
+            return
+        stream = self._get_client().chat.completions.create(model=self.model, messages=messages, stream=True)
+        # create() 返回前已被取消时，add_callback 会立即关闭流
+        cancel_token.add_callback(stream.close)
+        try:
+            for chunk in stream:
+                if cancel_token.is_cancelled(): return
+                if chunk.choices and chunk.choices[0].delta.content is not None:
+                    yield chunk.choices[0].delta.content
+        finally:
+            cancel_token.remove_callback(stream.close)
+            stream.close()
+
+    def record_latency(self, seconds):
+        alpha = config.LLM_EWMA_ALPHA
+        if self.ewma_first_token_s is None:
+            self.ewma_first_token_s = seconds
+        else:
+            self.ewma_first_token_s = alpha * seconds + (1 - alpha) * self.ewma_first_token_s
+        metrics.set_gauge(f"llm.{self.name}.first_token_ewma_s", self.ewma_first_token_s)
+
+
+class LLMGatewayError(Exception):
+    """所有端点都失败或超时。"""
+
+
+class LLMGateway:
+    """
+    多端点LLM网关。
+
+    - 端点按首字延迟EWMA排序，尚无测量数据的端点保持配置顺序排在后面；
+    - 首选端点在首字截止时间内没有产出任何文本时，对下一个端点发起对冲请求；
+    - 哪个端点先产出第一个文本片段，哪个就胜出，其余请求立即取消；
+    - 端点报错时直接切换到下一个端点，不必等待截止时间；
+    - 胜出之后只限制片段之间的间隔（LLM_CHUNK_TIMEOUT_S），调用方边读边播时生成器会长时间挂起，不计入超时。
+    每次尝试在独立的守护线程中运行：卡住的请求不会占住共享的工作线程、挡住后续的对冲请求。
+    """
+    def __init__(self, endpoints, first_token_deadline_s=None, total_timeout_s=None, chunk_timeout_s=None):
+        self.endpoints = endpoints
+        self.first_token_deadline_s = config.LLM_FIRST_TOKEN_DEADLINE_S if first_token_deadline_s is None else first_token_deadline_s
+        self.total_timeout_s = config.LLM_TOTAL_TIMEOUT_S if total_timeout_s is None else total_timeout_s
+        self.chunk_timeout_s = config.LLM_CHUNK_TIMEOUT_S if chunk_timeout_s is None else chunk_timeout_s
+
+    def warm_up(self):
+        """提前构造各端点的客户端（包括导入SDK），使第一次对话不必付出这部分开销"""
+        for endpoint in self.endpoints:
+            endpoint._get_client()
+
+    def ranked_endpoints(self):
+        indexed = list(enumerate(self.endpoints))
+        indexed.sort(key=lambda item: (item[1].ewma_first_token_s is None, item[1].ewma_first_token_s or 0.0, item[0]))
+        return [endpoint for _, endpoint in indexed]
+
+    def _run_attempt(self, attempt_id, endpoint, messages, token, results):
+        try:
+            for piece in endpoint.stream_content(messages, token):
+                results.put(("piece", attempt_id, piece))
+            results.put(("done", attempt_id, None))
+        except Exception as e:
+            results.put(("error", attempt_id, e))
+
+    def stream(self, messages, cancel_token=None):
+        """
+        对外的流式接口，逐个产出文本片段。
+
+        Raises:
+            LLMGatewayError: 所有端点都失败或总超时。
+        """
+        order = self.ranked_endpoints()
+        results = Queue()
+        attempts = []  # [(endpoint, token, started_at)]
+
+        def on_cancel():
+            results.put(("cancelled", None, None))
+
+        def start_next():
+            endpoint = order[len(attempts)]
+            token = CancelToken(parent=cancel_token)
+            attempts.append((endpoint, token, time.monotonic()))
+            if len(attempts) > 1:
+                log.info(f"[LLM-Gateway] 对冲请求: {endpoint.name}")
+                metrics.inc("llm.hedged")
+            threading.Thread(target=self._run_attempt, args=(len(attempts) - 1, endpoint, messages, token, results),
+                             name=f"llm-{endpoint.name}", daemon=True).start()
+
+        def cancel_others(keep=None):
+            for attempt_id, (_, token, _) in enumerate(attempts):
+                if attempt_id != keep: token.cancel()
+                if keep is None: token.detach()
+
+        start_time = time.monotonic()
+        total_deadline = start_time + self.total_timeout_s
+        winner = None
+        failed = set()
+        if cancel_token: cancel_token.add_callback(on_cancel)
+        start_next()
+        hedge_at = start_time + self.first_token_deadline_s
+        try:
+            while True:
+                now = time.monotonic()
+                if winner is not None:
+                    # 每次等待单独计时：生成器挂起（调用方在播放）的时间不算
+                    timeout = self.chunk_timeout_s
+                elif len(attempts) < len(order):
+                    timeout = max(0.0, min(hedge_at, total_deadline) - now)
+                else:
+                    timeout = max(0.0, total_deadline - now)
+                try:
+                    kind, attempt_id, payload = results.get(timeout=timeout)
+                except Empty:
+                    if winner is not None:
+                        raise LLMGatewayError(f"LLM流超过 {self.chunk_timeout_s}s 没有新内容")
+                    if len(attempts) < len(order) and time.monotonic() < total_deadline:
+                        # 首字截止时间已到：对还在等待的端点记一次惩罚延迟，并对冲下一个端点
+                        for endpoint, token, started_at in attempts:
+                            if not token.is_cancelled(): endpoint.record_latency(time.monotonic() - started_at)
+                        start_next()
+                        hedge_at = time.monotonic() + self.first_token_deadline_s
+                        continue
+                    raise LLMGatewayError("LLM请求超时")
+
+                if kind == "cancelled":
+                    return
+                endpoint, _, started_at = attempts[attempt_id]
+                if winner is None:
+                    if kind == "piece":
+                        winner = attempt_id
+                        cancel_others(keep=winner)
+                        latency = time.monotonic() - started_at
+                        endpoint.record_latency(latency)
+                        metrics.inc(f"llm.win.{endpoint.name}")
+                        log.info(f"[LLM-Gateway] {endpoint.name} 胜出，首字延迟 {latency * 1000:.0f}ms。")
+                        yield payload
+                        continue
+                    # 尚未产出任何文本就失败或结束
+                    log.warning(f"[LLM-Gateway] 端点 {endpoint.name} 失败: {payload or '空回复'}")
+                    metrics.inc(f"llm.{endpoint.name}.errors")
+                    endpoint.record_latency(config.LLM_ERROR_PENALTY_S)
+                    failed.add(attempt_id)
+                    if len(failed) < len(attempts):
+                        continue
+                    if len(attempts) < len(order):
+                        start_next()
+                        hedge_at = time.monotonic() + self.first_token_deadline_s
+                        continue
+                    raise LLMGatewayError(f"所有LLM端点均失败: {payload}")
+                elif attempt_id == winner:
+                    if kind == "piece":
+                        yield payload
+                    elif kind == "error":
+                        raise LLMGatewayError(f"LLM流在中途中断: {payload}")
+                    else:
+                        return
+        finally:
+            if cancel_token: cancel_token.remove_callback(on_cancel)
+            cancel_others()
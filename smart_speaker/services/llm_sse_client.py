@@ -0,0 +1,118 @@
+# smart_speaker/services/llm_sse_client.py
+# 一个极简的、兼容OpenAI协议的流式 chat/completions 客户端。
+# 只依赖标准库：HTTP长连接 + 增量解析SSE行，只提取 choices[0].delta.content，
+# 避免在低功耗ARM设备上导入openai SDK并为每个增量构造模型对象的开销。
+import http.client
+import json
+import socket
+import ssl
+import threading
+from urllib.parse import urlsplit
+
+
+class LLMHTTPError(Exception):
+    """服务端返回了非200状态码。"""
+    def __init__(self, status, body):
+        super().__init__(f"Error code: {status} - {body}")
+        self.status = status
+
+
+class SSEChatClient:
+    def __init__(self, base_url, api_key, timeout=60, max_idle_connections=2, extra_headers=None):
+        parts = urlsplit(base_url)
+        self.is_https = parts.scheme == "https"
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.is_https else 80)
+        self.path = parts.path.rstrip("/") + "/chat/completions"
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_idle_connections = max_idle_connections
+        self.extra_headers = extra_headers or {}
+        self._idle = []
+        self._lock = threading.Lock()
+        self._ssl_context = ssl.create_default_context() if self.is_https else None
+
+    def _new_connection(self):
+        if self.is_https:
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout, context=self._ssl_context)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self):
+        """优先复用空闲的长连接，返回 (连接, 是否复用)"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._new_connection(), False
+
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.max_idle_connections:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _open(self, body):
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
+            "Authorization": f"Bearer {self.api_key}",
+            **self.extra_headers,
+        }
+        conn, reused = self._acquire()
+        try:
+            conn.request("POST", self.path, body=body, headers=headers)
+            return conn, conn.getresponse()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            if not reused: raise
+        # 复用的连接可能已被服务端关闭，用新连接重试一次
+        conn = self._new_connection()
+        conn.request("POST", self.path, body=body, headers=headers)
+        return conn, conn.getresponse()
+
+    def stream_content(self, model, messages, cancel_token=None):
+        """
+        发起流式请求，逐个产出 delta.content 文本片段。
+
+        Raises:
+            LLMHTTPError: 服务端返回非200状态码。
+            OSError / http.client.HTTPException: 网络错误。
+        """
+        body = json.dumps({"model": model, "messages": messages, "stream": True}, ensure_ascii=False).encode("utf-8")
+        conn, response = self._open(body)
+        if response.status != 200:
+            error_body = response.read().decode("utf-8", errors="ignore")
+            conn.close()
+            raise LLMHTTPError(response.status, error_body)
+
+        def on_cancel():
+            # shutdown能立即唤醒阻塞在recv上的读取线程，单纯close做不到
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except (OSError, AttributeError):
+                pass
+
+        if cancel_token: cancel_token.add_callback(on_cancel)
+        finished = False
+        try:
+            for line in response:
+                if not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    finished = True
+                    break
+                choices = json.loads(data).get("choices")
+                if choices:
+                    content = choices[0].get("delta", {}).get("content")
+                    if content is not None:
+                        yield content
+            if finished:
+                # 读完剩余的分块结束标记，连接才能放回池中复用
+                response.read()
+        finally:
+            if cancel_token: cancel_token.remove_callback(on_cancel)
+            if finished and not response.will_close and not (cancel_token and cancel_token.is_cancelled()):
+                self._release(conn)
+            else:
+                conn.close()
@@ -0,0 +1,46 @@
+# smart_speaker/services/local_asr_service.py
+import json
+
+import config
+from .wake_word_service import get_vosk_model
+from ..log import get_logger
+
+log = get_logger(__name__)
+
+
+class LocalTranscriber:
+    """使用内置Vosk模型（完整词表）对一段短录音做本地转写。"""
+    def __init__(self):
+        self.model = None
+        try:
+            self.model = get_vosk_model()
+        except Exception as e:
+            log.error(f"❌ 本地转写器初始化失败: {e}")
+
+    def transcribe(self, pcm, cancel_token=None):
+        """
+        Args:
+            pcm (bytes): 16kHz, 16-bit, 单声道的PCM音频。
+            cancel_token (CancelToken, optional): 取消后尽快停止解码。
+
+        Returns:
+            tuple | None: (文本, 平均词置信度)，失败或被取消时返回None。
+        """
+        if not self.model:
+            return None
+
+        from vosk import KaldiRecognizer
+        # 每次新建识别器：模型图是共享的，创建开销很小，且保证并发安全
+        recognizer = KaldiRecognizer(self.model, config.TARGET_RATE)
+        recognizer.SetWords(True)
+        view = memoryview(pcm)
+        for offset in range(0, len(view), config.CHUNK_SIZE):
+            if cancel_token and cancel_token.is_cancelled():
+                return None
+            recognizer.AcceptWaveform(bytes(view[offset:offset + config.CHUNK_SIZE]))
+        result = json.loads(recognizer.FinalResult())
+
+        words = result.get("result", [])
+        text = result.get("text", "").replace(" ", "")
+        confidence = sum(w.get("conf", 0.0) for w in words) / len(words) if words else 0.0
+        return text, confidence
@@ -0,0 +1,63 @@
+# smart_speaker/services/local_command_service.py
+import json
+import threading
+
+import config
+from .wake_word_service import get_vosk_model
+from ..log import get_logger
+
+log = get_logger(__name__)
+
+
+class LocalCommandRecognizer:
+    """
+    基于Vosk语法(grammar)模式的本地命令识别器。
+    只在一个很小的固定词表上解码，速度远快于"上传TOS + 云端ASR"，
+    用于在本地直接识别出"退出"、"开启新会话"等元指令。
+    """
+    def __init__(self, phrases):
+        self.recognizer = None
+        self.phrases = [p for p in phrases if p]
+        self._lock = threading.Lock()
+
+        if not self.phrases:
+            log.info("[Local-Command] 未提供任何本地命令短语，本地识别不可用。")
+            return
+
+        try:
+            model = get_vosk_model()
+            from vosk import KaldiRecognizer
+            grammar = json.dumps(self.phrases + ["[unk]"], ensure_ascii=False)
+            self.recognizer = KaldiRecognizer(model, config.TARGET_RATE, grammar)
+            self.recognizer.SetWords(True)
+            log.info(f"[Local-Command] ✅ 本地命令识别器已就绪，语法: {self.phrases}")
+        except Exception as e:
+            log.error(f"❌ 本地命令识别器创建失败: {e}")
+
+    def recognize(self, pcm):
+        """
+        对一整段录音进行本地语法识别。
+
+        Args:
+            pcm (bytes): 16kHz, 16-bit, 单声道的PCM音频。
+
+        Returns:
+            dict | None: {"text": 识别出的已知词, "has_unknown": 是否含有未知词, "confidence": 已知词的平均置信度}
+        """
+        if not self.recognizer:
+            return None
+
+        with self._lock:
+            view = memoryview(pcm)
+            for offset in range(0, len(view), config.CHUNK_SIZE):
+                self.recognizer.AcceptWaveform(bytes(view[offset:offset + config.CHUNK_SIZE]))
+            result = json.loads(self.recognizer.FinalResult())
+
+        words = result.get("result", [])
+        known = [w for w in words if w.get("word") != "[unk]"]
+        confidence = sum(w.get("conf", 0.0) for w in known) / len(known) if known else 0.0
+        return {
+            "text": "".join(w["word"] for w in known),
+            "has_unknown": len(known) != len(words),
+            "confidence": confidence,
+        }
@@ -0,0 +1,50 @@
+# smart_speaker/services/local_tts_service.py
+import shutil
+import subprocess
+
+import config
+from ..log import get_logger
+
+log = get_logger(__name__)
+
+
+class LocalTTSService:
+    """
+    离线的本地TTS后端：调用CPU上运行的 espeak-ng，合成结果为WAV，ffplay可以直接从管道播放。
+    音色不如云端自然，但不依赖网络，用来播报简短的确认语和在云端过慢时兜底。
+    """
+    name = "local"
+    encoding = "wav"
+
+    def __init__(self):
+        self.command = shutil.which(config.LOCAL_TTS_COMMAND) if config.LOCAL_TTS_ENABLED else None
+        if config.LOCAL_TTS_ENABLED and not self.command:
+            log.info(f"[TTS-Local] 未找到 '{config.LOCAL_TTS_COMMAND}'，本地语音合成不可用。")
+
+    def available(self):
+        return self.command is not None
+
+    def get_audio_stream(self, text, cancel_token=None):
+        """逐块产出合成好的WAV音频；取消时直接结束合成进程"""
+        if not text.strip() or not self.available(): return
+        if cancel_token and cancel_token.is_cancelled(): return
+        command = [self.command, "-v", config.LOCAL_TTS_VOICE, "-s", str(config.LOCAL_TTS_SPEED), "--stdout", text]
+        try:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except OSError as e:
+            log.error(f"❌ 启动本地语音合成失败: {e}"); return
+
+        def on_cancel():
+            if process.poll() is None: process.kill()
+
+        if cancel_token: cancel_token.add_callback(on_cancel)
+        try:
+            while True:
+                chunk = process.stdout.read1(config.CHUNK_SIZE * 4)
+                if not chunk: break
+                yield chunk
+        finally:
+            if cancel_token: cancel_token.remove_callback(on_cancel)
+            on_cancel()
+            process.stdout.close()
+            process.wait()
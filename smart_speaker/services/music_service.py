@@ -3,16 +3,20 @@ import requests
 import urllib.parse
 from typing import Optional, Dict, Any
 
-# 网易云音乐API的基地址
-SEARCH_API_URL = "https://music.163.com/api/search/get/web"
-SONG_URL_TEMPLATE = "https://music.163.com/song/media/outer/url?id={}.mp3"
+import config
+from .. import http_client
+from ..log import get_logger
 
-# 创建一个持久化的HTTP会话，可以复用连接
-http_session = requests.Session()
-# 设置一个浏览器User-Agent，避免被API拒绝
-http_session.headers.update({
+log = get_logger(__name__)
+
+# 网易云音乐API的基地址（配置了车队网关时指向网关，由网关共享搜索结果和播放地址缓存）
+SEARCH_API_URL = config.MUSIC_SEARCH_URL
+SONG_URL_TEMPLATE = config.MUSIC_SONG_URL_TEMPLATE
+
+# 设置一个浏览器User-Agent，避免被API拒绝（连接复用由共享的http_client负责）
+HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/107.0.0.0 Safari/537.36'
-})
+}
 
 def search_song(song_name: str) -> Optional[Dict[str, Any]]:
     """
@@ -31,10 +35,10 @@ def search_song(song_name: str) -> Optional[Dict[str, Any]]:
     encoded_song_name = urllib.parse.quote(song_name)
     full_url = f"{SEARCH_API_URL}?s={encoded_song_name}&type=1"
     
-    print(f"[MusicService] 正在搜索歌曲: '{song_name}' (URL: {full_url})")
+    log.info(f"[MusicService] 正在搜索歌曲: '{song_name}' (URL: {full_url})")
     
     try:
-        response = http_session.get(full_url, timeout=10)
+        response = http_client.get(full_url, endpoint="music", headers=HEADERS)
         response.raise_for_status() # 检查HTTP错误
         
         data = response.json()
@@ -55,7 +59,7 @@ def search_song(song_name: str) -> Optional[Dict[str, Any]]:
 
             if best_song:
                 artist_names = ", ".join([artist['name'] for artist in best_song.get('artists', [])])
-                print(f"[MusicService] ✅ 找到最匹配歌曲: '{best_song['name']}' - {artist_names} (ID: {best_song['id']})")
+                log.info(f"[MusicService] ✅ 找到最匹配歌曲: '{best_song['name']}' - {artist_names} (ID: {best_song['id']})")
                 
                 return {
                     "id": best_song['id'],
@@ -64,9 +68,9 @@ def search_song(song_name: str) -> Optional[Dict[str, Any]]:
                 }
             
     except requests.exceptions.RequestException as e:
-        print(f"❌ 音乐搜索网络请求失败: {e}")
+        log.error(f"❌ 音乐搜索网络请求失败: {e}")
     except (KeyError, IndexError, TypeError) as e:
-        print(f"❌ 解析音乐搜索结果失败: {e}")
+        log.error(f"❌ 解析音乐搜索结果失败: {e}")
         
     return None
 
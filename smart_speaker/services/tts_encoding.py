@@ -0,0 +1,71 @@
+# smart_speaker/services/tts_encoding.py
+# TTS输出编码协商：在 原始PCM / Ogg Opus / MP3 之间为当前部署选择解码开销最小、且带宽允许的编码。
+import json
+import shutil
+
+import config
+from ..log import get_logger
+
+log = get_logger(__name__)
+
+# 各编码在16kHz单声道语音下的大致码率(kbps)，没有测量数据时用于带宽判断
+NOMINAL_KBPS = {"pcm": config.TTS_SAMPLE_RATE * 16 / 1000, "ogg_opus": 24, "mp3": 32}
+# 没有测量数据时的偏好顺序：PCM不需要解码，Opus解码比MP3更省CPU
+DEFAULT_PREFERENCE = ("pcm", "ogg_opus", "mp3")
+
+_negotiated = None
+
+
+def player_available(encoding):
+    """播放该编码所需的播放器是否存在：PCM用aplay直接写声卡，压缩格式需要ffplay解码"""
+    if encoding == "pcm":
+        return shutil.which("aplay") is not None or shutil.which("ffplay") is not None
+    return shutil.which("ffplay") is not None
+
+
+def load_measurements(path=None):
+    """读取 test/bench_tts_encoding.py --save 写入的测量结果: {编码: {"cpu_per_speech_s", "kbps", ...}}"""
+    path = path or config.TTS_ENCODING_BENCH_FILE
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def negotiate_encoding():
+    """
+    选择TTS输出编码（进程内只协商一次）。
+
+    TTS_ENCODING 明确指定时直接使用；为 auto 时：
+    1. 去掉播放器不可用的编码，以及码率超过 TTS_BANDWIDTH_KBPS（如配置）的编码；
+    2. 有本机测量数据时选择每秒语音解码CPU最少的编码，否则按 PCM > Opus > MP3 的顺序选择。
+    """
+    global _negotiated
+    if _negotiated: return _negotiated
+    if config.TTS_ENCODING != "auto":
+        _negotiated = config.TTS_ENCODING
+        return _negotiated
+
+    measurements = load_measurements()
+    candidates = []
+    for encoding in DEFAULT_PREFERENCE:
+        if not player_available(encoding): continue
+        kbps = measurements.get(encoding, {}).get("kbps", NOMINAL_KBPS[encoding])
+        if config.TTS_BANDWIDTH_KBPS and kbps > config.TTS_BANDWIDTH_KBPS: continue
+        candidates.append(encoding)
+    if not candidates:
+        _negotiated = "mp3"
+    elif all(encoding in measurements for encoding in candidates):
+        _negotiated = min(candidates, key=lambda e: measurements[e].get("cpu_per_speech_s", float("inf")))
+    else:
+        _negotiated = candidates[0]
+    source = "本机测量数据" if measurements else "默认偏好"
+    log.info(f"[TTS] 协商输出编码: {_negotiated} (依据: {source}{'，带宽上限 %skbps' % config.TTS_BANDWIDTH_KBPS if config.TTS_BANDWIDTH_KBPS else ''})")
+    return _negotiated
+
+
+def reset_negotiation():
+    """清除协商结果（测量数据更新后重新协商）"""
+    global _negotiated
+    _negotiated = None
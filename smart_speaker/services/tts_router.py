@@ -0,0 +1,178 @@
+# smart_speaker/services/tts_router.py
+import struct
+import threading
+import time
+from queue import Queue, Empty
+
+import config
+from ..turn_scheduler import CancelToken
+from ..metrics import metrics
+from ..log import get_logger
+
+log = get_logger(__name__)
+
+# MPEG Layer III 的比特率表(kbps)和采样率表，用于从mp3数据估算音频时长
+_MP3_BITRATES = {
+    "mpeg1": (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    "mpeg2": (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def _mp3_duration_s(data):
+    """逐帧解析mp3帧头并累加时长（只支持Layer III，遇到无法识别的数据就停止）"""
+    pos = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = data[6] << 21 | data[7] << 14 | data[8] << 7 | data[9]
+        pos = 10 + size
+    duration = 0.0
+    while pos + 4 <= len(data):
+        b1, b2 = data[pos + 1], data[pos + 2]
+        version = (b1 >> 3) & 3
+        if data[pos] != 0xFF or (b1 & 0xE0) != 0xE0 or version == 1 or ((b1 >> 1) & 3) != 1:
+            break
+        bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+        if bitrate_index in (0, 15) or rate_index == 3: break
+        bitrate = _MP3_BITRATES["mpeg1" if version == 3 else "mpeg2"][bitrate_index] * 1000
+        sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+        samples = 1152 if version == 3 else 576
+        pos += samples // 8 * bitrate // sample_rate + ((b2 >> 1) & 1)
+        duration += samples / sample_rate
+    return duration
+
+
+def _ogg_duration_s(data):
+    """Ogg Opus 最后一页的granule position即为48kHz下的累计采样数"""
+    last_page = data.rfind(b"OggS")
+    if last_page < 0 or len(data) < last_page + 14: return 0.0
+    granule = struct.unpack("<q", data[last_page + 6:last_page + 14])[0]
+    return max(0, granule) / 48000
+
+
+def audio_duration_s(data, encoding):
+    """估算一段合成音频的播放时长（秒），用于计算实时率"""
+    if encoding == "pcm":
+        return len(data) / (config.TTS_SAMPLE_RATE * 2)
+    if encoding == "ogg_opus":
+        return _ogg_duration_s(data)
+    if encoding == "wav":
+        if len(data) < 44 or data[:4] != b"RIFF": return 0.0
+        channels, sample_rate = struct.unpack("<HI", data[22:28])
+        bits = struct.unpack("<H", data[34:36])[0]
+        return (len(data) - 44) / (sample_rate * channels * bits // 8)
+    if encoding == "mp3":
+        return _mp3_duration_s(data)
+    return 0.0
+
+
+class AudioStream:
+    """
+    带编码信息的音频块迭代器，播放层据此选择播放器。
+    回退到其他后端时，在产出第一个音频块之前更新 encoding。
+    """
+    def __init__(self, chunks, encoding):
+        self._chunks = iter(chunks)
+        self.encoding = encoding
+
+    def __iter__(self):
+        return self._chunks
+
+
+class TTSRouter:
+    """
+    按延迟在多个TTS后端之间路由，对外提供和 TTSService 相同的 get_audio_stream 接口。
+
+    - 已预合成缓存的提示语直接用云端缓存（零等待且音色一致）；
+    - 模板化的确认语和很短的句子交给本地引擎，不受网络影响；
+    - 其余（LLM的长回复）走云端音色，云端在首字节截止时间内没有返回任何音频时，取消云端请求并改用本地引擎。
+    每个后端的首字节延迟、合成耗时和实时率(合成耗时/音频时长)记录在 tts.<后端>.* 指标中。
+    """
+    def __init__(self, cloud, local):
+        self.cloud = cloud
+        self.local = local
+
+    def prewarm(self, texts):
+        self.cloud.prewarm(texts)
+
+    def choose_backend(self, text, templated=False):
+        if self.cloud.has_cached(text) or not self.local.available():
+            return self.cloud
+        if templated or len(text.strip()) <= config.TTS_LOCAL_MAX_CHARS:
+            return self.local
+        return self.cloud
+
+    def get_audio_stream(self, text, cancel_token=None, templated=False):
+        if not text.strip(): return AudioStream([], self.cloud.encoding)
+        backend = self.choose_backend(text, templated)
+        if backend is self.local:
+            metrics.inc("tts.route.local")
+            return AudioStream(self._measure(self.local, self.local.get_audio_stream(text, cancel_token)), self.local.encoding)
+        metrics.inc("tts.route.cloud")
+        if not self.local.available():
+            return AudioStream(self._measure(self.cloud, self.cloud.get_audio_stream(text, cancel_token)), self.cloud.encoding)
+        stream = AudioStream([], self.cloud.encoding)
+        stream._chunks = self._cloud_with_fallback(text, cancel_token, stream)
+        return stream
+
+    def _cloud_with_fallback(self, text, cancel_token, stream):
+        """
+        云端合成在独立线程中拉取，首字节超时或没有产出音频时切换到本地引擎。
+        TTSService 自己还要占用一个线程运行WebSocket连接，拉取线程不能放进共享I/O线程池，
+        否则线程池被占满时云端请求还没开始就被判定超时。
+        """
+        cloud_token = CancelToken(parent=cancel_token)
+        # 使用独立实例合成，被放弃的云端请求不会和后续请求共用音频队列
+        synthesizer = type(self.cloud)(self.cloud.encoding)
+        chunks = Queue()
+
+        def pump():
+            try:
+                for chunk in self._measure(self.cloud, synthesizer.get_audio_stream(text, cloud_token)):
+                    chunks.put(chunk)
+            except Exception as e:
+                log.error(f"❌ 云端语音合成出错: {e}")
+            finally:
+                chunks.put(None)
+
+        threading.Thread(target=pump, name="tts-cloud-pump", daemon=True).start()
+        try:
+            first = chunks.get(timeout=config.TTS_CLOUD_FIRST_BYTE_DEADLINE_S)
+        except Empty:
+            first = None
+            log.info(f"[TTS-Router] 云端首字节超过 {config.TTS_CLOUD_FIRST_BYTE_DEADLINE_S}s，改用本地合成。")
+        if first is None:
+            cloud_token.cancel(); cloud_token.detach()
+            if cancel_token and cancel_token.is_cancelled(): return
+            metrics.inc("tts.route.fallback_local")
+            stream.encoding = self.local.encoding
+            yield from self._measure(self.local, self.local.get_audio_stream(text, cancel_token))
+            return
+        try:
+            yield first
+            while True:
+                chunk = chunks.get()
+                if chunk is None: break
+                yield chunk
+        finally:
+            cloud_token.cancel(); cloud_token.detach()
+
+    def _measure(self, backend, stream):
+        """透传音频块，同时统计首字节延迟、合成耗时和实时率"""
+        start_time = time.monotonic()
+        first_byte_at = None
+        audio = bytearray()
+        completed = False
+        try:
+            for chunk in stream:
+                if first_byte_at is None:
+                    first_byte_at = time.monotonic()
+                    metrics.observe(f"tts.{backend.name}.first_byte_s", first_byte_at - start_time)
+                audio += chunk
+                yield chunk
+            completed = True
+        finally:
+            synth_s = time.monotonic() - start_time
+            duration = audio_duration_s(bytes(audio), backend.encoding) if completed else 0.0
+            if duration > 0:
+                metrics.observe(f"tts.{backend.name}.synth_s", synth_s)
+                metrics.observe(f"tts.{backend.name}.rtf", synth_s / duration)
@@ -1,19 +1,45 @@
 # services/tts_service.py
-import json, uuid, struct, threading, websocket
+import json, uuid, struct, threading
 from queue import Queue, Empty
-from config import TTS_APPID, TTS_TOKEN, TTS_CLUSTER, TTS_VOICE_TYPE, TTS_WS_URL
+from config import TTS_APPID, TTS_TOKEN, TTS_CLUSTER, TTS_VOICE_TYPE, TTS_WS_URL, TTS_SAMPLE_RATE, DEVICE_HEADERS
+from .tts_encoding import negotiate_encoding
+from ..log import get_logger
+
+log = get_logger(__name__)
 
 class TTSService:
-    # ... (__init__, _construct_request_data 不变) ...
-    def __init__(self):
+    """
+    云端TTS后端（火山引擎大模型语音合成，WebSocket流式返回音频）。
+    输出编码(pcm / ogg_opus / mp3)默认由 negotiate_encoding() 按部署协商，也可以按实例指定（如浏览器需要mp3）。
+    """
+    name = "cloud"
+
+    # 预合成的固定提示语: (编码, 文本) -> 完整音频；所有会话（房间）共用一份
+    _prompt_cache = {}
+
+    def __init__(self, encoding=None):
+        self.encoding = encoding or negotiate_encoding()
         self.ws = None; self.ws_thread = None; self.audio_queue = Queue(); self.is_finished = threading.Event()
 
+    def has_cached(self, text):
+        return (self.encoding, text) in self._prompt_cache
+
+    def prewarm(self, texts):
+        """预先合成固定提示语并缓存，之后播放这些提示语不再需要联网合成"""
+        if not all([TTS_APPID, TTS_TOKEN]): return
+        # 使用独立实例合成，避免与正在进行的合成共用音频队列
+        synthesizer = TTSService(self.encoding)
+        for text in texts:
+            audio = b"".join(synthesizer.get_audio_stream(text))
+            if audio: self._prompt_cache[(self.encoding, text)] = audio
+        log.info(f"[TTS] ✅ 已预合成 {len(self._prompt_cache)} 条提示语 ({self.encoding})。")
+
     def _construct_request_data(self, text):
         req_id = str(uuid.uuid4())
         payload_dict = {
             "app": {"appid": TTS_APPID, "token": TTS_TOKEN, "cluster": TTS_CLUSTER},
             "user": {"uid": "s805_smart_speaker_user"},
-            "audio": {"voice_type": TTS_VOICE_TYPE, "encoding": "mp3", "rate": 16000},
+            "audio": {"voice_type": TTS_VOICE_TYPE, "encoding": self.encoding, "rate": TTS_SAMPLE_RATE},
             "request": {"reqid": req_id, "text": text, "operation": "submit"}
         }
         payload_json = json.dumps(payload_dict).encode('utf-8')
@@ -27,7 +53,7 @@ class TTSService:
         if not isinstance(message, bytes): return
         
         # 打印收到的原始消息，用于调试
-        # print(f"[TTS-Debug] 收到原始二进制消息 (长度: {len(message)}): {message[:60]}...")
+        # log.info(f"[TTS-Debug] 收到原始二进制消息 (长度: {len(message)}): {message[:60]}...")
 
         try:
             # 至少需要4字节的Header
@@ -39,13 +65,13 @@ class TTSService:
             if msg_type == 0b1011: # Audio-only server response
                 # 必须至少有 Header(4) + Seq(4) + Size(4) = 12 字节
                 if len(message) < 12:
-                    print(f"[TTS-Warn] 收到一个不完整的音频响应包 (长度: {len(message)})")
+                    log.warning(f"[TTS-Warn] 收到一个不完整的音频响应包 (长度: {len(message)})")
                     return
                 
                 payload_size = struct.unpack('>I', message[8:12])[0]
                 # 确认包的剩余长度足够
                 if len(message) < 12 + payload_size:
-                    print(f"[TTS-Warn] 音频包数据不完整，期望 {payload_size} 字节，实际 {len(message)-12} 字节。")
+                    log.warning(f"[TTS-Warn] 音频包数据不完整，期望 {payload_size} 字节，实际 {len(message)-12} 字节。")
                     return
 
                 audio_data = message[12 : 12 + payload_size]
@@ -58,46 +84,86 @@ class TTSService:
             elif msg_type == 0b1111: # Error message
                 # 错误包也需要有最小长度
                 if len(message) < 12:
-                    print(f"[TTS-Warn] 收到一个不完整的错误响应包 (长度: {len(message)})")
+                    log.error(f"[TTS-Warn] 收到一个不完整的错误响应包 (长度: {len(message)})")
                     return
                 # 根据文档，错误包格式为 Header(4) + Code(4) + Size(4) + Message
                 error_code = struct.unpack('>I', message[4:8])[0]
                 error_msg_size = struct.unpack('>I', message[8:12])[0]
                 error_msg = message[12 : 12 + error_msg_size].decode('utf-8')
-                print(f"❌ TTS 服务器返回错误: Code={error_code}, Message='{error_msg}'")
+                log.error(f"❌ TTS 服务器返回错误: Code={error_code}, Message='{error_msg}'")
                 self.audio_queue.put(None)
                 self.is_finished.set()
             else:
-                print(f"[TTS-Warn] 收到未知类型的消息: Type={msg_type}")
+                log.warning(f"[TTS-Warn] 收到未知类型的消息: Type={msg_type}")
 
         except Exception as e:
-            print(f"❌ 处理TTS消息时发生异常: {e}")
+            log.error(f"❌ 处理TTS消息时发生异常: {e}")
             self.audio_queue.put(None)
             self.is_finished.set()
 
     # ... (_on_error, _on_close, _on_open, get_audio_stream 方法保持不变) ...
     def _on_error(self, ws, error):
-        print(f"❌ TTS WebSocket 错误: {error}"); self.audio_queue.put(None); self.is_finished.set()
+        # 已取消的连接在建立过程中被关闭时，websocket-client 会报告各种错误，不必记录
+        if not getattr(ws, "cancelled", False): log.error(f"❌ TTS WebSocket 错误: {error}")
+        self.audio_queue.put(None); self.is_finished.set()
     def _on_close(self, ws, _, __):
-        print("[TTS] WebSocket 连接已关闭。"); self.is_finished.set(); self.audio_queue.put(None)
+        log.info("[TTS] WebSocket 连接已关闭。"); self.is_finished.set(); self.audio_queue.put(None)
     def _on_open(self, ws):
-        print("[TTS] WebSocket 已连接，正在发送合成请求..."); ws.send(ws.request_data, opcode=websocket.ABNF.OPCODE_BINARY)
+        from websocket import ABNF
+        # 连接建立前已被取消：close() 在 run_forever 开始前调用会被忽略，这里让 run_forever 直接结束，不再发送合成请求
+        if ws.cancelled: ws.keep_running = False; return
+        log.info("[TTS] WebSocket 已连接，正在发送合成请求..."); ws.send(ws.request_data, opcode=ABNF.OPCODE_BINARY)
+
+    @staticmethod
+    def _run_connection(ws):
+        if ws.cancelled: return
+        ws.run_forever()
 
-    def get_audio_stream(self, text):
+    @staticmethod
+    def _cancel_connection(ws):
+        """标记取消并结束连接；还在建立中的连接不能直接close()（会和run_forever争用socket），由 _on_open 结束"""
+        ws.cancelled = True
+        if ws.sock and ws.sock.connected: ws.close()
+        else: ws.keep_running = False
+
+    def get_audio_stream(self, text, cancel_token=None):
         if not text.strip(): return iter([])
-        if not all([TTS_APPID, TTS_TOKEN]): print("❌ TTS 服务错误: AppID 或 Token 未配置。"); return iter([])
+        if not all([TTS_APPID, TTS_TOKEN]): log.error("❌ TTS 服务错误: AppID 或 Token 未配置。"); return iter([])
+        if cancel_token and cancel_token.is_cancelled(): return iter([])
+        cached = self._prompt_cache.get((self.encoding, text))
+        if cached: return iter([cached])
+        # websocket-client 在第一次合成时才导入
+        import websocket
         self.is_finished.clear()
         while not self.audio_queue.empty():
             try: self.audio_queue.get_nowait()
             except Empty: break
         request_data = self._construct_request_data(text)
-        headers = {"Authorization": f"Bearer; {TTS_TOKEN}"}
+        headers = {"Authorization": f"Bearer; {TTS_TOKEN}", **DEVICE_HEADERS}
         self.ws = websocket.WebSocketApp(TTS_WS_URL, header=headers, on_open=self._on_open, on_message=self._on_message, on_error=self._on_error, on_close=self._on_close)
         self.ws.request_data = request_data
-        self.ws_thread = threading.Thread(target=self.ws.run_forever, daemon=True)
+        self.ws.cancelled = False
+        # 每条连接一个专用线程，立即开始连接；放进共享线程池排队时，排队期间的取消会丢失
+        self.ws_thread = threading.Thread(target=self._run_connection, args=(self.ws,), name="tts-ws", daemon=True)
         self.ws_thread.start()
-        while True:
-            chunk = self.audio_queue.get()
-            if chunk is None: break
-            yield chunk
-        print("[TTS] 音频流已全部生成。")
\ No newline at end of file
+        return self._iter_audio(self.ws, cancel_token)
+
+    def _iter_audio(self, ws, cancel_token):
+        def on_cancel():
+            # 取消时立即解除消费者的阻塞，并关闭连接让run_forever尽快返回
+            self.audio_queue.put(None)
+            self._cancel_connection(ws)
+
+        if cancel_token: cancel_token.add_callback(on_cancel)
+        try:
+            while True:
+                chunk = self.audio_queue.get()
+                if chunk is None: break
+                yield chunk
+            if cancel_token and cancel_token.is_cancelled():
+                log.info("[TTS] 合成已取消。")
+            else:
+                log.info("[TTS] 音频流已全部生成。")
+        finally:
+            if cancel_token: cancel_token.remove_callback(on_cancel)
+            self._cancel_connection(ws)
@@ -1,7 +1,25 @@
 # smart_speaker/services/wake_word_service.py
 import json
-from vosk import Model, KaldiRecognizer
+import threading
 import config
+from ..log import get_logger
+
+log = get_logger(__name__)
+
+_model = None
+_model_lock = threading.Lock()
+
+def get_vosk_model():
+    """加载并返回进程内共享的Vosk模型实例（只加载一次）"""
+    global _model
+    with _model_lock:
+        if _model is None:
+            # vosk在第一次加载模型时才导入，避免拖慢进程启动
+            from vosk import Model
+            log.info(f"[Vosk] 正在从 '{config.VOSK_MODEL_PATH}' 加载模型...")
+            _model = Model(config.VOSK_MODEL_PATH)
+            log.info("[Vosk] ✅ 模型加载完成。")
+        return _model
 
 class VoskWakeWordDetector:
     """
@@ -18,23 +36,21 @@ class VoskWakeWordDetector:
         self.keywords = [kw for kw in keywords if kw] # 过滤掉空字符串
         
         if not self.keywords:
-            print("[Vosk-Detector] 错误：未提供任何有效的关键词。")
+            log.error("[Vosk-Detector] 错误：未提供任何有效的关键词。")
             return
 
         try:
-            # 模型是共享的，所以我们只加载一次
-            # 为了避免重复加载，可以考虑在更高层级管理模型实例
-            # 但在这里，为保持模块独立性，我们每次都加载
-            print(f"[Vosk-Detector] 正在从 '{config.VOSK_MODEL_PATH}' 加载模型...")
-            model = Model(config.VOSK_MODEL_PATH)
+            # 模型在进程内共享，多个检测器只加载一次
+            model = get_vosk_model()
+            from vosk import KaldiRecognizer
             
             # 根据传入的关键词列表，动态创建Vosk语法
             grammar = json.dumps(self.keywords + ["[unk]"], ensure_ascii=False)
             self.recognizer = KaldiRecognizer(model, config.TARGET_RATE, grammar)
-            print(f"[Vosk-Detector] ✅ 识别器已准备就绪，监听: {self.keywords}")
+            log.info(f"[Vosk-Detector] ✅ 识别器已准备就绪，监听: {self.keywords}")
 
         except Exception as e:
-            print(f"❌ Vosk模型加载或识别器创建失败: {e}")
+            log.error(f"❌ Vosk模型加载或识别器创建失败: {e}")
 
     def process(self, chunk: bytes) -> bool:
         """
@@ -55,7 +71,7 @@ class VoskWakeWordDetector:
             
             # 检查识别出的文本是否包含任何一个关键词
             if any(keyword in text for keyword in self.keywords):
-                print(f"[Vosk-Detector] ✅ 检测到关键词: '{text}' (匹配列表: {self.keywords})")
+                log.info(f"[Vosk-Detector] ✅ 检测到关键词: '{text}' (匹配列表: {self.keywords})")
                 return True
                 
         return False
\ No newline at end of file
@@ -0,0 +1,59 @@
+# smart_speaker/session_manager.py
+import config
+from .smartspeaker import SmartSpeaker
+from .audio_handler import AudioHandler
+from .log import get_logger
+
+log = get_logger(__name__)
+
+
+class Session:
+    """一个房间：一个采集设备 + 一个独立的 SmartSpeaker（状态、对话历史、轮次调度器）"""
+    def __init__(self, room):
+        self.id = room["id"]
+        self.room = room
+        self.speaker = SmartSpeaker(session_id=self.id, playback_device=room.get("playback_device"))
+        self.audio_handler = AudioHandler(self.speaker, room.get("arecord_device"), room.get("input_device_keywords"),
+                                          room.get("capture_source"), room.get("capture_port"), room.get("standby_device"))
+
+
+class SessionManager:
+    """
+    在一个进程中运行多个房间的会话。
+
+    会话之间共享的部分（因此内存随房间数亚线性增长）：
+    - Vosk模型（wake_word_service.get_vosk_model 进程内只加载一次，每个会话只创建轻量的识别器）；
+    - HTTP连接池和DNS缓存（http_client）、LLM网关及其客户端、TOS客户端、I/O线程池；
+    - 预合成的TTS提示语缓存。
+    每个会话独有的部分：状态机、对话历史、轮次调度线程、录音缓冲池和采集管道。
+    """
+    def __init__(self, rooms=None):
+        self.rooms = rooms or config.ROOMS
+        self.sessions = {}
+
+    def create_sessions(self):
+        for room in self.rooms:
+            if room["id"] in self.sessions:
+                log.warning(f"[Session-Warn] 房间ID '{room['id']}' 重复，已忽略。"); continue
+            self.sessions[room["id"]] = Session(room)
+            log.info(f"[Session] 已创建会话 '{room['id']}' (采集设备: {self.sessions[room['id']].audio_handler.arecord_device})")
+        return list(self.sessions.values())
+
+    @property
+    def default_id(self):
+        """第一个房间的ID（会话创建之前也可用）"""
+        return self.rooms[0]["id"]
+
+    def get(self, session_id=None):
+        """按ID返回会话，未指定时返回第一个会话"""
+        return self.sessions.get(session_id or self.default_id)
+
+    def __iter__(self):
+        return iter(list(self.sessions.values()))
+
+    def stop_all(self):
+        for session in self:
+            session.audio_handler.stop()
+            if session.speaker.music_player.is_active():
+                session.speaker.music_player.stop()
+            session.speaker.conversation.close()
@@ -0,0 +1,183 @@
+# smart_speaker/skills.py
+# 本地技能：答案在本机就能得到的问题（时间、日期、音量、刚才的歌）直接在本地回答，不再调用LLM。
+import re
+import subprocess
+import time
+
+import config
+from .intents import normalize_text
+from .metrics import metrics
+from .log import get_logger
+
+log = get_logger(__name__)
+
+_WEEKDAYS = "一二三四五六日"
+
+
+class Skill:
+    """
+    一个本地技能。
+
+    Args:
+        name (str): 技能名称，用于日志和指标。
+        pattern (str): 对规范化后的转写文本做匹配的正则（启动时预编译）。
+        handler (callable): handler(match) -> str，返回要播报的回答；返回None表示无法回答，交还给LLM。
+    """
+    def __init__(self, name, pattern, handler):
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.handler = handler
+
+
+class SkillRegistry:
+    """按注册顺序匹配的本地技能表，在意图之后、LLM之前被查询。"""
+    def __init__(self):
+        self._skills = []
+        self._queries = 0
+        self._hits = 0
+
+    def register(self, name, pattern, handler):
+        skill = Skill(name, pattern, handler)
+        self._skills.append(skill)
+        return skill
+
+    def matches(self, text):
+        """是否有技能的规则能匹配这句话（不执行技能，没有副作用）"""
+        normalized = normalize_text(text)
+        return any(skill.pattern.search(normalized) for skill in self._skills)
+
+    def answer(self, text):
+        """
+        尝试在本地回答一句话。
+
+        Returns:
+            tuple | None: (技能, 回答文本)，没有技能能回答时返回None。
+        """
+        normalized = normalize_text(text)
+        self._queries += 1
+        result = None
+        for skill in self._skills:
+            m = skill.pattern.search(normalized)
+            if not m: continue
+            try:
+                reply = skill.handler(m)
+            except Exception as e:
+                log.error(f"❌ [Skill] 技能 '{skill.name}' 执行出错: {e}")
+                reply = None
+            if reply:
+                result = (skill, reply)
+                break
+        if result:
+            self._hits += 1
+            metrics.inc("skills.hit")
+            metrics.inc(f"skills.hit.{result[0].name}")
+            # 每次命中都省掉了一次完整的LLM调用
+            metrics.inc("llm.calls_avoided")
+        else:
+            metrics.inc("skills.miss")
+        metrics.set_gauge("skills.hit_rate", round(self._hits / self._queries, 4))
+        return result
+
+
+# --- 内置技能的回答 ---
+
+def _spoken_time(now):
+    hour = now.tm_hour
+    period = "凌晨" if hour < 6 else "早上" if hour < 9 else "上午" if hour < 12 else "中午" if hour < 13 else "下午" if hour < 18 else "晚上"
+    hour12 = hour if hour <= 12 else hour - 12
+    minute = f"{now.tm_min}分" if now.tm_min else "整"
+    return f"{period}{hour12}点{minute}"
+
+
+def answer_time(match):
+    return f"现在是{_spoken_time(time.localtime())}哦。"
+
+
+def answer_date(match):
+    now = time.localtime()
+    return f"今天是{now.tm_year}年{now.tm_mon}月{now.tm_mday}日，星期{_WEEKDAYS[now.tm_wday]}哦。"
+
+
+class Mixer:
+    """通过 amixer 读取和调整ALSA混音器音量"""
+    _PERCENT_RE = re.compile(r"\[(\d+)%\]")
+
+    def __init__(self, control=None, card=None):
+        self.control = control or config.MIXER_CONTROL
+        self.card = card
+
+    def _amixer(self, *args):
+        command = ["amixer"] + (["-c", str(self.card)] if self.card is not None else []) + list(args)
+        return subprocess.run(command, capture_output=True, text=True, timeout=2, check=True).stdout
+
+    def get_volume(self):
+        m = self._PERCENT_RE.search(self._amixer("get", self.control))
+        return int(m.group(1)) if m else None
+
+    def set_volume(self, percent):
+        percent = max(0, min(100, percent))
+        self._amixer("-q", "set", self.control, f"{percent}%")
+        return percent
+
+
+def make_volume_skill(mixer):
+    def answer_volume(match):
+        try:
+            current = mixer.get_volume()
+            if current is None: return None
+            if match.group("level"):
+                target = int(match.group("level"))
+            elif match.group("query"):
+                return f"现在的音量是{current}%哦。"
+            elif match.group("up"):
+                target = current + config.VOLUME_STEP
+            else:
+                target = current - config.VOLUME_STEP
+            volume = mixer.set_volume(target)
+        except (OSError, subprocess.SubprocessError) as e:
+            log.error(f"❌ [Skill] 调整音量失败: {e}")
+            return "哎呀，音量调不了耶。"
+        if volume >= 100: return "已经是最大声了啦！"
+        if volume <= 0: return "已经静音了哦。"
+        return f"好哦，音量调到{volume}%了。"
+    return answer_volume
+
+
+def make_current_song_skill(music_player):
+    def answer_current_song(match):
+        if music_player.current_song_name:
+            return f"现在放的是《{music_player.current_song_name}》哦。"
+        if music_player.last_song_name:
+            return f"刚才放的是《{music_player.last_song_name}》哦。"
+        return "刚才没有在放歌哦。"
+    return answer_current_song
+
+
+# 内置技能的匹配规则（作用于去掉标点后的文本）。
+# 技能先于意图匹配，每条规则都必须覆盖整句话（只允许前后带客套词和语气词），
+# 否则"播放这是什么歌"、"我想听声音调大一点这首歌"这类播放请求和普通闲聊会被技能抢走
+_PREFIX = r"(?:请问|请|麻烦|帮我|告诉我|你知道|那个|嗯)*"
+_SUFFIX = r"(?:了|啦|呀|啊|呢|吗|吧|哦|嘛)*"
+
+
+def _whole_sentence(body):
+    return rf"^{_PREFIX}(?:{body}){_SUFFIX}$"
+
+
+TIME_PATTERN = _whole_sentence(r"(?:现在|目前)?(?:是)?(?:几点|几点钟|什么时间|什么时候)")
+DATE_PATTERN = _whole_sentence(r"(?:今天|今日)(?:是)?(?:几号|几月几号|几月几日|星期几|礼拜几|周几|什么日子)|(?:今天的?)?日期(?:是)?(?:多少|什么)?")
+VOLUME_PATTERN = _whole_sentence(
+    r"(?:把)?(?:音量|声音)(?:调到|设到|设为|调成)(?P<level>\d{1,3})"
+    r"|(?P<query>(?:现在)?(?:的)?(?:音量|声音)(?:是)?多(?:大|少))"
+    r"|(?P<up>(?:把)?(?:音量|声音)(?:调|开|放)?(?:大|高)(?:一?点|些)?|(?:再)?大声(?:一?点|些)?)"
+    r"|(?P<down>(?:把)?(?:音量|声音)(?:调|开|放)?(?:小|低)(?:一?点|些)?|(?:再)?小声(?:一?点|些)?)")
+CURRENT_SONG_PATTERN = _whole_sentence(
+    r"(?:刚才|刚刚|现在|正在)?(?:放|播|播放|唱)的(?:是)?(?:什么|哪首)歌|这(?:是)?(?:什么|哪首)歌|(?:这首歌的?)?歌名(?:是|叫)?什么")
+
+
+def register_default_skills(registry, music_player, mixer=None):
+    registry.register("time", TIME_PATTERN, answer_time)
+    registry.register("date", DATE_PATTERN, answer_date)
+    registry.register("volume", VOLUME_PATTERN, make_volume_skill(mixer or Mixer()))
+    registry.register("current_song", CURRENT_SONG_PATTERN, make_current_song_skill(music_player))
+    return registry
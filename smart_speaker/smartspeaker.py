@@ -1,21 +1,40 @@
 # smart_speaker/smartspeaker.py
 import time
-import wave
 import subprocess
 import json
-import threading
 import audioop
 import os
-import re
 from enum import Enum
 
 import config
-from .services.asr_service import transcribe_audio_file
+from .services.hedged_asr_service import HedgedASR
 from .services.tts_service import TTSService
+from .services.local_tts_service import LocalTTSService
+from .services.tts_router import TTSRouter
 from .services.llm_service import get_llm_response_stream
 from .services import music_service
+from .services.local_command_service import LocalCommandRecognizer
 from .audio_processing import play_audio_stream, MusicPlayer
+from .recording_postprocess import trim_silence, prepare_upload
 from .flask_utils import broadcast
+from .turn_scheduler import TurnScheduler
+from .intents import IntentRegistry
+from .skills import SkillRegistry, register_default_skills
+from .segmenter import SentenceSegmenter
+from .metrics import metrics
+from .flight_recorder import flight_recorder
+from .conversation_store import ConversationStore
+from .speculation import Speculator
+from .log import get_logger, set_context
+
+log = get_logger(__name__)
+
+SYSTEM_PROMPT = (
+    "你是一个来自台湾的AI女生，名字叫“小爱”。"
+    "你的基础人设是：说话带有浓厚的台湾腔和可爱的语气，句尾喜欢加“啦”、“哦”、“喔”、“呀”，常用“对呀”、“是哦”、“真的假的”等口头禅。"
+    "但你有一个隐藏的“小恶魔”属性，你的性格非常辛辣、反应快，喜欢吐槽和开一些荤段子玩笑。"
+    "总之，你要扮演一个表面甜美无害，实际上却是个满肚子坏水、反应机敏的“小妖精”。"
+)
 
 class SpeakerState(Enum):
     SLEEPING = 1
@@ -23,133 +42,226 @@ class SpeakerState(Enum):
     PLAYING_MUSIC = 3
 
 class SmartSpeaker:
-    def __init__(self):
+    def __init__(self, session_id="default", playback_device=None):
+        # 每个会话（房间）有自己的状态、对话历史和轮次调度器；模型、连接池和缓存在会话之间共享
+        self.session_id = session_id
+        self.playback_device = playback_device
+        self.record_path = config.RECORD_FILENAME if session_id == "default" else \
+            os.path.join(config.AUDIO_DIR, f"user_audio_16k_{session_id}.wav")
         self.state = SpeakerState.SLEEPING
         self.is_speaking = False
-        self.tts = TTSService()
-        self.music_player = MusicPlayer()
-        self._reset_conversation()
-        print("智能音箱业务逻辑已初始化。")
+        # 确认语和短句走本地引擎，LLM长回复走云端音色，云端首字节超时时回退到本地
+        self.tts = TTSRouter(TTSService(), LocalTTSService())
+        self.asr = HedgedASR()
+        self.music_player = MusicPlayer(playback_device)
+        self.scheduler = TurnScheduler(f"turn-{session_id}", session_id)
+        self.intents = IntentRegistry()
+        self._register_default_intents()
+        self.skills = register_default_skills(SkillRegistry(), self.music_player)
+        self.speculator = Speculator(self)
+        self.local_commands = None
+        # 对话历史从磁盘日志恢复最近的窗口，LLM、面板和"开启新会话"都通过它读写
+        self.conversation = ConversationStore(session_id, SYSTEM_PROMPT)
+        log.info("智能音箱业务逻辑已初始化。")
+
+    def load_local_models(self):
+        """创建依赖Vosk模型的本地识别组件（启动时与其他初始化任务并行执行，完成前这些本地快速路径不生效）"""
+        if config.LOCAL_INTENT_ENABLED:
+            self.local_commands = LocalCommandRecognizer(self.intents.local_phrases())
+        self.asr.load_local()
+
+    def broadcast(self, data):
+        """向前端广播本会话的事件，事件中带上会话ID，供面板区分房间"""
+        broadcast(dict(data, session=self.session_id))
+
+    def _mark(self, text):
+        flight_recorder.mark(text, self.session_id)
 
     def _reset_conversation(self):
-        """重置对话历史，并设定新的人设"""
-        system_prompt = (
-            "你是一个来自台湾的AI女生，名字叫“小爱”。"
-            "你的基础人设是：说话带有浓厚的台湾腔和可爱的语气，句尾喜欢加“啦”、“哦”、“喔”、“呀”，常用“对呀”、“是哦”、“真的假的”等口头禅。"
-            "但你有一个隐藏的“小恶魔”属性，你的性格非常辛辣、反应快，喜欢吐槽和开一些荤段子玩笑。"
-            "总之，你要扮演一个表面甜美无害，实际上却是个满肚子坏水、反应机敏的“小妖精”。"
-        )
-        self.conversation_history = [
-            {"role": "system", "content": system_prompt}
-        ]
-        print("\n[State] 对话历史已重置。")
-        broadcast({"type": "new_session"})
-        broadcast({"type": "conversation_history", "history": self.conversation_history})
-
-    def _speak(self, text, is_meta_command=False):
-        """让音箱说话，并在播放期间设置is_speaking状态"""
+        """重置对话历史（人设保持不变）"""
+        self.conversation.reset()
+        log.info("[State] 对话历史已重置。")
+        self.broadcast({"type": "new_session"})
+        self.broadcast({"type": "conversation_history", "history": self.conversation.history()})
+
+    def _register_default_intents(self):
+        """注册内置的指令意图；先注册的优先级更高"""
+        stop_words = "|".join(config.MUSIC_STOP_WORDS)
+        self.intents.register("stop_music", rf"^(?:{stop_words})$", self.handle_stop_music,
+                              local_phrases=config.MUSIC_STOP_WORDS)
+        self.intents.register("play_music", r"播放(?P<song_name>.+)", self.handle_play_music,
+                              slots=("song_name",), local_phrases=("播放",))
+        self.intents.register("sleep", r"退出|再见|拜拜", self.go_to_sleep,
+                              local_phrases=("退出", "再见", "拜拜"))
+        self.intents.register("new_session", r"开启新会话", self.handle_new_session,
+                              local_phrases=("开启 新 会话",))
+
+    def _speak(self, text, is_meta_command=False, audio_stream=None):
+        """让音箱说话，并在播放期间设置is_speaking状态；audio_stream 为提前合成好的音频（投机生成）"""
         if not text or not text.strip(): return
+        cancel_token = self.scheduler.current_token()
+        if cancel_token: cancel_token.raise_if_cancelled()
         
         self.is_speaking = True
-        print(f"[TTS-Flow] 开始播放: {text[:30]}...")
-        broadcast({"type": "status_update", "state": "speaking", "message": ""})
+        log.info(f"[TTS-Flow] 开始播放: {text[:30]}...", extra={"stage": "tts"})
+        self._mark(f"speak:{text[:30]}")
+        self.broadcast({"type": "status_update", "state": "speaking", "message": ""})
         
-        if is_meta_command: broadcast({"type": "ai_speech_chunk", "chunk": text})
+        if is_meta_command: self.broadcast({"type": "ai_speech_chunk", "chunk": text})
         
-        audio_stream = self.tts.get_audio_stream(text)
-        play_audio_stream(audio_stream)
-        
-        self.is_speaking = False
-        print("[TTS-Flow] 播放结束。")
+        try:
+            audio_stream = audio_stream or self.tts.get_audio_stream(text, cancel_token, templated=is_meta_command)
+            play_audio_stream(audio_stream, cancel_token, self.session_id, self.playback_device)
+        finally:
+            self.is_speaking = False
+        log.info("[TTS-Flow] 播放结束。", extra={"stage": "tts"})
+        if cancel_token: cancel_token.raise_if_cancelled()
 
     def _is_speech(self, chunk):
         """简单的能量检测VAD"""
         return audioop.rms(chunk, 2) > config.VAD_THRESHOLD
 
-    def _stream_llm_to_tts(self, user_text):
-        """核心的LLM->TTS流式处理管道"""
-        print(f"\n[Flow] 用户说: '{user_text}'")
-        self.conversation_history.append({"role": "user", "content": user_text})
-        broadcast({"type": "user_speech", "text": user_text})
-        
-        history = self.conversation_history[:-1]
-        llm_stream = get_llm_response_stream(user_text, history)
+    def _stream_llm_to_tts(self, user_text, speculation=None):
+        """核心的LLM->TTS流式处理管道；speculation 为录音期间提前发起的投机生成，与最终转写一致时直接采用"""
+        set_context(stage="llm")
+        log.info(f"[Flow] 用户说: '{user_text}'")
+        history = self.conversation.messages()
+        self.conversation.append("user", user_text)
+        self.broadcast({"type": "user_speech", "text": user_text})
+
+        cancel_token = self.scheduler.current_token()
+        llm_stream = self.speculator.resolve(speculation, user_text, history, cancel_token) if speculation else None
+        # 采用投机结果时，第一句可能已经提前合成好了
+        prefetched = speculation if llm_stream is not None else None
+        if llm_stream is None:
+            llm_stream = get_llm_response_stream(user_text, history, cancel_token)
         
-        sentence_buffer = ""; full_response = ""
-        sentence_delimiters = {"。", "！", "？", "...", "…", "；", "\n"}
+        segmenter = SentenceSegmenter(); full_response = ""
         
-        broadcast({"type": "status_update", "state": "processing", "message": "嗯...让我想想哦..."})
+        self.broadcast({"type": "status_update", "state": "processing", "message": "嗯...让我想想哦..."})
 
-        for text_chunk in llm_stream:
-            broadcast({"type": "ai_speech_chunk", "chunk": text_chunk})
-            sentence_buffer += text_chunk; full_response += text_chunk
+        try:
+            for text_chunk in llm_stream:
+                if cancel_token: cancel_token.raise_if_cancelled()
+                self.broadcast({"type": "ai_speech_chunk", "chunk": text_chunk})
+                full_response += text_chunk
+                for sentence in segmenter.feed(text_chunk):
+                    audio_stream = prefetched.first_audio if prefetched and sentence == prefetched.first_sentence else None
+                    prefetched = None
+                    self._speak(sentence, audio_stream=audio_stream)
             
-            delimiter_pos = -1; found_delimiter = None
-            for d in sentence_delimiters:
-                pos = sentence_buffer.find(d)
-                if pos != -1 and (delimiter_pos == -1 or pos < delimiter_pos):
-                    delimiter_pos = pos; found_delimiter = d
-            
-            if delimiter_pos != -1:
-                sentence_to_play = sentence_buffer[:delimiter_pos + len(found_delimiter)]
-                sentence_buffer = sentence_buffer[delimiter_pos + len(found_delimiter):]
-                self._speak(sentence_to_play)
-        
-        if sentence_buffer.strip():
-            self._speak(sentence_buffer)
-            
-        if full_response.strip():
-             self.conversation_history.append({"role": "assistant", "content": full_response.strip()})
-
-    def process_command(self, frames):
-        """将耗时的处理任务放到后台线程"""
-        print("[Flow] 将录音处理任务提交到后台线程...")
-        threading.Thread(target=self._process_command_thread, args=(frames,), daemon=True).start()
-
-    def _process_command_thread(self, frames):
-        """在后台线程中处理录音：保存、识别、执行指令"""
-        final_16k_path = config.RECORD_FILENAME
-        with wave.open(final_16k_path, 'wb') as wf:
-            wf.setnchannels(1); wf.setsampwidth(2); wf.setframerate(config.TARGET_RATE); wf.writeframes(b''.join(frames))
+            if cancel_token: cancel_token.raise_if_cancelled()
+            rest = segmenter.flush()
+            if rest:
+                self._speak(rest)
+        finally:
+            # 即使被打断，也把已生成的部分回复记入历史，保持user/assistant交替
+            if full_response.strip():
+                 self.conversation.append("assistant", full_response.strip())
+
+    def process_command(self, utterance):
+        """将耗时的处理任务作为一个新轮次提交给调度器（会取消仍在进行的上一轮）"""
+        log.info(f"[Flow] 将 {utterance.duration:.1f}s 的录音处理任务提交到轮次调度器...")
+        self.scheduler.submit("command", self._process_command_thread, utterance, on_done=utterance.release)
+
+    def _match_local_intent(self, pcm):
+        """用本地Vosk语法识别录音，返回高置信度的意图匹配（未命中返回None）"""
+        if not self.local_commands: return None
+        if len(pcm) > config.LOCAL_INTENT_MAX_S * config.TARGET_RATE * 2:
+            metrics.inc("intent.local_skipped_long")
+            return None
+        start_time = time.time()
+        local_result = self.local_commands.recognize(pcm)
+        match = self.intents.match_local(local_result)
+        metrics.observe("intent.local_latency_s", time.time() - start_time)
+        if match and match.confidence >= config.LOCAL_INTENT_MIN_CONFIDENCE:
+            self._mark(f"local_intent:{match.intent.name}")
+            log.info(f"[Intent] 本地识别命中 '{match.intent.name}'，耗时 {(time.time() - start_time) * 1000:.0f}ms。")
+            metrics.inc("intent.local_hit")
+            return match
+        metrics.inc("intent.local_miss")
+        return None
+
+    def _process_command_thread(self, utterance):
+        """在轮次工作线程中处理录音：本地快速识别、保存、云端识别、执行指令"""
+        # 录音期间发起的投机生成（如有）；最终没有走到LLM时在结束前作废
+        speculation = self.speculator.take()
+        try:
+            self._handle_utterance(utterance, speculation)
+        finally:
+            if speculation: speculation.discard("not_llm")
+
+    def _handle_utterance(self, utterance, speculation):
+        cancel_token = self.scheduler.current_token()
+        raw_pcm = utterance.pcm
+        set_context(state=self.state.name, stage="intent")
+        # 去掉首尾静音（尤其是VAD判定结束前约2秒的静音尾巴），后续本地识别和上传都只处理有效语音
+        pcm = trim_silence(raw_pcm) if config.TRIM_SILENCE_ENABLED else raw_pcm
+
+        local_match = self._match_local_intent(pcm)
+        if local_match and not local_match.intent.needs_cloud:
+            # 元指令直接在本地分发，完全跳过上传和云端识别
+            local_match.dispatch()
+            return
+        if local_match:
+            log.info(f"[Intent] 本地识别到'{local_match.intent.name}'意图，槽位交给云端识别。")
+
+        set_context(stage="asr")
+        audio_path, audio_format, audio_codec = prepare_upload(pcm, len(raw_pcm), self.record_path)
         
-        user_text = transcribe_audio_file(final_16k_path)
+        user_text = self.asr.transcribe(pcm, audio_path, cancel_token, audio_format, audio_codec)
+        if cancel_token: cancel_token.raise_if_cancelled()
+        self._mark(f"asr:{user_text}")
         
-        broadcast({"type": "status_update", "state": "processing", "message": f"我听到你说: '{user_text}'"})
+        self.broadcast({"type": "status_update", "state": "processing", "message": f"我听到你说: '{user_text}'"})
 
         if not user_text:
             if self.state == SpeakerState.AWAKE: self._speak("蛤？你刚刚有说话吗？", is_meta_command=True)
             self.go_to_next_state()
             return
 
-        play_match = re.search(r"播放(.+)", user_text)
-        if play_match:
-            song_name = play_match.group(1).strip()
-            self.handle_play_music(song_name)
+        # 本地技能优先于云端意图匹配（"刚才播放的是什么歌"不应被当成播放指令），命中时完全跳过LLM
+        if config.SKILLS_ENABLED and self._answer_with_skill(user_text):
+            self.go_to_next_state()
             return
 
-        if any(word in user_text for word in ["退出", "再见", "拜拜"]):
-            self.go_to_sleep()
+        match = self.intents.match(user_text)
+        if match:
+            match.dispatch()
             return
-            
-        if "开启新会话" in user_text:
-            self._reset_conversation()
-            self._speak("好哦，我们重新开始聊吧！", is_meta_command=True)
-        else:
-            self._stream_llm_to_tts(user_text)
-        
+
+        self._stream_llm_to_tts(user_text, speculation)
+        self.go_to_next_state()
+
+    def _answer_with_skill(self, user_text):
+        """尝试用本地技能回答，回答通过模板化TTS播报（短句走本地引擎）"""
+        result = self.skills.answer(user_text)
+        if not result: return False
+        skill, reply = result
+        log.info(f"[Skill] 命中本地技能 '{skill.name}': {reply}")
+        self._mark(f"skill:{skill.name}")
+        self.broadcast({"type": "user_speech", "text": user_text})
+        self._speak(reply, is_meta_command=True)
+        return True
+
+    def handle_new_session(self):
+        """处理"开启新会话"指令"""
+        self._reset_conversation()
+        self._speak("好哦，我们重新开始聊吧！", is_meta_command=True)
         self.go_to_next_state()
 
     def on_music_finished(self):
         """当音乐播放结束或失败时，此回调被MusicPlayer调用"""
-        print("[State-Callback] 收到音乐播放结束信号。")
+        log.info("[State-Callback] 收到音乐播放结束信号。")
         if self.state == SpeakerState.PLAYING_MUSIC:
-            print("[State] 从音乐播放模式切换回对话模式。")
+            log.info("[State] 从音乐播放模式切换回对话模式。")
             self.state = SpeakerState.AWAKE
-            broadcast({"type": "status_update", "state": "idle", "message": config.PROMPT_AWAKE_IDLE})
+            self._mark("state:awake")
+            self.broadcast({"type": "status_update", "state": "idle", "message": config.PROMPT_AWAKE_IDLE})
 
     def handle_play_music(self, song_name):
         """处理播放音乐的逻辑"""
-        print(f"[Intent] 检测到播放音乐意图，歌曲: {song_name}")
+        log.info(f"[Intent] 检测到播放音乐意图，歌曲: {song_name}")
         self._speak(f"好的呀，正在为你寻找歌曲《{song_name}》...", is_meta_command=True)
         
         song_info = music_service.search_song(song_name)
@@ -161,14 +273,16 @@ class SmartSpeaker:
             self.music_player.play(play_url, song_info['name'], on_finished_callback=self.on_music_finished)
             
             self.state = SpeakerState.PLAYING_MUSIC
-            broadcast({"type": "status_update", "state": "speaking", "message": f"正在播放: {song_title}"})
+            self._mark(f"state:playing_music:{song_info['name']}")
+            self.broadcast({"type": "status_update", "state": "speaking", "message": f"正在播放: {song_title}"})
         else:
             self._speak(f"哎呀，找不到歌曲《{song_name}》耶，要不要换一首？", is_meta_command=True)
             self.go_to_next_state()
 
     def handle_stop_music(self):
         """处理停止音乐的逻辑"""
-        print("[Intent] 检测到停止音乐指令")
+        log.info("[Intent] 检测到停止音乐指令")
+        self.scheduler.cancel_active("停止音乐")
         if self.music_player.is_active():
             self.music_player.stop()
             # stop()会间接触发on_music_finished回调，所以在这里不需要手动改变状态
@@ -177,25 +291,28 @@ class SmartSpeaker:
             # 如果不在播放音乐却说了停止，可以给个反馈
             self._speak("没有在播放音乐哦。", is_meta_command=True)
             self.state = SpeakerState.AWAKE
-            broadcast({"type": "status_update", "state": "idle", "message": config.PROMPT_AWAKE_IDLE})
+            self.broadcast({"type": "status_update", "state": "idle", "message": config.PROMPT_AWAKE_IDLE})
 
 
     def go_to_sleep(self):
         """切换到休眠状态"""
-        print("[State] 进入休眠模式...")
+        log.info("[State] 进入休眠模式...")
+        self._mark("state:sleeping")
+        self.scheduler.cancel_active("休眠")
         self.state = SpeakerState.SLEEPING
         self._speak(config.PROMPT_GO_TO_SLEEP, is_meta_command=True)
-        broadcast({"type": "status_update", "state": "idle", "message": config.PROMPT_SLEEPING})
+        self.broadcast({"type": "status_update", "state": "idle", "message": config.PROMPT_SLEEPING})
 
     def wake_up(self):
         """切换到唤醒状态"""
         if self.state != SpeakerState.SLEEPING: return
         self.state = SpeakerState.AWAKE
-        print(f"\n[WakeWord] ✅ 唤醒成功！进入对话模式。")
-        broadcast({"type": "status_update", "state": "idle", "message": config.PROMPT_AWAKE_IDLE})
+        self._mark("state:awake")
+        log.info(f"[WakeWord] ✅ 唤醒成功！进入对话模式。")
+        self.broadcast({"type": "status_update", "state": "idle", "message": config.PROMPT_AWAKE_IDLE})
         self._speak(config.PROMPT_AWAKENED, is_meta_command=True)
         
     def go_to_next_state(self):
         """根据当前状态决定下一步该做什么"""
         if self.state == SpeakerState.AWAKE:
-            broadcast({"type": "status_update", "state": "idle", "message": config.PROMPT_AWAKE_IDLE})
\ No newline at end of file
+            self.broadcast({"type": "status_update", "state": "idle", "message": config.PROMPT_AWAKE_IDLE})
\ No newline at end of file
@@ -0,0 +1,311 @@
+# smart_speaker/speculation.py
+# 投机式LLM生成：录音期间用本地Vosk流式识别得到部分转写，部分转写稳定后提前发起LLM请求（可选提前合成第一句），
+# 最终转写与之一致（或只多了语气词）时直接采用已生成的回复，否则取消并计入浪费。
+import json
+import queue
+import threading
+import time
+
+import config
+from .intents import normalize_text
+from .segmenter import SentenceSegmenter
+from .turn_scheduler import CancelToken
+from .metrics import metrics
+from .services.llm_service import get_llm_response_stream
+from .services.tts_router import TTSRouter
+from .log import get_logger
+
+log = get_logger(__name__)
+
+# 最终转写只比投机文本多（或少）这些语气词时，仍视为同一句话
+_TRIVIAL_TAIL = set("啊呀吧呢嘛哦喔啦了哈嗯")
+
+
+def estimate_tokens(text):
+    """粗略估算token数：汉字约一字一个token，其余字符约四个一个token"""
+    cjk = sum(1 for c in text if "一" <= c <= "鿿")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def is_trivial_extension(speculated, final):
+    """final 与 speculated 相同，或者只在句尾多/少了不超过 SPECULATION_MAX_EXTENSION_CHARS 个语气词"""
+    speculated, final = normalize_text(speculated), normalize_text(final)
+    if speculated == final: return True
+    longer, shorter = (final, speculated) if len(final) > len(speculated) else (speculated, final)
+    tail = longer[len(shorter):]
+    return (bool(shorter) and longer.startswith(shorter) and len(tail) <= config.SPECULATION_MAX_EXTENSION_CHARS
+            and all(c in _TRIVIAL_TAIL for c in tail))
+
+
+class _BufferedStream:
+    """生产者线程写入、消费者稍后迭代的缓冲流：先产出已缓冲的内容，再等待后续内容直到关闭"""
+    def __init__(self):
+        self._items = []
+        self._done = False
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        with self._cond:
+            self._items.append(item)
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._done = True
+            self._cond.notify_all()
+
+    def __iter__(self):
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self._items) and not self._done:
+                    self._cond.wait()
+                if index >= len(self._items): return
+                item = self._items[index]
+            index += 1
+            yield item
+
+
+class _BufferedAudio(_BufferedStream):
+    """提前合成的音频；编码以底层 AudioStream 为准（路由器回退时会改变编码）"""
+    def __init__(self, source):
+        super().__init__()
+        self.source = source
+
+    @property
+    def encoding(self):
+        return self.source.encoding
+
+
+class Speculation:
+    """
+    一次投机生成：在独立线程中以部分转写为提问请求LLM，把回复缓冲起来等待最终转写认领。
+
+    Args:
+        text (str): 作为提问的部分转写。
+        history (list): 发起时的对话消息列表，认领时必须与当时的历史一致。
+        tts (TTSRouter | None): 提供时提前合成回复的第一句（使用它的后端配置，但不共用它的云端连接）。
+    """
+    def __init__(self, text, history, tts=None):
+        self.text = text
+        self.history = history
+        self.token = CancelToken()
+        self.reply = _BufferedStream()
+        self.first_sentence = None
+        self.first_audio = None
+        self.started_at = time.monotonic()
+        self.first_token_at = None
+        self.output = ""
+        self.resolved = False
+        self._tts = tts
+        self.token.add_callback(self.reply.close)
+
+    def start(self):
+        metrics.inc("speculation.launched")
+        threading.Thread(target=self._run, name="speculation", daemon=True).start()
+        return self
+
+    def _run(self):
+        segmenter = SentenceSegmenter()
+        try:
+            for piece in get_llm_response_stream(self.text, self.history, self.token):
+                if self.token.is_cancelled(): break
+                if self.first_token_at is None: self.first_token_at = time.monotonic()
+                self.output += piece
+                # 先确定第一句再放出文本，消费方分出第一句时 first_sentence 一定已经就绪
+                if self._tts and self.first_sentence is None:
+                    sentences = segmenter.feed(piece)
+                    if sentences: self._prefetch_audio(sentences[0])
+                self.reply.put(piece)
+        except Exception as e:
+            log.error(f"❌ [Speculation] 投机请求出错: {e}")
+        finally:
+            self.reply.close()
+
+    def _prefetch_audio(self, sentence):
+        self.first_sentence = sentence
+        # 使用独立的云端实例合成，避免和正在播放的合成共用音频队列
+        router = TTSRouter(type(self._tts.cloud)(self._tts.cloud.encoding), self._tts.local)
+        audio = _BufferedAudio(router.get_audio_stream(sentence, self.token))
+        self.first_audio = audio
+
+        def pull():
+            try:
+                for chunk in audio.source: audio.put(chunk)
+            except Exception as e:
+                log.error(f"❌ [Speculation] 提前合成第一句出错: {e}")
+            finally:
+                audio.close()
+        threading.Thread(target=pull, name="speculation-tts", daemon=True).start()
+
+    def matches(self, final_text, history):
+        return history == self.history and is_trivial_extension(self.text, final_text)
+
+    def claim(self, cancel_token=None):
+        """最终转写匹配：采用这次投机，记录命中与节省的延迟，返回回复文本流"""
+        self.resolved = True
+        now = time.monotonic()
+        # 不投机时首个token要在 now + 首token延迟 时才到；投机时在 max(now, first_token_at) 就已可用
+        head_start = now - self.started_at
+        saved = min(head_start, self.first_token_at - self.started_at) if self.first_token_at else head_start
+        metrics.inc("speculation.hit")
+        metrics.observe("speculation.latency_saved_s", saved)
+        log.info(f"[Speculation] ✅ 最终转写与投机文本一致，采用提前生成的回复（节省约 {saved * 1000:.0f}ms）。")
+        if cancel_token: cancel_token.add_callback(self.token.cancel)
+        return self.reply
+
+    def discard(self, reason):
+        """投机作废：取消请求，把已消耗的提示和输出计入浪费的token"""
+        if self.resolved: return
+        self.resolved = True
+        self.token.cancel()
+        prompt_tokens = estimate_tokens(self.text + "".join(m["content"] for m in self.history))
+        output_tokens = estimate_tokens(self.output)
+        metrics.inc(f"speculation.miss.{reason}")
+        metrics.inc("speculation.wasted_prompt_tokens", prompt_tokens)
+        metrics.inc("speculation.wasted_output_tokens", output_tokens)
+        log.info(f"[Speculation] 投机作废 ({reason})：'{self.text}'，浪费约 {prompt_tokens}+{output_tokens} tokens。")
+
+
+class Speculator:
+    """
+    每个会话一个的投机调度器。录音线程只负责把音频块放进队列，
+    流式识别、稳定性判断和发起投机都在后台工作线程中完成，不占用采集循环的时间。
+
+    稳定性按音频时长计算：部分转写在 SPECULATION_STABLE_MS 毫秒的音频里没有变化即视为稳定，
+    不受工作线程处理快慢的影响。录音结束时正在进行的投机交给轮次，由 take() 取走。
+    """
+    def __init__(self, speaker):
+        self.speaker = speaker
+        self.enabled = config.SPECULATION_ENABLED
+        self.tts = speaker.tts if config.SPECULATION_TTS else None
+        self._events = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._utterance = 0          # 当前录音的序号，工作线程据此丢弃过期的事件
+        self._current = None         # 当前录音的投机
+        self._finished = None        # 已结束录音的投机，等待轮次取走
+        self._launched = 0
+        self._hits = 0
+
+    # --- 录音线程调用 ---
+
+    def begin(self, pre_roll_chunks):
+        if not self.enabled: return
+        with self._lock:
+            self._utterance += 1
+            utterance = self._utterance
+            stale, self._current = self._current, None
+        if stale: stale.discard("aborted")
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._worker, name=f"speculator-{self.speaker.session_id}", daemon=True)
+            self._thread.start()
+        self._events.put(("begin", utterance, b"".join(pre_roll_chunks)))
+
+    def feed(self, chunk):
+        if self.enabled: self._events.put(("audio", self._utterance, chunk))
+
+    def end(self):
+        """录音结束：当前投机移交给即将提交的轮次，此后不再为这段录音发起新的投机"""
+        if not self.enabled: return
+        with self._lock:
+            self._utterance += 1
+            finished, self._current = self._current, None
+            stale, self._finished = self._finished, finished
+        if stale: stale.discard("unclaimed")
+
+    def abort(self):
+        if not self.enabled: return
+        with self._lock:
+            self._utterance += 1
+            stale, self._current = self._current, None
+        if stale: stale.discard("aborted")
+
+    # --- 轮次线程调用 ---
+
+    def take(self):
+        with self._lock:
+            speculation, self._finished = self._finished, None
+        return speculation
+
+    def resolve(self, speculation, final_text, history, cancel_token=None):
+        """
+        用最终转写认领投机。
+
+        Returns:
+            _BufferedStream | None: 匹配时返回提前生成的回复流，否则返回None（投机已被取消）。
+        """
+        if speculation.matches(final_text, history):
+            self._hits += 1
+            stream = speculation.claim(cancel_token)
+        else:
+            speculation.discard("mismatch")
+            stream = None
+        metrics.set_gauge("speculation.hit_rate", round(self._hits / max(1, self._launched), 4))
+        return stream
+
+    # --- 后台工作线程 ---
+
+    def _worker(self):
+        recognizer = None
+        utterance = None
+        text, committed = "", ""
+        stable_samples = 0
+        launches = 0
+        while True:
+            kind, seq, data = self._events.get()
+            if kind == "begin":
+                recognizer = self._new_recognizer()
+                utterance, text, committed, stable_samples, launches = seq, "", "", 0, 0
+            # 录音已经结束或被放弃的事件直接丢弃，不再浪费CPU识别
+            if seq != utterance or seq != self._utterance or recognizer is None: continue
+            try:
+                if recognizer.AcceptWaveform(data):
+                    committed += json.loads(recognizer.Result()).get("text", "")
+                    partial = committed
+                else:
+                    partial = committed + json.loads(recognizer.PartialResult()).get("partial", "")
+            except Exception as e:
+                log.error(f"❌ [Speculation] 流式识别出错，放弃本段录音的投机: {e}")
+                recognizer = None; continue
+            partial = normalize_text(partial)
+            samples = len(data) // 2
+            if partial != text:
+                text, stable_samples = partial, samples
+                self._on_partial_changed(seq, text)
+                continue
+            stable_samples += samples
+            if stable_samples * 1000 >= config.SPECULATION_STABLE_MS * config.TARGET_RATE and launches < config.SPECULATION_MAX_LAUNCHES:
+                if self._maybe_launch(seq, text): launches += 1
+
+    def _new_recognizer(self):
+        from .services.wake_word_service import get_vosk_model
+        try:
+            from vosk import KaldiRecognizer
+            return KaldiRecognizer(get_vosk_model(), config.TARGET_RATE)
+        except Exception as e:
+            log.error(f"❌ [Speculation] 创建流式识别器失败，关闭投机: {e}")
+            self.enabled = False
+            return None
+
+    def _on_partial_changed(self, seq, text):
+        with self._lock:
+            current = self._current if seq == self._utterance else None
+            if current and not is_trivial_extension(current.text, text):
+                self._current = None
+            else:
+                current = None
+        if current: current.discard("changed")
+
+    def _maybe_launch(self, seq, text):
+        if len(text) < config.SPECULATION_MIN_CHARS: return False
+        # 会被意图或本地技能处理的话不需要LLM，不做投机
+        if self.speaker.intents.match(text) or (config.SKILLS_ENABLED and self.speaker.skills.matches(text)): return False
+        with self._lock:
+            if seq != self._utterance or self._current is not None: return False
+            speculation = Speculation(text, self.speaker.conversation.messages(), self.tts)
+            self._current = speculation
+            self._launched += 1
+        log.info(f"[Speculation] 部分转写已稳定，提前请求LLM: '{text}'")
+        speculation.start()
+        return True
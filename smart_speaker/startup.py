@@ -0,0 +1,90 @@
+# smart_speaker/startup.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .metrics import metrics
+from .log import get_logger
+
+log = get_logger(__name__)
+
+
+class StartupOrchestrator:
+    """
+    启动编排器：把相互独立的初始化任务（加载Vosk模型、探测音频设备、构造云服务客户端、
+    预合成提示语等）放到线程池中并行执行，记录每个任务的开始时刻和耗时，
+    并在关键任务完成后标记"就绪"，供 /ready 接口查询。
+    """
+    def __init__(self, max_workers=6):
+        self.started_at = time.monotonic()
+        self.ready_at = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="startup")
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._timings = {}  # 任务名 -> {"start_s", "duration_s", "error"}
+
+    def _elapsed(self):
+        return time.monotonic() - self.started_at
+
+    def record(self, name, start_s, duration_s, error=None):
+        """记录一个阶段的耗时（也用于记录不在线程池中执行的阶段，如模块导入）"""
+        with self._lock:
+            self._timings[name] = {"start_s": start_s, "duration_s": duration_s, "error": error}
+        metrics.set_gauge(f"startup.{name}_s", duration_s)
+
+    def _run(self, name, fn, args, kwargs):
+        start_s = self._elapsed()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record(name, start_s, self._elapsed() - start_s, str(e))
+            log.error(f"❌ [Startup] 初始化任务 '{name}' 失败: {e}")
+            raise
+        self.record(name, start_s, self._elapsed() - start_s)
+        return result
+
+    def submit(self, name, fn, *args, **kwargs):
+        """提交一个初始化任务，立即返回Future"""
+        future = self._executor.submit(self._run, name, fn, args, kwargs)
+        with self._lock:
+            self._futures[name] = future
+        return future
+
+    def wait(self, *names):
+        """等待指定的任务完成（不指定时等待全部任务），任务失败不会向外抛出"""
+        with self._lock:
+            futures = [self._futures[n] for n in names] if names else list(self._futures.values())
+        wait(futures)
+
+    def mark_ready(self):
+        self.ready_at = self._elapsed()
+        metrics.set_gauge("startup.ready_s", self.ready_at)
+        log.info(f"[Startup] ✅ 关键组件已就绪，耗时 {self.ready_at:.2f}s。")
+
+    @property
+    def is_ready(self):
+        return self.ready_at is not None
+
+    def status(self):
+        """导出可直接JSON序列化的启动状态"""
+        with self._lock:
+            tasks = {}
+            for name, future in self._futures.items():
+                tasks[name] = dict(self._timings.get(name, {}), state="pending" if not future.done() else
+                                   ("failed" if future.exception() else "done"))
+            for name, timing in self._timings.items():
+                tasks.setdefault(name, dict(timing, state="done"))
+        return {"ready": self.is_ready, "ready_s": self.ready_at, "elapsed_s": self._elapsed(), "tasks": tasks}
+
+    def report(self):
+        """打印启动耗时明细，按开始时刻排序"""
+        status = self.status()
+        log.info("[Startup] 启动耗时明细:")
+        for name, task in sorted(status["tasks"].items(), key=lambda item: item[1].get("start_s", 0)):
+            if "duration_s" not in task:
+                log.info(f"  - {name:<16} {task['state']}")
+                continue
+            suffix = f"  ❌ {task['error']}" if task.get("error") else ""
+            log.info(f"  - {name:<16} 开始于 {task['start_s']:6.2f}s，耗时 {task['duration_s']:6.2f}s{suffix}")
+        if status["ready"]:
+            log.info(f"  = 就绪耗时 {status['ready_s']:.2f}s，全部完成耗时 {status['elapsed_s']:.2f}s")
@@ -0,0 +1,114 @@
+# smart_speaker/static_assets.py
+# 面板静态图片的构建与分发：
+# 把 static/images 下的原图按内容哈希命名，生成若干宽度的WebP压缩版本，输出到 static/build，
+# 文件名中带有内容哈希，因此可以被浏览器永久缓存（内容变化时文件名随之变化）。
+# Pillow是可选依赖：未安装时只生成带哈希名的原图副本，不做缩放和压缩。
+import hashlib
+import os
+import shutil
+import threading
+
+import config
+from .log import get_logger
+
+log = get_logger(__name__)
+
+
+class StaticAssets:
+    def __init__(self, source_dir=None, build_dir=None, url_prefix="/assets"):
+        self.source_dir = source_dir or config.STATIC_IMAGES_DIR
+        self.build_dir = build_dir or config.STATIC_BUILD_DIR
+        self.url_prefix = url_prefix
+        self._manifest = {}  # 原图文件名 -> 图片条目
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """
+        返回模板使用的图片条目：
+        {"src": 兼容回退地址, "srcset": WebP变体列表（可能为空）, "width": 原图宽, "height": 原图高}
+        构建完成前返回指向原图的条目。
+        """
+        with self._lock:
+            entry = self._manifest.get(name)
+        return entry or {"src": f"/static/images/{name}", "srcset": "", "width": None, "height": None}
+
+    def _url(self, filename):
+        return f"{self.url_prefix}/{filename}"
+
+    def build(self):
+        """构建所有图片的变体；已存在的同名（同内容）文件直接复用，只有新内容才需要重新编码"""
+        os.makedirs(self.build_dir, exist_ok=True)
+        try:
+            from PIL import Image
+        except ImportError:
+            Image = None
+            log.warning("[Assets-Warn] 未安装Pillow，将直接分发原图（不生成缩放和WebP版本）。")
+
+        manifest, produced = {}, set()
+        original_bytes, served_bytes = 0, 0
+        for name in sorted(os.listdir(self.source_dir)):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() not in (".png", ".jpg", ".jpeg"): continue
+            path = os.path.join(self.source_dir, name)
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()[:12]
+
+            fallback = f"{stem}.{digest}{ext.lower()}"
+            self._write_once(fallback, lambda target: shutil.copyfile(path, target))
+            produced.add(fallback)
+            entry = {"src": self._url(fallback), "srcset": "", "width": None, "height": None}
+            original_bytes += os.path.getsize(path)
+
+            if Image is not None:
+                with Image.open(path) as img:
+                    entry["width"], entry["height"] = img.size
+                    variants = []
+                    for width in self._variant_widths(img.width):
+                        filename = f"{stem}.{digest}.{width}w.webp"
+                        self._write_once(filename, lambda target: self._encode_webp(img, width, target))
+                        produced.add(filename)
+                        variants.append(f"{self._url(filename)} {width}w")
+                    entry["srcset"] = ", ".join(variants)
+                    served_bytes += os.path.getsize(os.path.join(self.build_dir, filename))
+            manifest[name] = entry
+
+        self._remove_stale(produced)
+        with self._lock:
+            self._manifest = manifest
+        if served_bytes:
+            log.info(f"[Assets] ✅ 已构建 {len(manifest)} 张图片的WebP变体，最大尺寸合计 "
+                  f"{served_bytes / 1024:.0f}KB（原图 {original_bytes / 1024:.0f}KB）。")
+
+    @staticmethod
+    def _variant_widths(original_width):
+        widths = [w for w in config.ASSET_IMAGE_WIDTHS if w < original_width]
+        if original_width <= max(config.ASSET_IMAGE_WIDTHS):
+            widths.append(original_width)
+        return widths or [max(config.ASSET_IMAGE_WIDTHS)]
+
+    @staticmethod
+    def _encode_webp(img, width, target):
+        from PIL import Image
+        if width != img.width:
+            img = img.resize((width, round(img.height * width / img.width)), Image.LANCZOS)
+        img.save(target, "WEBP", quality=config.ASSET_WEBP_QUALITY, method=4)
+
+    def _write_once(self, filename, writer):
+        """目标文件不存在时才生成；先写临时文件再重命名，避免请求读到写了一半的文件"""
+        target = os.path.join(self.build_dir, filename)
+        if os.path.exists(target): return
+        tmp_path = target + ".tmp"
+        writer(tmp_path)
+        os.replace(tmp_path, target)
+
+    def _remove_stale(self, produced):
+        """删除旧内容留下的、已不再被引用的构建产物"""
+        for filename in os.listdir(self.build_dir):
+            if filename not in produced:
+                try:
+                    os.remove(os.path.join(self.build_dir, filename))
+                except OSError:
+                    pass
+
+
+static_assets = StaticAssets()
@@ -0,0 +1,123 @@
+# smart_speaker/text_turns.py
+# 面板上的文字对话通道：客户端通过已有的WebSocket直接发送文字，
+# 跳过VAD静音尾巴、TOS上传和云端ASR，直接进入 LLM -> 断句 -> TTS 管道。
+# 文字轮次在独立的线程池中执行，不会排在房间的语音轮次后面；回复只发给发起的客户端。
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from .rate_limiter import KeyedRateLimiter
+from .segmenter import SentenceSegmenter
+from .turn_scheduler import CancelToken
+from .services.llm_service import get_llm_response_stream
+from .services.tts_service import TTSService
+from .metrics import metrics
+from .log import get_logger
+
+log = get_logger(__name__)
+
+_text_executor = ThreadPoolExecutor(max_workers=config.TEXT_TURN_WORKERS, thread_name_prefix="text-turn")
+# 按客户端地址限流，所有连接共用，断开重连不会重新获得突发额度
+_limiter = KeyedRateLimiter(config.TEXT_TURN_RATE_PER_MIN / 60.0, config.TEXT_TURN_BURST, gauge="text_turn.clients")
+
+
+class TextChannel:
+    """
+    一个面板连接上的文字对话通道。
+
+    客户端消息格式: {"type": "text_turn", "text": "...", "audio": false}
+    服务端回复:
+      {"type": "text_turn_start", "text": ...}
+      {"type": "text_reply_chunk", "chunk": ...}             （逐个文本片段）
+      {"type": "text_reply_audio", "encoding": "mp3", "sentence": ...} + 若干二进制帧 + {"type": "text_reply_audio_end"}
+                                                              （仅当 audio 为 true 时，每句一组）
+      {"type": "text_turn_end", "cancelled": bool}
+      {"type": "text_turn_rejected", "reason": ..., "retry_after_s": ...}
+    """
+    def __init__(self, ws_client, speaker, remote_addr=None):
+        self.ws_client = ws_client
+        self.speaker = speaker
+        self.client_key = remote_addr or "unknown"
+        # 每个客户端有自己的文字对话历史，沿用房间的人设
+        self.history = [speaker.conversation.system_message]
+        # 新消息打断上一轮时，被取消的一轮可能还没退出，两轮会同时读写历史
+        self._history_lock = threading.Lock()
+        self._token = None
+        self._send_lock = threading.Lock()
+
+    def _send(self, data):
+        with self._send_lock:
+            self.ws_client.send(data if isinstance(data, bytes) else json.dumps(data))
+
+    def handle(self, raw_message):
+        """处理接收循环收到的一条客户端消息；非文字轮次的消息直接忽略"""
+        if not isinstance(raw_message, str): return
+        try:
+            message = json.loads(raw_message)
+        except ValueError:
+            return
+        if not isinstance(message, dict) or message.get("type") != "text_turn": return
+        text = str(message.get("text", "")).strip()[:config.TEXT_TURN_MAX_CHARS]
+        if not text: return
+
+        retry_after = _limiter.check(self.client_key)
+        if retry_after is not None:
+            metrics.inc("text_turn.rate_limited")
+            self._send({"type": "text_turn_rejected", "reason": "rate_limited", "retry_after_s": round(retry_after, 1)})
+            return
+
+        # 同一客户端的新消息会打断它自己仍在进行的上一轮
+        if self._token: self._token.cancel()
+        self._token = CancelToken()
+        metrics.inc("text_turn.submitted")
+        _text_executor.submit(self._run, text, bool(message.get("audio")), self._token)
+
+    def close(self):
+        if self._token: self._token.cancel()
+
+    def _run(self, text, with_audio, token):
+        start_time = time.monotonic()
+        first_chunk_at = None
+        full_response = ""
+        segmenter = SentenceSegmenter()
+        # 每一轮使用自己的TTS实例：TTSService只有一个音频队列，重叠的两轮共用会互相串音
+        tts = TTSService(encoding="mp3") if with_audio else None
+        with self._history_lock:
+            history = list(self.history)
+        try:
+            self._send({"type": "text_turn_start", "text": text})
+            for text_chunk in get_llm_response_stream(text, history, token):
+                if token.is_cancelled(): break
+                if first_chunk_at is None:
+                    first_chunk_at = time.monotonic()
+                    metrics.observe("text_turn.first_chunk_s", first_chunk_at - start_time)
+                full_response += text_chunk
+                self._send({"type": "text_reply_chunk", "chunk": text_chunk})
+                if with_audio:
+                    for sentence in segmenter.feed(text_chunk):
+                        self._send_audio(tts, sentence, token)
+            if with_audio and not token.is_cancelled():
+                rest = segmenter.flush()
+                if rest: self._send_audio(tts, rest, token)
+            self._send({"type": "text_turn_end", "cancelled": token.is_cancelled()})
+        except Exception as e:
+            # 多数情况是客户端已断开
+            log.info(f"[TextTurn] 文字轮次中断: {e}")
+            token.cancel()
+        finally:
+            with self._history_lock:
+                self.history.append({"role": "user", "content": text})
+                if full_response.strip():
+                    self.history.append({"role": "assistant", "content": full_response.strip()})
+                # 只保留人设和最近若干条消息
+                del self.history[1:-config.TEXT_TURN_HISTORY_MESSAGES or None]
+            metrics.observe("text_turn.duration_s", time.monotonic() - start_time)
+
+    def _send_audio(self, tts, sentence, token):
+        """合成一句话并以二进制帧发给客户端（不经过房间的扬声器）；浏览器用 audio/mpeg 播放，固定使用mp3"""
+        self._send({"type": "text_reply_audio", "encoding": "mp3", "sentence": sentence})
+        for chunk in tts.get_audio_stream(sentence, token):
+            self._send(chunk)
+        self._send({"type": "text_reply_audio_end"})
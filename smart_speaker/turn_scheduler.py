@@ -0,0 +1,191 @@
+# smart_speaker/turn_scheduler.py
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import metrics
+from .flight_recorder import flight_recorder
+from .log import get_logger, set_context, clear_context
+
+log = get_logger(__name__)
+
+
+class TurnCancelled(Exception):
+    """当前轮次已被新的指令、停止音乐或休眠所取消。"""
+
+
+class CancelToken:
+    """
+    可取消令牌：一个带回调的取消标志。
+    正在进行阻塞I/O的代码可以注册回调（如关闭WebSocket、结束ffplay），
+    这样取消发生时I/O会被立即打断，而不是等到下一次轮询。
+    """
+    def __init__(self, parent=None):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._parent = parent
+        if parent is not None:
+            parent.add_callback(self.cancel)
+
+    def detach(self):
+        """不再跟随父令牌取消（子操作结束后调用，避免在长期存在的父令牌上累积回调）"""
+        if self._parent is not None:
+            self._parent.remove_callback(self.cancel)
+            self._parent = None
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set(): return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                log.error(f"[Turn] 执行取消回调时出错: {e}")
+
+    def is_cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """等待取消发生，返回True表示已取消（可用来替代可中断的time.sleep）"""
+        return self._event.wait(timeout)
+
+    def add_callback(self, callback):
+        """注册取消回调；如果已经取消，则立即执行"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise TurnCancelled()
+
+
+class Turn:
+    """一次完整的对话轮次：ASR -> 意图 -> LLM -> TTS -> 播放"""
+    def __init__(self, turn_id, name):
+        self.id = turn_id
+        self.name = name
+        self.token = CancelToken()
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.on_done = None
+
+    @property
+    def queue_delay(self):
+        if self.started_at is None: return None
+        return self.started_at - self.submitted_at
+
+
+class TurnScheduler:
+    """
+    单飞(single-flight)的轮次调度器。
+
+    - 所有轮次都在同一个复用的工作线程上串行执行，保证任意时刻最多只有一个活跃轮次；
+    - 提交新轮次时会立即取消上一个轮次，被取消的轮次会尽快退出所有进行中的I/O；
+    - 记录每个轮次的排队延迟和当前进程线程数。
+    """
+    def __init__(self, name="turn", session_id="default"):
+        self.session_id = session_id
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._active = None
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+
+    def current_turn(self):
+        """返回当前线程正在执行的轮次（不在轮次线程中时返回None）"""
+        return getattr(self._local, "turn", None)
+
+    def current_token(self):
+        turn = self.current_turn()
+        return turn.token if turn else None
+
+    def submit(self, name, fn, *args, on_done=None, **kwargs):
+        """
+        提交一个新轮次，并取消仍在进行中的上一个轮次。
+        on_done 会在轮次结束后调用（包括在排队期间就被取消而跳过的情况），用于释放轮次持有的资源。
+        """
+        turn = Turn(next(self._ids), name)
+        turn.on_done = on_done
+        with self._lock:
+            previous, self._active = self._active, turn
+        if previous is not None and not previous.token.is_cancelled():
+            log.info(f"[Turn] 新轮次 #{turn.id} 到达，取消进行中的轮次 #{previous.id} ({previous.name})。")
+            previous.token.cancel()
+        metrics.inc("turn.submitted")
+        self._executor.submit(self._run, turn, fn, args, kwargs)
+        return turn
+
+    def cancel_active(self, reason=""):
+        """取消当前活跃轮次；如果调用者本身就处于该轮次中，则不取消自己"""
+        with self._lock:
+            turn = self._active
+        if turn is None or turn is self.current_turn() or turn.token.is_cancelled():
+            return False
+        log.info(f"[Turn] 因'{reason}'取消轮次 #{turn.id} ({turn.name})。")
+        turn.token.cancel()
+        return True
+
+    def _run(self, turn, fn, args, kwargs):
+        # 轮次线程中的每条日志都带上会话和轮次编号，便于在并发的多房间日志中过滤
+        set_context(session=self.session_id, turn=turn.id)
+        try:
+            self._execute(turn, fn, args, kwargs)
+        finally:
+            if turn.on_done:
+                try:
+                    turn.on_done()
+                except Exception as e:
+                    log.error(f"[Turn] 轮次 #{turn.id} 的清理回调出错: {e}")
+            clear_context()
+
+    def _execute(self, turn, fn, args, kwargs):
+        turn.started_at = time.monotonic()
+        thread_count = threading.active_count()
+        metrics.observe("turn.queue_delay_s", turn.queue_delay)
+        metrics.set_gauge("process.threads", thread_count)
+
+        if turn.token.is_cancelled():
+            log.info(f"[Turn] 轮次 #{turn.id} 在排队期间已被取消，跳过。")
+            metrics.inc("turn.skipped")
+            return
+
+        log.info(f"[Turn] 轮次 #{turn.id} ({turn.name}) 开始执行，排队 {turn.queue_delay * 1000:.0f}ms，当前线程数 {thread_count}。")
+        flight_recorder.mark(f"turn#{turn.id}:{turn.name}:start", self.session_id)
+        self._local.turn = turn
+        try:
+            fn(*args, **kwargs)
+        except TurnCancelled:
+            log.info(f"[Turn] 轮次 #{turn.id} 已取消。")
+        except Exception as e:
+            log.error(f"❌ 轮次 #{turn.id} 执行出错: {e}")
+        finally:
+            self._local.turn = None
+            turn.finished_at = time.monotonic()
+            metrics.observe("turn.duration_s", turn.finished_at - turn.started_at)
+            outcome = "cancelled" if turn.token.is_cancelled() else "completed"
+            metrics.inc(f"turn.{outcome}")
+            flight_recorder.mark(f"turn#{turn.id}:{turn.name}:{outcome}", self.session_id)
+            with self._lock:
+                if self._active is turn:
+                    self._active = None
+
+
+# 供TTS WebSocket等短时I/O任务复用的共享线程池，避免每句话都新建线程
+_io_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="io")
+
+def submit_io(fn, *args, **kwargs):
+    """在共享的I/O线程池中执行一个阻塞任务"""
+    return _io_executor.submit(fn, *args, **kwargs)
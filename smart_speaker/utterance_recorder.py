@@ -0,0 +1,107 @@
+# smart_speaker/utterance_recorder.py
+import threading
+
+import config
+from .metrics import metrics
+from .log import get_logger
+
+log = get_logger(__name__)
+
+
+class Utterance:
+    """
+    一段录制完成的语音，对录音缓冲区的零拷贝视图。
+    业务层处理完毕后必须调用 release()，把缓冲区归还给录音器复用。
+    """
+    def __init__(self, recorder, buffer_index, buffer, length):
+        self._recorder = recorder
+        self._buffer_index = buffer_index
+        self.pcm = memoryview(buffer)[:length]
+        self.duration = length / (2 * config.TARGET_RATE)
+
+    def release(self):
+        if self._recorder is None: return
+        self.pcm.release()
+        self._recorder._release(self._buffer_index)
+        self._recorder = None
+
+
+class UtteranceRecorder:
+    """
+    有上限、预分配内存的语音录音器。
+
+    录音缓冲区在初始化时按"最长录音时长 + 预录制时长"一次性分配，
+    预录制音频只在开始录音时从滚动缓冲区复制一次，之后的每个音频块直接写入缓冲区，
+    录音结束时以memoryview的形式交给业务层，不再有列表复制和拼接。
+    缓冲区写满即视为达到 MAX_RECORDING_S，调用方应强制结束本次录音。
+
+    缓冲区以小池子的形式轮换使用：一个正在处理的轮次、一个排队中的轮次和一个正在进行的录音
+    可以同时各占一个，因此每轮的峰值内存是常数。
+    """
+    def __init__(self, max_seconds=None, pre_roll_seconds=None, pool_size=3):
+        max_seconds = config.MAX_RECORDING_S if max_seconds is None else max_seconds
+        pre_roll_seconds = config.PRE_BUFFER_DURATION_S if pre_roll_seconds is None else pre_roll_seconds
+        self.capacity = int((max_seconds + pre_roll_seconds) * config.TARGET_RATE) * 2
+        self._pool = [bytearray(self.capacity) for _ in range(pool_size)]
+        self._free = list(range(pool_size))
+        self._lock = threading.Lock()
+        self._index = None
+        self._buffer = None
+        self._view = None
+        self._length = 0
+
+    @property
+    def is_recording(self):
+        return self._buffer is not None
+
+    def start(self, pre_roll_chunks):
+        """开始一次新录音，把滚动缓冲区中的预录制音频复制进来"""
+        if self.is_recording: self.abort()
+        with self._lock:
+            self._index = self._free.pop() if self._free else None
+        if self._index is None:
+            # 所有缓冲区都还被之前的轮次占用，临时分配一个，用完后丢弃
+            log.warning("[Recorder-Warn] 录音缓冲池已耗尽，临时分配一个缓冲区。")
+            metrics.inc("recorder.pool_exhausted")
+            self._buffer = bytearray(self.capacity)
+        else:
+            self._buffer = self._pool[self._index]
+        self._view = memoryview(self._buffer)
+        self._length = 0
+        for chunk in pre_roll_chunks:
+            if not self.append(chunk): break
+
+    def append(self, chunk):
+        """追加一个音频块；缓冲区写满（达到最长录音时长）时返回False"""
+        end = min(self._length + len(chunk), self.capacity)
+        self._view[self._length:end] = chunk[:end - self._length]
+        self._length = end
+        return self._length < self.capacity
+
+    def finish(self):
+        """结束录音，返回零拷贝的 Utterance"""
+        utterance = Utterance(self, self._index, self._buffer, self._length)
+        metrics.observe("recorder.utterance_s", utterance.duration)
+        if self._length >= self.capacity:
+            metrics.inc("recorder.capped")
+        self._reset()
+        return utterance
+
+    def abort(self):
+        """丢弃当前录音并归还缓冲区"""
+        if not self.is_recording: return
+        index = self._index
+        self._reset()
+        self._release(index)
+
+    def _reset(self):
+        self._view.release()
+        self._index = None
+        self._buffer = None
+        self._view = None
+        self._length = 0
+
+    def _release(self, index):
+        if index is None: return
+        with self._lock:
+            self._free.append(index)
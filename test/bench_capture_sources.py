@@ -0,0 +1,115 @@
+# bench_capture_sources.py
+# 依次运行各个采集源若干秒，对比它们的估计采集延迟和CPU占用率，用来为当前开发板选择开销最小的采集方案。
+# wav/tcp/udp 使用合成的测试音频，不需要声卡；arecord/pyaudio 只有在本机有对应工具和输入设备时才会测量。
+# 运行方式（在项目根目录）: python test/bench_capture_sources.py [每个采集源的秒数]
+import math
+import os
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+from smart_speaker.capture_sources import create_capture_source
+
+BYTES_PER_SECOND = config.TARGET_RATE * 2
+
+
+def make_tone(seconds, rate=config.TARGET_RATE):
+    """生成一段440Hz的正弦波PCM"""
+    return b"".join(struct.pack("<h", int(8000 * math.sin(2 * math.pi * 440 * i / rate))) for i in range(int(seconds * rate)))
+
+
+def send_pcm(protocol, port, pcm, stop):
+    """以实时速度向采集源发送PCM，模拟远程麦克风"""
+    kind = socket.SOCK_STREAM if protocol == "tcp" else socket.SOCK_DGRAM
+    with socket.socket(socket.AF_INET, kind) as sock:
+        if protocol == "tcp": sock.connect(("127.0.0.1", port))
+        started = time.monotonic()
+        for offset in range(0, len(pcm), config.CHUNK_SIZE):
+            if stop.is_set(): break
+            chunk = pcm[offset:offset + config.CHUNK_SIZE]
+            if protocol == "tcp": sock.sendall(chunk)
+            else: sock.sendto(chunk, ("127.0.0.1", port))
+            delay = started + (offset + len(chunk)) / BYTES_PER_SECOND - time.monotonic()
+            if delay > 0: time.sleep(delay)
+
+
+def probe_device():
+    try:
+        import pyaudio
+    except ImportError:
+        return None, None
+    p_audio = pyaudio.PyAudio()
+    try:
+        info = p_audio.get_default_input_device_info()
+        return p_audio, (info["index"], int(info["defaultSampleRate"]))
+    except IOError:
+        p_audio.terminate()
+        return None, None
+
+
+def bench(kind, seconds, **kwargs):
+    source = create_capture_source(kind, **kwargs)
+    if not source.start():
+        print(f"{kind:>8}: 无法启动，跳过"); return
+    stop = threading.Event()
+    if kind in ("tcp", "udp"):
+        threading.Thread(target=send_pcm, args=(kind, source.port, make_tone(seconds + 1), stop), daemon=True).start()
+
+    received = 0
+    latencies = []
+    source.report_stats()
+    started_wall, started_cpu = time.monotonic(), time.thread_time()
+    while time.monotonic() - started_wall < seconds:
+        chunk = source.read(config.CHUNK_SIZE)
+        if not chunk: break
+        received += len(chunk)
+        latencies.append(source.latency_s())
+    elapsed = time.monotonic() - started_wall
+    reader_cpu = time.thread_time() - started_cpu
+    source_cpu = source._cpu_seconds()
+    stop.set(); source.stop()
+
+    avg_latency = sum(latencies) / len(latencies) if latencies else 0.0
+    print(f"{kind:>8}: 读出 {received / BYTES_PER_SECOND:5.1f}s 音频 / 用时 {elapsed:5.1f}s | "
+          f"估计延迟 {avg_latency * 1000:6.1f}ms | 采集源CPU {100 * source_cpu / elapsed:5.2f}% | "
+          f"读取线程CPU {100 * reader_cpu / elapsed:5.2f}%")
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    with tempfile.TemporaryDirectory() as tmp:
+        # 48kHz的回放文件，同时测量重采样的开销
+        wav_path = os.path.join(tmp, "tone.wav")
+        with wave.open(wav_path, "wb") as f:
+            f.setnchannels(1); f.setsampwidth(2); f.setframerate(48000)
+            f.writeframes(make_tone(seconds + 1, 48000))
+        config.CAPTURE_WAV_PATH = wav_path
+        config.CAPTURE_WAV_SPEED = 1.0
+        config.CAPTURE_NET_HOST = "127.0.0.1"
+
+        print(f"每个采集源运行 {seconds:.0f}s:")
+        bench("wav", seconds)
+        bench("tcp", seconds, net_port=0)
+        bench("udp", seconds, net_port=0)
+
+        p_audio, probed = probe_device()
+        if probed and shutil.which("arecord") and shutil.which("ffmpeg"):
+            bench("arecord", seconds, arecord_device=config.ARECORD_DEVICE, probed=probed)
+        else:
+            print(" arecord: 缺少 arecord/ffmpeg 或输入设备，跳过")
+        if probed:
+            bench("pyaudio", seconds, p_audio=p_audio, probed=probed)
+            p_audio.terminate()
+        else:
+            print(" pyaudio: 缺少 PyAudio 或输入设备，跳过")
+
+
+if __name__ == "__main__":
+    main()
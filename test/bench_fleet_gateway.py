@@ -0,0 +1,243 @@
+# bench_fleet_gateway.py
+# 车队网关压测：用大量模拟设备并发执行“一轮对话”（ASR提交+查询、LLM流式回复、两句TTS、部分轮次搜歌并解析播放地址），
+# 分别测量设备直连替身上游和经网关（子进程运行 gateway.py）访问时的吞吐量、每轮延迟、LLM首字延迟，
+# 以及替身上游实际收到的请求数和新建连接数、网关的缓存命中与请求合并次数。
+# 设备两轮对话之间通常空闲很久，云端早已关闭长连接，因此每轮使用新的连接；网关到上游的连接则一直保持。
+# 不需要云端凭据，上游为 test/fleet_standin_upstream.py。
+# 运行方式（在项目根目录）: python test/bench_fleet_gateway.py [--mode both|direct|gateway] [--devices 40] [--seconds 10]
+import argparse
+import json
+import os
+import random
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fleet_standin_upstream import StandinUpstream
+
+# 多台设备常见的相同内容：固定提示语、热门问题、热门歌曲
+COMMON_PROMPTS = ["好的，马上为你播放。", "我在，请说。", "抱歉，我没有听清。", "好的，今天天气晴，适合出门。"]
+COMMON_QUESTIONS = ["今天天气怎么样", "现在几点了", "讲个笑话", "明天会下雨吗"]
+POPULAR_SONGS = ["七里香", "晴天", "稻香", "夜曲", "青花瓷", "告白气球", "简单爱", "说好不哭"]
+
+
+def tts_frame(text):
+    """按云端协议构造TTS请求帧（与 TTSService._construct_request_data 相同的格式）"""
+    payload = json.dumps({
+        "app": {"appid": "bench", "token": "bench", "cluster": "volcano_tts"},
+        "user": {"uid": "bench"},
+        "audio": {"voice_type": "zh_female_wanwanxiaohe_moon_bigtts", "encoding": "pcm", "rate": 16000},
+        "request": {"reqid": str(uuid.uuid4()), "text": text, "operation": "submit"},
+    }).encode()
+    header = (1 << 28) | (1 << 24) | (1 << 20) | (1 << 12)
+    return struct.pack(">II", header, len(payload)) + payload
+
+
+class Device(threading.Thread):
+    def __init__(self, index, urls, deadline, stats, think_s):
+        super().__init__(daemon=True)
+        self.index = index
+        self.urls = urls
+        self.deadline = deadline
+        self.stats = stats
+        self.think_s = think_s
+        self.headers = {"X-Device-Id": f"device-{index}", "Authorization": "Bearer bench"}
+        self.random = random.Random(index)
+
+    def run(self):
+        turn = 0
+        while time.monotonic() < self.deadline:
+            turn += 1
+            started = time.monotonic()
+            try:
+                first_token_s = self.turn(turn, started)
+            except RateLimited:
+                self.stats.record("rate_limited")
+            except Exception as e:
+                self.stats.record("errors", error=e)
+            else:
+                self.stats.record("turns", time.monotonic() - started, first_token_s)
+            time.sleep(self.random.uniform(0, 2 * self.think_s))
+
+    def turn(self, turn, started):
+        session = requests.Session()
+        try:
+            submit = self._check(session.post(f"{self.urls['asr']}/submit", json={"audio": {"url": "x"}}, headers=self.headers))
+            self._check(session.post(f"{self.urls['asr']}/query", json={"id": submit.json()["resp"]["id"]}, headers=self.headers))
+
+            body = {"model": "bench", "stream": True, "messages": [{"role": "user", "content": self.random.choice(COMMON_QUESTIONS)}]}
+            first_token_s = None
+            with self._check(session.post(f"{self.urls['llm']}/chat/completions", json=body, headers=self.headers, stream=True)) as response:
+                for line in response.iter_lines():
+                    if line.startswith(b"data:") and first_token_s is None: first_token_s = time.monotonic() - started
+                    if line == b"data: [DONE]": break
+
+            self.synthesize(self.random.choice(COMMON_PROMPTS))
+            self.synthesize(f"这是{self.index}号设备第{turn}轮的回复。")
+
+            if self.random.random() < 0.3:
+                song = self.random.choice(POPULAR_SONGS)
+                found = self._check(session.get(self.urls["music_search"], params={"s": song, "type": 1}, headers=self.headers)).json()
+                song_id = found["result"]["songs"][0]["id"]
+                self._check(session.get(self.urls["music_song"].format(song_id), headers=self.headers, allow_redirects=False))
+            return first_token_s
+        finally:
+            session.close()
+
+    def synthesize(self, text):
+        import websocket
+        try:
+            ws = websocket.create_connection(self.urls["tts"], header=[f"{k}: {v}" for k, v in self.headers.items()], timeout=30)
+        except websocket.WebSocketBadStatusException as e:
+            if e.status_code == 429: raise RateLimited()
+            raise
+        try:
+            ws.send_binary(tts_frame(text))
+            while True:
+                frame = ws.recv()
+                msg_type, flags = frame[1] >> 4, frame[1] & 0xF
+                if msg_type == 0b1111: raise RuntimeError("TTS错误帧")
+                if msg_type == 0b1011 and flags in (0b0010, 0b0011): return
+        finally:
+            ws.close()
+
+    @staticmethod
+    def _check(response):
+        if response.status_code == 429: raise RateLimited()
+        response.raise_for_status()
+        return response
+
+
+class RateLimited(Exception):
+    pass
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {"turns": 0, "errors": 0, "rate_limited": 0}
+        self.latencies, self.first_tokens = [], []
+        self.last_error = None
+
+    def record(self, kind, latency=None, first_token_s=None, error=None):
+        with self.lock:
+            self.counts[kind] += 1
+            if latency is not None: self.latencies.append(latency)
+            if first_token_s is not None: self.first_tokens.append(first_token_s)
+            if error is not None: self.last_error = error
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+
+
+def percentile(values, p):
+    if not values: return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_listening(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2): return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def run_devices(urls, devices, seconds, think_s):
+    stats = Stats()
+    deadline = time.monotonic() + seconds
+    threads = [Device(i, urls, deadline, stats, think_s) for i in range(devices)]
+    started = time.monotonic()
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    return stats, time.monotonic() - started
+
+
+def measure(mode, args):
+    upstream = StandinUpstream(rtt_s=args.rtt_ms / 1000, handshake_s=args.handshake_ms / 1000).start()
+    gateway = None
+    try:
+        if mode == "direct":
+            env = upstream.env()
+            urls = {"llm": env["GATEWAY_LLM_UPSTREAM"], "asr": env["GATEWAY_ASR_UPSTREAM"], "tts": env["GATEWAY_TTS_UPSTREAM"],
+                    "music_search": env["GATEWAY_MUSIC_SEARCH_UPSTREAM"], "music_song": env["GATEWAY_MUSIC_SONG_UPSTREAM"]}
+        else:
+            port = free_port()
+            # 网关按来源地址限流，压测中所有模拟设备都来自127.0.0.1，限流额度按设备数放大
+            env = {**os.environ, **upstream.env(), "GATEWAY_HOST": "127.0.0.1", "GATEWAY_PORT": str(port), "LOG_LEVEL": "WARNING",
+                   "GATEWAY_DEVICE_RATE_PER_S": str(args.device_rate * args.devices),
+                   "GATEWAY_DEVICE_BURST": str(args.device_burst * args.devices)}
+            gateway = subprocess.Popen([sys.executable, "gateway.py"], cwd=ROOT, env=env,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            if not wait_listening(port):
+                print(f"{mode:>8}: 网关没有启动"); return
+            time.sleep(1.0)   # 等待连接池预热
+            base = f"http://127.0.0.1:{port}"
+            urls = {"llm": f"{base}/llm/v1", "asr": f"{base}/asr", "tts": f"ws://127.0.0.1:{port}/tts/ws_binary",
+                    "music_search": f"{base}/music/search", "music_song": f"{base}/music/song/{{}}.mp3"}
+        connections_before = sum(upstream.connections.values())
+        cpu_before = cpu_seconds(gateway.pid) if gateway else 0.0
+
+        stats, elapsed = run_devices(urls, args.devices, args.seconds, args.think_ms / 1000)
+
+        line = (f"{mode:>8}: {args.devices}台设备 | {stats.counts['turns'] / elapsed:6.1f} 轮/秒 | "
+                f"每轮 p50 {percentile(stats.latencies, 0.5) * 1000:.0f}ms p95 {percentile(stats.latencies, 0.95) * 1000:.0f}ms | "
+                f"LLM首字 p50 {percentile(stats.first_tokens, 0.5) * 1000:.0f}ms | "
+                f"上游请求 {sum(upstream.requests.values())} (TTS {upstream.requests['tts']}, LLM {upstream.requests['llm']}, "
+                f"音乐 {upstream.requests['music_search'] + upstream.requests['music_url']}) | "
+                f"上游新建连接 {sum(upstream.connections.values()) - connections_before} | "
+                f"限流 {stats.counts['rate_limited']} | 失败 {stats.counts['errors']}")
+        print(line)
+        if gateway:
+            counters = requests.get(f"{base}/metrics", timeout=5).json()["counters"]
+            summary = {kind: f"命中{counters.get(f'gateway.{kind}.cache_hit', 0)}/合并{counters.get(f'gateway.{kind}.coalesced', 0)}"
+                       for kind in ("tts", "llm", "music_search", "music_url")}
+            cpu_pct = 100 * (cpu_seconds(gateway.pid) - cpu_before) / elapsed
+            print(f"{'':>8}  网关CPU {cpu_pct:.0f}% | " + ", ".join(f"{k} {v}" for k, v in summary.items()))
+        if stats.last_error: print(f"{'':>8}  最后一个错误: {stats.last_error!r}")
+    finally:
+        if gateway:
+            gateway.kill()
+            gateway.wait()
+        upstream.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", default="both", choices=("direct", "gateway", "both"))
+    parser.add_argument("--devices", type=int, default=40)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--think-ms", type=float, default=200, help="两轮对话之间的平均间隔")
+    parser.add_argument("--rtt-ms", type=float, default=30, help="到云端的网络往返延迟")
+    parser.add_argument("--handshake-ms", type=float, default=60, help="新建云端连接的额外握手(TLS)延迟")
+    parser.add_argument("--device-rate", type=float, default=50, help="网关对每台设备的限流速度（请求/秒）")
+    parser.add_argument("--device-burst", type=int, default=100)
+    args = parser.parse_args()
+    for mode in (("direct", "gateway") if args.mode == "both" else (args.mode,)):
+        measure(mode, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# bench_llm_client.py
+# 对比 openai SDK 和极简SSE客户端(lite)的导入耗时、内存占用(RSS)和每个token的CPU开销。
+# 每种客户端在独立的子进程中测量，替身服务器运行在父进程中，不计入子进程的CPU。
+# 运行方式（在项目根目录）: python test/bench_llm_client.py [token数量]
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from llm_standin_server import StandinLLMServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD_SCRIPT = r'''
+import json, resource, sys, time
+client_type, base_url, root_dir = sys.argv[1], sys.argv[2], sys.argv[3]
+sys.path.insert(0, root_dir)
+
+start = time.perf_counter()
+if client_type == "sdk":
+    from openai import OpenAI
+else:
+    from smart_speaker.services.llm_sse_client import SSEChatClient
+import_s = time.perf_counter() - start
+rss_after_import = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+messages = [{"role": "user", "content": "你好"}]
+if client_type == "sdk":
+    client = OpenAI(base_url=base_url, api_key="bench", max_retries=0)
+    def run():
+        count = 0
+        for chunk in client.chat.completions.create(model="bench", messages=messages, stream=True):
+            if chunk.choices and chunk.choices[0].delta.content is not None:
+                count += 1
+        return count
+else:
+    client = SSEChatClient(base_url, "bench")
+    def run():
+        return sum(1 for _ in client.stream_content("bench", messages))
+
+run()  # 预热：建立连接、完成各种惰性初始化
+cpu_start = time.process_time()
+tokens = run()
+cpu_s = time.process_time() - cpu_start
+print(json.dumps({
+    "import_ms": import_s * 1000,
+    "rss_import_kb": rss_after_import,
+    "rss_peak_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "tokens": tokens,
+    "cpu_us_per_token": cpu_s / tokens * 1e6,
+}))
+'''
+
+
+def bench(client_type, base_url):
+    result = subprocess.run([sys.executable, "-c", CHILD_SCRIPT, client_type, base_url, ROOT_DIR],
+                            capture_output=True, text=True, timeout=300)
+    if result.returncode != 0:
+        print(f"❌ {client_type} 测量失败: {result.stderr.strip()}")
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    token_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    server = StandinLLMServer("bench", tokens=["字"] * token_count, token_delay=0).start()
+    try:
+        rows = {client_type: bench(client_type, server.base_url) for client_type in ("sdk", "lite")}
+    finally:
+        server.stop()
+
+    print(f"\n{'客户端':<8}{'导入耗时(ms)':>14}{'导入后RSS(KB)':>16}{'峰值RSS(KB)':>14}{'CPU/token(us)':>16}")
+    for client_type, row in rows.items():
+        if not row: continue
+        print(f"{client_type:<10}{row['import_ms']:>14.1f}{row['rss_import_kb']:>16}{row['rss_peak_kb']:>14}{row['cpu_us_per_token']:>16.1f}")
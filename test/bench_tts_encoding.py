@@ -0,0 +1,142 @@
+# bench_tts_encoding.py
+# 对比TTS各输出编码(pcm / ogg_opus / mp3)在本机播放路径上的开销：
+#   - 每秒语音消耗的解码/播放CPU时间（子进程的用户态+内核态时间）；
+#   - 首个采样延迟：从写入第一个字节到解码器输出第一个PCM采样的时间（PCM无需解码，为0）；
+#   - 码率，用于和可用带宽比较。
+# 配置了 TTS_APPID/TTS_TOKEN 时用云端实际合成的语音测量，否则用ffmpeg把本地生成的测试音频编码成各格式。
+# 加 --save 会把结果写入 config.TTS_ENCODING_BENCH_FILE，TTS_ENCODING=auto 时据此协商编码。
+# 运行方式（在项目根目录）: python test/bench_tts_encoding.py [--save]
+import json
+import math
+import os
+import resource
+import shutil
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config
+
+SAMPLE_TEXT = "对呀，今天天气超好的啦，我们出去走走吧，顺便去吃个好吃的下午茶哦！"
+RATE = config.TTS_SAMPLE_RATE
+ENCODINGS = ("pcm", "ogg_opus", "mp3")
+FFMPEG_ENCODE_ARGS = {"ogg_opus": ["-c:a", "libopus", "-b:a", "24k", "-f", "ogg"],
+                      "mp3": ["-c:a", "libmp3lame", "-b:a", "32k", "-f", "mp3"]}
+FFMPEG_DECODE_FORMATS = {"ogg_opus": "ogg", "mp3": "mp3"}
+
+
+def child_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def make_speechlike_pcm(seconds=5.0):
+    """没有云端凭据时使用的测试音频：带音节包络的调频信号，比纯正弦波更接近语音的压缩难度"""
+    samples = []
+    for i in range(int(seconds * RATE)):
+        t = i / RATE
+        envelope = abs(math.sin(math.pi * 4 * t))
+        samples.append(int(9000 * envelope * math.sin(2 * math.pi * (180 + 60 * math.sin(2 * math.pi * 3 * t)) * t)))
+    return struct.pack(f"<{len(samples)}h", *samples)
+
+
+def synthesize_cloud(encoding):
+    from smart_speaker.services.tts_service import TTSService
+    started = time.monotonic()
+    first_byte_s = None
+    chunks = []
+    for chunk in TTSService(encoding).get_audio_stream(SAMPLE_TEXT):
+        if first_byte_s is None: first_byte_s = time.monotonic() - started
+        chunks.append(chunk)
+    return b"".join(chunks), first_byte_s
+
+
+def encode_locally(pcm, encoding):
+    if encoding == "pcm": return pcm
+    command = ["ffmpeg", "-loglevel", "error", "-f", "s16le", "-ar", str(RATE), "-ac", "1", "-i", "-"] + FFMPEG_ENCODE_ARGS[encoding] + ["-"]
+    return subprocess.run(command, input=pcm, capture_output=True, check=True).stdout
+
+
+def decode(encoding, data):
+    """用与ffplay相同的解码器把音频解码为PCM，返回 (PCM, 首个采样延迟, CPU秒)"""
+    if encoding == "pcm":
+        return data, 0.0, 0.0
+    command = ["ffmpeg", "-loglevel", "error", "-f", FFMPEG_DECODE_FORMATS[encoding], "-i", "-", "-f", "s16le", "-ar", str(RATE), "-ac", "1", "-"]
+    cpu_before = child_cpu_seconds()
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    started = time.monotonic()
+
+    def feed():
+        # 按4KB分块写入，模拟流式到达
+        for offset in range(0, len(data), 4096):
+            process.stdin.write(data[offset:offset + 4096])
+        process.stdin.close()
+
+    threading.Thread(target=feed, daemon=True).start()
+    first = process.stdout.read(2)
+    first_sample_s = time.monotonic() - started
+    pcm = first + process.stdout.read()
+    process.wait()
+    return pcm, first_sample_s, child_cpu_seconds() - cpu_before
+
+
+def play_cost(encoding, data):
+    """把音频交给实际的播放命令（输出到空设备），返回CPU秒；播放器不可用时返回None"""
+    from smart_speaker.audio_processing import _player_command
+    command, env = _player_command(encoding)
+    if not shutil.which(command[0]): return None
+    if command[0] == "aplay":
+        command = command[:2] + ["-D", "null"] + command[2:]
+    else:
+        env = dict(os.environ, SDL_AUDIODRIVER="dummy")
+    cpu_before = child_cpu_seconds()
+    subprocess.run(command, input=data, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env, timeout=60)
+    return child_cpu_seconds() - cpu_before
+
+
+def main():
+    use_cloud = bool(config.TTS_APPID and config.TTS_TOKEN)
+    has_ffmpeg = shutil.which("ffmpeg") is not None
+    print(f"音频来源: {'云端合成' if use_cloud else '本地测试音频'}")
+    reference_pcm = None if use_cloud else make_speechlike_pcm()
+
+    results = {}
+    for encoding in ENCODINGS:
+        if encoding != "pcm" and not has_ffmpeg:
+            print(f"{encoding:>9}: 缺少ffmpeg，跳过"); continue
+        try:
+            if use_cloud:
+                data, first_byte_s = synthesize_cloud(encoding)
+            else:
+                data, first_byte_s = encode_locally(reference_pcm, encoding), None
+            pcm, first_sample_s, decode_cpu = decode(encoding, data)
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"{encoding:>9}: 测量失败 ({e})"); continue
+        speech_s = len(pcm) / (RATE * 2)
+        if speech_s <= 0:
+            print(f"{encoding:>9}: 没有得到音频，跳过"); continue
+        player_cpu = play_cost(encoding, data)
+        results[encoding] = {
+            "speech_s": round(speech_s, 3),
+            "kbps": round(len(data) * 8 / speech_s / 1000, 1),
+            "first_sample_s": round(first_sample_s + (first_byte_s or 0.0), 4),
+            "cpu_per_speech_s": round((player_cpu if player_cpu is not None else decode_cpu) / speech_s, 5),
+            "decode_cpu_per_speech_s": round(decode_cpu / speech_s, 5),
+        }
+        r = results[encoding]
+        print(f"{encoding:>9}: {r['kbps']:6.1f}kbps | 首个采样 {r['first_sample_s'] * 1000:7.1f}ms | "
+              f"每秒语音CPU {r['cpu_per_speech_s'] * 1000:6.2f}ms (其中解码 {r['decode_cpu_per_speech_s'] * 1000:6.2f}ms)"
+              f"{'' if player_cpu is not None else ' [播放器不可用，仅解码]'}")
+
+    if "--save" in sys.argv and results:
+        os.makedirs(os.path.dirname(config.TTS_ENCODING_BENCH_FILE), exist_ok=True)
+        with open(config.TTS_ENCODING_BENCH_FILE, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"已保存到 {config.TTS_ENCODING_BENCH_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+# fleet_standin_upstream.py
+# 车队网关的本地替身上游：在本机模拟火山方舟(LLM SSE)、录音文件识别(ASR)、大模型TTS(WebSocket二进制协议)
+# 和网易云音乐(搜索、302跳转)。可注入网络往返延迟和新建连接的握手延迟（模拟TLS握手），
+# 并统计各接口的请求数和新建连接数，用于对比设备直连和经网关访问时云端实际承受的负载。
+# 单独运行（在项目根目录）: python test/fleet_standin_upstream.py，之后把 GATEWAY_*_UPSTREAM 指向打印出的地址
+import json
+import struct
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        pass   # 网关/设备退出时断开的长连接不算错误
+
+
+class StandinUpstream:
+    """
+    Args:
+        rtt_s (float): 每个请求（及每条新连接）额外的网络往返延迟。
+        handshake_s (float): 每条新建连接额外的握手延迟（TLS）。
+        token_delay_s (float): LLM逐字输出的间隔。
+        tts_chunks (int): 每句话返回的音频帧数；tts_chunk_delay_s 为帧间隔。
+    """
+    def __init__(self, rtt_s=0.03, handshake_s=0.06, token_delay_s=0.01, tts_chunks=4, tts_chunk_delay_s=0.02):
+        self.rtt_s = rtt_s
+        self.handshake_s = handshake_s
+        self.token_delay_s = token_delay_s
+        self.tts_chunks = tts_chunks
+        self.tts_chunk_delay_s = tts_chunk_delay_s
+        self.requests = Counter()
+        self.connections = Counter()
+        self._lock = threading.Lock()
+        self.httpd = None
+        self.ws_server = None
+
+    def _count(self, counter, key):
+        with self._lock:
+            counter[key] += 1
+
+    @property
+    def http_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    @property
+    def tts_url(self):
+        return f"ws://127.0.0.1:{self.ws_server.socket.getsockname()[1]}/api/v1/tts/ws_binary"
+
+    def env(self):
+        """把网关的上游指向本替身的环境变量"""
+        return {
+            "GATEWAY_LLM_UPSTREAM": f"{self.http_url}/api/v3",
+            "GATEWAY_ASR_UPSTREAM": f"{self.http_url}/api/v1/auc",
+            "GATEWAY_TTS_UPSTREAM": self.tts_url,
+            "GATEWAY_MUSIC_SEARCH_UPSTREAM": f"{self.http_url}/api/search/get/web",
+            "GATEWAY_MUSIC_SONG_UPSTREAM": f"{self.http_url}/song/media/outer/url?id={{}}.mp3",
+        }
+
+    def start(self):
+        self._start_http()
+        self._start_tts()
+        return self
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        if self.ws_server:
+            self.ws_server.shutdown()
+
+    # --- HTTP: LLM / ASR / 音乐 ---
+
+    def _start_http(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                upstream._count(upstream.connections, "http")
+                time.sleep(upstream.handshake_s + upstream.rtt_s)
+
+            def _send_json(self, data, status=200):
+                payload = json.dumps(data, ensure_ascii=False).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _write_chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+                time.sleep(upstream.rtt_s)
+                if url.path == "/api/search/get/web":
+                    upstream._count(upstream.requests, "music_search")
+                    name = parse_qs(url.query).get("s", [""])[0]
+                    song_id = sum(name.encode()) % 100000
+                    self._send_json({"code": 200, "result": {"songs": [
+                        {"id": song_id, "name": name, "fee": 8, "artists": [{"name": "替身歌手"}]}]}})
+                elif url.path == "/song/media/outer/url":
+                    upstream._count(upstream.requests, "music_url")
+                    song_id = parse_qs(url.query).get("id", ["0.mp3"])[0]
+                    self.send_response(302)
+                    self.send_header("Location", f"/cdn/{song_id}?sign={int(time.time())}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                url = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                time.sleep(upstream.rtt_s)
+                if url.path.endswith("/chat/completions"):
+                    upstream._count(upstream.requests, "llm")
+                    self._stream_llm(body)
+                elif url.path.endswith("/submit"):
+                    upstream._count(upstream.requests, "asr_submit")
+                    self._send_json({"resp": {"code": 1000, "id": f"task-{time.monotonic_ns()}"}})
+                elif url.path.endswith("/query"):
+                    upstream._count(upstream.requests, "asr_query")
+                    self._send_json({"resp": {"code": 1000, "text": "今天天气怎么样"}})
+                else:
+                    self._send_json({"error": "not found"}, 404)
+
+            def _stream_llm(self, body):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for i, token in enumerate(["好的，", "今天", "天气", "晴，", "适合", "出门。"]):
+                        if i: time.sleep(upstream.token_delay_s)
+                        event = {"id": "chatcmpl-standin", "object": "chat.completion.chunk", "created": 0,
+                                 "model": body.get("model", "standin"),
+                                 "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                        self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode())
+                    self._write_chunk(b"data: [DONE]\n\n")
+                    self._write_chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self.httpd = _QuietHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    # --- TTS: 二进制WebSocket协议，每条连接合成一句话 ---
+
+    def _start_tts(self):
+        from websockets.exceptions import ConnectionClosed
+        from websockets.sync.server import serve
+
+        def handler(connection):
+            self._count(self.connections, "tts")
+            time.sleep(self.handshake_s + self.rtt_s)
+            try:
+                message = connection.recv(timeout=10)
+            except Exception:
+                return
+            header_size = (message[0] & 0x0F) * 4
+            payload_size = struct.unpack(">I", message[header_size:header_size + 4])[0]
+            payload = json.loads(message[header_size + 4:header_size + 4 + payload_size])
+            self._count(self.requests, "tts")
+            text = payload["request"]["text"].encode()
+            time.sleep(self.rtt_s)
+            try:
+                for seq in range(1, self.tts_chunks + 1):
+                    last = seq == self.tts_chunks
+                    header = (1 << 28) | (1 << 24) | (0b1011 << 20) | ((0b0011 if last else 0b0001) << 16)
+                    audio = text * 200   # 约几KB的“音频”
+                    connection.send(struct.pack(">IiI", header, -seq if last else seq, len(audio)) + audio)
+                    if not last: time.sleep(self.tts_chunk_delay_s)
+            except ConnectionClosed:
+                pass   # 客户端中途取消合成
+
+        self.ws_server = serve(handler, "127.0.0.1", 0, compression=None)
+        threading.Thread(target=self.ws_server.serve_forever, daemon=True).start()
+
+
+if __name__ == "__main__":
+    upstream = StandinUpstream().start()
+    for key, value in upstream.env().items():
+        print(f'{key}="{value}"')
+    try:
+        while True:
+            time.sleep(10)
+            print(f"请求: {dict(upstream.requests)} | 新建连接: {dict(upstream.connections)}")
+    except KeyboardInterrupt:
+        upstream.stop()
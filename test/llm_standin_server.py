@@ -0,0 +1,77 @@
+# llm_standin_server.py
+# 一个本地的、兼容OpenAI协议的流式 chat/completions 替身服务器，可注入首字卡顿、逐字延迟和错误。
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StandinLLMServer:
+    def __init__(self, name, tokens=None, first_token_delay=0.0, token_delay=0.01, fail_status=None):
+        self.name = name
+        self.tokens = tokens or ["你好", "呀，", "我是", name, "。"]
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.fail_status = fail_status
+        self.requests = 0
+        self.aborted = 0
+        self.httpd = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _write_chunk(self, data):
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_POST(self):
+                server.requests += 1
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if server.fail_status:
+                    payload = json.dumps({"error": {"message": "injected failure"}}).encode()
+                    self.send_response(server.fail_status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    time.sleep(server.first_token_delay)
+                    for i, token in enumerate(server.tokens):
+                        if i: time.sleep(server.token_delay)
+                        event = {
+                            "id": "chatcmpl-standin", "object": "chat.completion.chunk", "created": 0,
+                            "model": body.get("model", server.name),
+                            "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                        }
+                        self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode())
+                    self._write_chunk(b"data: [DONE]\n\n")
+                    self._write_chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    server.aborted += 1
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
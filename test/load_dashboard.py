@@ -0,0 +1,163 @@
+# load_dashboard.py
+# 面板Web服务的并发压测：在子进程中启动Web服务（werkzeug 或 async 模式），以固定速率广播消息，
+# 同时用大量并发WebSocket客户端接收广播、定期请求 /metrics，统计服务进程的CPU、内存、线程数以及广播送达延迟。
+# 不需要声卡和云端凭据（不会启动音频和业务会话）。
+# 运行方式（在项目根目录）: python test/load_dashboard.py [--server async|werkzeug|both] [--clients 200] [--seconds 10] [--rate 20]
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def serve(mode, port, rate):
+    """子进程：启动Web服务，并以 rate 条/秒的速率广播带时间戳的消息（模拟LLM逐字回复）"""
+    os.environ["LOG_LEVEL"] = "WARNING"
+    import config
+    config.WEB_MAX_CONNECTIONS = 100000
+    import main
+    from smart_speaker.flask_utils import broadcast
+    from smart_speaker.async_server import AsyncWebServer
+
+    def broadcaster():
+        seq = 0
+        while True:
+            seq += 1
+            broadcast({"type": "ai_speech_chunk", "chunk": "对呀，今天天气超好的啦！", "seq": seq, "t": time.time()})
+            time.sleep(1 / rate)
+
+    threading.Thread(target=broadcaster, daemon=True).start()
+    print("READY", flush=True)
+    if mode == "async":
+        AsyncWebServer(main.app, main._attach_client, main._on_client_message, main._detach_client, "127.0.0.1", port).serve_forever()
+    else:
+        main.app.run(host="127.0.0.1", port=port, debug=False, use_reloader=False, threaded=True)
+
+
+def proc_stats(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    cpu_s = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+    status = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            status[key] = value.strip()
+    return cpu_s, int(status["VmRSS"].split()[0]) / 1024, int(status["Threads"])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_listening(port, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2): return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+async def run_clients(port, clients, seconds, pid, warmup_s=2.0):
+    """所有客户端先连上并预热 warmup_s 秒，再统计 seconds 秒的稳态数据"""
+    from websockets.asyncio.client import connect
+    latencies, received = [], [0]
+    stop = asyncio.Event()
+
+    async def client():
+        try:
+            async with connect(f"ws://127.0.0.1:{port}/ws", open_timeout=30, ping_interval=None) as ws:
+                while not stop.is_set():
+                    try:
+                        message = await asyncio.wait_for(ws.recv(), timeout=0.5)
+                    except asyncio.TimeoutError:
+                        continue
+                    data = json.loads(message)
+                    if "t" in data:
+                        received[0] += 1
+                        latencies.append(time.time() - data["t"])
+        except Exception:
+            pass
+
+    http_latencies = []
+
+    async def poll_metrics():
+        loop = asyncio.get_running_loop()
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                await loop.run_in_executor(None, lambda: urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read())
+                http_latencies.append(time.monotonic() - started)
+            except OSError:
+                pass
+            await asyncio.sleep(0.5)
+
+    tasks = [asyncio.create_task(client()) for _ in range(clients)] + [asyncio.create_task(poll_metrics())]
+    await asyncio.sleep(warmup_s)
+    received[0] = 0; latencies.clear(); http_latencies.clear()
+    cpu_before = proc_stats(pid)[0]
+    started = time.monotonic()
+    await asyncio.sleep(seconds)
+    cpu_after, rss_mb, threads = proc_stats(pid)
+    cpu_pct = 100 * (cpu_after - cpu_before) / (time.monotonic() - started)
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return received[0], latencies, http_latencies, (cpu_pct, rss_mb, threads)
+
+
+def percentile(values, p):
+    if not values: return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def measure(mode, clients, seconds, rate):
+    port = free_port()
+    child = subprocess.Popen([sys.executable, __file__, "--serve", mode, "--port", str(port), "--rate", str(rate)],
+                             cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        child.stdout.readline()
+        if not wait_listening(port):
+            print(f"{mode:>9}: 服务没有启动"); return
+        _, idle_rss, idle_threads = proc_stats(child.pid)
+        received, latencies, http, (cpu_pct, rss, threads) = asyncio.run(run_clients(port, clients, seconds, child.pid))
+        expected = clients * rate * seconds
+        print(f"{mode:>9}: {clients}个客户端 | CPU {cpu_pct:5.1f}% | "
+              f"内存 {idle_rss:.0f}->{rss:.0f}MB | 线程 {idle_threads}->{threads} | "
+              f"送达 {received}/{expected:.0f} | 广播延迟 p50 {percentile(latencies, 0.5) * 1000:.1f}ms p95 {percentile(latencies, 0.95) * 1000:.1f}ms | "
+              f"/metrics p95 {percentile(http, 0.95) * 1000:.1f}ms")
+    finally:
+        child.kill()
+        child.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", default="both", choices=("async", "werkzeug", "both"))
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--rate", type=float, default=20, help="每秒广播的消息数")
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.port, args.rate); return
+    for mode in (("werkzeug", "async") if args.server == "both" else (args.server,)):
+        measure(mode, args.clients, args.seconds, args.rate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# test_llm_gateway.py
+# 使用本地替身流式服务器验证LLM网关的首字截止、对冲、故障切换和取消。
+# 运行方式（在项目根目录）: python test/test_llm_gateway.py
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from llm_standin_server import StandinLLMServer
+from smart_speaker.services.llm_gateway import LLMEndpoint, LLMGateway, LLMGatewayError
+from smart_speaker.turn_scheduler import CancelToken
+
+MESSAGES = [{"role": "user", "content": "你好"}]
+
+
+class GatewayTester:
+    def __init__(self):
+        self.servers = []
+        self.failures = 0
+
+    def _endpoints(self, *servers):
+        self.servers.extend(servers)
+        return [LLMEndpoint(s.name, s.start().base_url, "standin-model", "test-key") for s in servers]
+
+    def _check(self, name, condition, detail=""):
+        print(f"{'✅ PASS' if condition else '❌ FAIL'}: {name} {detail}")
+        if not condition: self.failures += 1
+
+    def test_fast_primary_wins_without_hedge(self):
+        primary, backup = StandinLLMServer("primary"), StandinLLMServer("backup")
+        gateway = LLMGateway(self._endpoints(primary, backup), first_token_deadline_s=0.5, total_timeout_s=5)
+        text = "".join(gateway.stream(MESSAGES))
+        self._check("首选端点正常时直接使用", "primary" in text and backup.requests == 0, f"text='{text}'")
+
+    def test_stalled_primary_is_hedged(self):
+        primary = StandinLLMServer("primary", first_token_delay=5)
+        backup = StandinLLMServer("backup")
+        gateway = LLMGateway(self._endpoints(primary, backup), first_token_deadline_s=0.3, total_timeout_s=10)
+        start_time = time.monotonic()
+        text = "".join(gateway.stream(MESSAGES))
+        elapsed = time.monotonic() - start_time
+        self._check("首选端点卡顿时对冲到备用端点", "backup" in text and elapsed < 1.5, f"text='{text}', 耗时 {elapsed:.2f}s")
+        self._check("卡顿端点的EWMA被惩罚，下次排在后面", gateway.ranked_endpoints()[0].name == "backup")
+        time.sleep(0.2)
+        self._check("败者请求被取消（连接被关闭）", primary.requests == 1)
+
+    def test_failed_primary_fails_over_immediately(self):
+        primary = StandinLLMServer("primary", fail_status=500)
+        backup = StandinLLMServer("backup")
+        gateway = LLMGateway(self._endpoints(primary, backup), first_token_deadline_s=3, total_timeout_s=10)
+        start_time = time.monotonic()
+        text = "".join(gateway.stream(MESSAGES))
+        elapsed = time.monotonic() - start_time
+        self._check("首选端点报错时不等截止时间直接切换", "backup" in text and elapsed < 1.0, f"耗时 {elapsed:.2f}s")
+
+    def test_all_endpoints_fail(self):
+        gateway = LLMGateway(self._endpoints(StandinLLMServer("a", fail_status=503), StandinLLMServer("b", fail_status=503)),
+                             first_token_deadline_s=1, total_timeout_s=5)
+        try:
+            list(gateway.stream(MESSAGES))
+            self._check("所有端点失败时抛出LLMGatewayError", False)
+        except LLMGatewayError:
+            self._check("所有端点失败时抛出LLMGatewayError", True)
+
+    def test_cancel_during_stall(self):
+        primary = StandinLLMServer("primary", first_token_delay=5)
+        gateway = LLMGateway(self._endpoints(primary), first_token_deadline_s=1, total_timeout_s=10)
+        token = CancelToken()
+        start_time = time.monotonic()
+        threading.Timer(0.3, token.cancel).start()
+        pieces = list(gateway.stream(MESSAGES, token))
+        elapsed = time.monotonic() - start_time
+        self._check("轮次取消时立即返回", not pieces and elapsed < 1.0, f"耗时 {elapsed:.2f}s")
+
+    def test_slow_consumer_outlives_total_timeout(self):
+        # 调用方边读边播：读完整段回复的时间远超总超时，但片段之间没有卡顿，不应超时
+        primary = StandinLLMServer("primary")
+        gateway = LLMGateway(self._endpoints(primary), first_token_deadline_s=1, total_timeout_s=0.5, chunk_timeout_s=0.5)
+        token = CancelToken()
+        pieces = []
+        try:
+            for piece in gateway.stream(MESSAGES, token):
+                pieces.append(piece)
+                time.sleep(0.3)
+            ok = True
+        except LLMGatewayError:
+            ok = False
+        self._check("首字之后不受总超时限制", ok and "primary" in "".join(pieces), f"pieces={pieces}")
+        self._check("结束后移除轮次取消回调", not token._callbacks)
+
+    def run_test(self):
+        try:
+            for name in sorted(dir(self)):
+                if name.startswith("test_"):
+                    print(f"\n--- {name} ---")
+                    getattr(self, name)()
+        finally:
+            for server in self.servers: server.stop()
+        print("-" * 30)
+        print("测试结束。" if not self.failures else f"测试结束，{self.failures} 项失败。")
+        return self.failures == 0
+
+
+if __name__ == '__main__':
+    sys.exit(0 if GatewayTester().run_test() else 1)
@@ -0,0 +1,79 @@
+# test_skills.py
+# 验证本地技能的匹配规则只在整句话是技能问题时命中，不会抢走播放请求和普通闲聊。
+# 不需要声卡和云端凭据，音量用假的混音器代替。
+# 运行方式（在项目根目录）: python test/test_skills.py
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smart_speaker.skills import SkillRegistry, register_default_skills
+
+# 句子 -> 期望命中的技能（None 表示应交给意图/LLM处理）
+CASES = [
+    ("现在几点了？", "time"),
+    ("请问现在几点", "time"),
+    ("今天是几号", "date"),
+    ("今天星期几呀", "date"),
+    ("大声点", "volume"),
+    ("把声音调大一点", "volume"),
+    ("音量调到50", "volume"),
+    ("现在音量是多少", "volume"),
+    ("刚才放的是什么歌", "current_song"),
+    ("这是什么歌？", "current_song"),
+    ("播放大声唱", None),
+    ("播放现在几点的歌", None),
+    ("播放今天是什么日子", None),
+    ("帮我查一下今天是几号发生了什么大事", None),
+    ("播放声音调大", None),
+    ("我想听声音调大一点这首歌", None),
+    ("播放这是什么歌", None),
+    ("你会唱什么歌", None),
+]
+
+
+class FakeMixer:
+    def __init__(self):
+        self.volume = 50
+        self.changes = 0
+
+    def get_volume(self):
+        return self.volume
+
+    def set_volume(self, percent):
+        self.changes += 1
+        self.volume = max(0, min(100, percent))
+        return self.volume
+
+
+class FakeMusicPlayer:
+    current_song_name = None
+    last_song_name = "晴天"
+
+
+class SkillTester:
+    def __init__(self):
+        self.failures = 0
+
+    def _check(self, name, condition, detail=""):
+        print(f"{'✅ PASS' if condition else '❌ FAIL'}: {name} {detail}")
+        if not condition: self.failures += 1
+
+    def run_test(self):
+        print("开始测试本地技能匹配规则...")
+        for text, expected in CASES:
+            mixer = FakeMixer()
+            registry = SkillRegistry()
+            register_default_skills(registry, FakeMusicPlayer(), mixer)
+            result = registry.answer(text)
+            hit = result[0].name if result else None
+            self._check(f"'{text}'", hit == expected, f"期望 {expected}，实际 {hit}")
+            if expected != "volume":
+                self._check(f"'{text}' 不改变音量", mixer.changes == 0)
+        print("-" * 30)
+        print("测试结束。" if not self.failures else f"测试结束，{self.failures} 项失败。")
+        return self.failures == 0
+
+
+if __name__ == '__main__':
+    sys.exit(0 if SkillTester().run_test() else 1)